@@ -1,13 +1,39 @@
 import sqlite3
-import base64
 import secrets
-from ecdsa import SECP256k1
-from cryptography.fernet import Fernet
+from curve_params import P
 import os
 import json
 import time
 import random
-from concurrent.futures import ThreadPoolExecutor
+import sys
+import struct
+import queue
+import threading
+from array import array
+import metrics
+import scheduler
+from sqlite_pool import LOOKUP_ENTRY_SQL, close_pool, get_pool, readonly_connection
+from index_token import get_cipher
+from tenant_registry import DEFAULT_TABLE, TenantRegistry, load_registry_file
+import record_pool
+from ec_math import add_points, wnaf_digits, wnaf_multiply, multiply_pair
+from point_array import split_ranges
+from point_codec import SCALAR_SIZE, encode_scalar, decode_scalar
+import transport
+from transport import MSG_QUERY, MSG_SERVER_QUERY, MSG_DO_RESULT, TABLE_ENV, make_message, message_table
+
+T_POOL = 't_pool.bin'
+T_POOL_MAGIC = b'ETPL'
+T_POOL_VERSION = 1
+T_POOL_LOW_WATERMARK = 8  # 池中 t 值少于该值时在后台补充
+T_POOL_REFILL_TARGET = 64
+T_NAF_LENGTH = 257  # 256 位标量的 NAF 表示最多 257 位
+R_WINDOW = 5  # 常数 r 使用的 wNAF 窗口宽度
+R_VALUE = 86156499679442711534053242367151149324123977413554960226807478980590997969749  # DO 的常数 r
+PIPELINE_CHUNK = 256  # 流水线中每块 h_m 的点数
+PIPELINE_DEPTH = 4  # 正在计算或等待写入的块数上限
+# t 值池文件头: magic, 版本, NAF 长度
+_T_POOL_HEADER = struct.Struct('>4sBH')
 
 
 def check_and_remove_db(db_name):
@@ -20,26 +46,31 @@ def fetch_data_pk(conn):
     """ 从 data_pk 表中获取加密数据值 """
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM data_pk')
-    return cursor.fetchall()
+    rows = cursor.fetchall()
+    metrics.count('sql_rows_read', len(rows))
+    return rows
 
 
 def fetch_h_m_values(conn):
     """ 从 h_m 表中获取所有值 """
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM h_m')
-    return cursor.fetchall()
+    rows = cursor.fetchall()
+    metrics.count('sql_rows_read', len(rows))
+    return rows
 
 
 def fetch_look_table_entry(conn, num):
     """ 根据 num 从 look_table 中查找对应的记录 """
     cursor = conn.cursor()
-    cursor.execute('SELECT b, b_index FROM look_table WHERE id = ?', (num,))
-    return cursor.fetchone()
+    cursor.execute(LOOKUP_ENTRY_SQL, (num,))
+    row = cursor.fetchone()
+    metrics.count('sql_rows_read', 1 if row else 0)
+    return row
 
 
 def generate_random_value(probability=0):
-    curve = SECP256k1.curve
-    p = curve.p()  # 获取有限域的素数 p
+    p = P  # 获取有限域的素数 p
     p_length = len(str(p))  # p 的位数
 
     # 根据概率决定是否生成一个较小的随机值
@@ -55,49 +86,242 @@ def generate_random_value(probability=0):
         return secrets.randbelow(p)
 
 
-def mod_inverse(k, p):
-    """ 计算 k 在模 p 下的逆 """
-    return pow(k, p - 2, p)
+def precompute_t_value():
+    """ 生成一个新的随机值 t 及其 NAF 表示 (低位在前) """
+    t = generate_random_value()
+    return t, wnaf_digits(t, 2)
 
 
-def add_points(h1, h2):
-    """ 添加两个椭圆曲线点 """
-    x1, y1 = h1
-    x2, y2 = h2
-    p = SECP256k1.curve.p()
-    a = SECP256k1.curve.a()
+def t_value_pool(pool_name):
+    """ t 值池: 每条记录为 t||NAF(t), NAF 补零到 T_NAF_LENGTH 位 """
+    header = _T_POOL_HEADER.pack(T_POOL_MAGIC, T_POOL_VERSION, T_NAF_LENGTH)
+    return record_pool.RecordPool(pool_name, header, SCALAR_SIZE + T_NAF_LENGTH)
+
 
-    if h1 == h2:  # 加倍情况
-        m = (3 * x1 ** 2 + a) * mod_inverse(2 * y1, p) % p
-    else:  # 加法情况
-        m = (y2 - y1) * mod_inverse(x2 - x1, p) % p
-
-    x3 = (m ** 2 - x1 - x2) % p
-    y3 = (m * (x1 - x3) - y1) % p
-
-    return (x3, y3)
-
-
-def scalar_multiply(k, h):
-    """ 对椭圆曲线点进行标量乘法 """
-    if k == 0:
-        return None
-    if k == 1:
-        return h
-
-    R = None
-    H = h
+def encode_t_value():
+    """ 生成一个新的 t 值, 编码为 t 值池中的一条记录 """
+    t, digits = precompute_t_value()
+    digits.extend([0] * (T_NAF_LENGTH - len(digits)))
+    return encode_scalar(t) + digits.tobytes()
+
+
+def count_t_values(pool_name):
+    """ 返回 t 值池中可用的 t 值数量 """
+    return t_value_pool(pool_name).count()
+
+
+def refill_t_pool(pool_name, target):
+    """ 补充 t 值池直到有 target 个 t 值 """
+    return t_value_pool(pool_name).refill(target, encode_t_value)
+
+
+def pop_t_value(pool_name):
+    """ 从池尾取出一个 (t, NAF(t)), 返回 ((t, digits), 剩余数量); 池为空时为 None """
+    record, remaining = t_value_pool(pool_name).pop()
+    if record is None:
+        return None, remaining
+    digits = array('b')
+    digits.frombytes(record[SCALAR_SIZE:])
+    return (decode_scalar(record), digits), remaining
+
+
+def refill_in_background(target, pool_name=T_POOL):
+    """ 启动一个独立进程补充 t 值池; 已有补充进程在运行时不再启动 """
+    return record_pool.refill_in_background(__file__, 'refill', pool_name, target)
+
+
+def rerandomize_target(r_naf, t_naf, point):
+    """ 目标位置: 共享倍点链同时算出 r·P 与 t·P, 再由 r·P + t·P 得到 (r+t)·P """
+    r_point, t_point = multiply_pair(r_naf, t_naf, point)
+    return add_points(r_point, t_point), t_point
+
+
+def take_t_value(pool_name=T_POOL):
+    """ 从池中取出预计算好的随机值 t 及其 NAF 表示, 池为空时现场生成;
+    池快用完或池文件还不存在时在后台补充 """
+    t_entry, remaining = pop_t_value(pool_name)
+    if t_entry is None:
+        t_entry = precompute_t_value()
+    if record_pool.needs_refill(remaining, T_POOL_LOW_WATERMARK):
+        refill_in_background(T_POOL_REFILL_TARGET, pool_name)
+    return t_entry
+
+
+def rerandomize_cost(num_points):
+    """ 估计重随机化 num_points 个点的耗时 """
+    return scheduler.estimate_cost(num_points, R_VALUE.bit_length(), window=R_WINDOW)
+
+
+def rerandomize_query(h_m_points, b_index, r_wnaf, r_naf, t_naf):
+    """ 普通位置计算 r·P, 第 b_index 个位置计算 (r+t)·P; 返回 (query 点列表, t·P) """
+    results = []
+    result_t = None
+    # 由 scheduler 按批大小决定直接计算还是分块交给常驻进程池
+    cost = rerandomize_cost(len(h_m_points))
+    args = [(start, h_m_points[start:stop], b_index, r_wnaf, r_naf, t_naf)
+            for start, stop in split_ranges(len(h_m_points), scheduler.plan_parts(cost))]
+    with metrics.span('scalar_mult_batch'):
+        for chunk_results, chunk_t in scheduler.run_tasks(rerandomize_chunk, args, cost):
+            results.extend(chunk_results)
+            if chunk_t is not None:
+                result_t = chunk_t
+    return results, result_t
+
+
+def read_h_m_chunks(conn, chunk_size=PIPELINE_CHUNK):
+    """ 按 id 分页读取 h_m, 逐块产生 (起始下标, 点列表); 每块是一条独立的短查询, 不会一直持有读锁 """
+    last_id = 0
+    start = 0
+    while True:
+        rows = conn.execute('SELECT id, x_result, y_result FROM h_m WHERE id > ? ORDER BY id LIMIT ?',
+                            (last_id, chunk_size)).fetchall()
+        if not rows:
+            return
+        metrics.count('sql_rows_read', len(rows))
+        last_id = rows[-1][0]
+        yield start, [(int(x_result), int(y_result)) for _, x_result, y_result in rows]
+        start += len(rows)
+
+
+def rerandomize_chunk(start, points, b_index, r_wnaf, r_naf, t_naf):
+    """ 重随机化一块 h_m 点 (第一个点的下标为 start + 1); 返回 (query 点列表, t·P, 目标不在本块时为 None) """
+    results = []
+    result_t = None
+    for i, point in enumerate(points, start + 1):
+        if i == b_index:
+            result, result_t = rerandomize_target(r_naf, t_naf, point)
+        else:
+            result = wnaf_multiply(r_wnaf, point, R_WINDOW)
+        if result is not None:
+            results.append(result)
+    return results, result_t
+
+
+def query_writer(db_name, write_queue, errors):
+    """ 写入线程: 按提交顺序取出各块的计算结果, 写入 query 表后立即提交 """
+    conn = sqlite3.connect(db_name)
+    try:
+        while True:
+            future = write_queue.get()
+            if future is None:
+                break
+            if errors:
+                continue  # 出错后只取出剩余的块, 避免读取端阻塞
+            try:
+                results, _ = future.result()
+                with metrics.span('db_write'), conn:
+                    insert_results_to_db(conn.cursor(), results)
+            except Exception as e:
+                errors.append(e)
+    finally:
+        conn.close()
+
+
+def rerandomize_pipeline(conn_h_m, h_m_db_name, b_index, r_wnaf, r_naf, t_naf, executor,
+                         chunk_size=PIPELINE_CHUNK, depth=PIPELINE_DEPTH):
+    """ 读取 h_m -> 线程池重随机化 -> 写入 query 三段流水线, 队列有界, 内存占用与 h_m 大小无关; 返回 t·P """
+    write_queue = queue.Queue(maxsize=depth)
+    errors = []
+    writer = threading.Thread(target=query_writer, args=(h_m_db_name, write_queue, errors))
+    writer.start()
+    target_future = None
+    try:
+        with metrics.span('scalar_mult_batch'):
+            for start, points in read_h_m_chunks(conn_h_m, chunk_size):
+                future = executor.submit(rerandomize_chunk, start, points, b_index, r_wnaf, r_naf, t_naf)
+                if start < b_index <= start + len(points):
+                    target_future = future
+                write_queue.put(future)  # 写入端落后时阻塞, 形成背压
+    finally:
+        write_queue.put(None)
+        writer.join()
+    if errors:
+        raise errors[0]
+    return target_future.result()[1] if target_future is not None else None
+
+
+def create_query_table(conn):
+    """ 重新创建 query 表; 第 k 个查询 (从 0 开始) 的 N 个点占 id kN+1..(k+1)N, N 为 h_m 的行数 """
+    with conn:
+        conn.execute('DROP TABLE IF EXISTS query')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS query (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                x_result TEXT,
+                y_result TEXT
+            )
+        ''')
 
-    while k > 0:
-        if k % 2 == 1:
-            if R is None:
-                R = H
-            else:
-                R = add_points(R, H)
-        H = add_points(H, H)
-        k //= 2
 
-    return R
+def answer_query(message, conn_look_table, cipher_suite, bucket_cipher, r_wnaf, r_naf, table=None, t_entry=None):
+    """ 处理 client 的查询消息, 返回 (发给 server 的消息, 发给 client 的消息);
+    table 为 conn_look_table 对应的 look table 名称, 默认取 EAPIR_TABLE. 桶号只在这张表中有意义,
+    查询指定了别的表时拒绝, 不能把本表的桶号转发给 server 上的另一张表.
+    t_entry 为调用方取好的 (t, NAF(t)), 默认从 t 值池中取 """
+    if table is None:
+        table = os.environ.get(TABLE_ENV)
+    requested = message_table(message)
+    if requested is not None and requested != table:
+        raise ValueError(f"Look table {requested!r} is not served by this DO")
+    with metrics.span('decrypt'):
+        num = cipher_suite.decrypt_one(message.tokens[0])
+    with metrics.span('lookup'):
+        look_table_entry = fetch_look_table_entry(conn_look_table, num)
+    if look_table_entry is None:
+        raise ValueError(f"Index {num} is not in the look table")
+    b, b_index = look_table_entry
+    t, t_naf = t_entry if t_entry is not None else take_t_value()
+    query_points, result_t = rerandomize_query(message.points, b_index, r_wnaf, r_naf, t_naf)
+    with metrics.span('encrypt'):
+        encrypted_bucket = bucket_cipher.encrypt([b])
+    tokens = [encrypted_bucket]
+    # 转发桶号所在的 look table 名称, server 按名称路由到同一张表
+    if table:
+        tokens.append(table.encode())
+    return (make_message(MSG_SERVER_QUERY, message.query_id, tokens, query_points),
+            make_message(MSG_DO_RESULT, message.query_id, points=[result_t]))
+
+
+def answer_tenant_query(message, registry, cipher_suite, r_wnaf, r_naf):
+    """ 多 look table 模式: 在查询指定的表 (按需加载) 中确定桶号, 用该表的 key_bucket 加密后转发 """
+    name = message_table(message, DEFAULT_TABLE)
+    with registry.use(name) as tenant:
+        return answer_query(message, tenant.pool.connection(), cipher_suite, tenant.cipher_suite, r_wnaf, r_naf,
+                            name)
+
+
+def serve(mailbox, router, look_table_db_name='look_table.db', registry=None):
+    """ 消息模式: 从信箱中接收查询, 将结果分别发给 server 和 client, 信箱关闭时返回;
+    给出 registry 时按查询中的名称在对应的 look table 中确定桶号, 与 server 的 registry 使用同一份配置 """
+    cipher_suite = get_cipher('key')
+    r_wnaf = wnaf_digits(R_VALUE, R_WINDOW)
+    r_naf = wnaf_digits(R_VALUE, 2)
+    if registry is None:
+        bucket_cipher = get_cipher('key_bucket')
+        # look_table 建表后不再修改, 使用只读连接池, 每个线程一个连接
+        pool = get_pool(look_table_db_name)
+    try:
+        while True:
+            message = mailbox.recv()
+            if message is None:
+                break
+            if message.kind != MSG_QUERY:
+                continue
+            try:
+                if registry is not None:
+                    server_message, client_message = answer_tenant_query(message, registry, cipher_suite,
+                                                                         r_wnaf, r_naf)
+                else:
+                    server_message, client_message = answer_query(
+                        message, pool.connection(), cipher_suite, bucket_cipher, r_wnaf, r_naf)
+                router.send('server', server_message)
+                router.send('client', client_message)
+            except Exception as e:
+                print(f"Query {message.query_id} failed: {e}")
+    finally:
+        # 各工作线程的连接都在池中, 退出时一起关闭; registry 的连接池由 registry.close() 关闭
+        if registry is None:
+            close_pool(look_table_db_name)
 
 
 def insert_results_to_db(cursor, results):
@@ -105,40 +329,71 @@ def insert_results_to_db(cursor, results):
     # 将结果转换为字符串形式以避免 OverflowError
     string_results = [(str(x_result), str(y_result)) for x_result, y_result in results]
     cursor.executemany('INSERT INTO query (x_result, y_result) VALUES (?, ?)', string_results)
+    metrics.count('bytes_serialized', sum(len(x) + len(y) for x, y in string_results))
 
 
 def insert_encrypted_data_to_db(cursor, encrypted_data):
-    """ 将加密的数据插入到 do_pk 表中 """
-    cursor.execute('INSERT INTO do_pk (encrypted_data) VALUES (?)', (encrypted_data.decode(),))
+    """ 将加密的数据 (二进制令牌) 插入到 do_pk 表中 """
+    cursor.execute('INSERT INTO do_pk (encrypted_data) VALUES (?)', (encrypted_data,))
 
 
 def save_result_to_json(data, filename='results.json'):
     """ 将计算结果保存到 JSON 文件中 """
+    text = json.dumps(data, indent=4)
     with open(filename, 'w') as json_file:
-        json.dump(data, json_file, indent=4)
+        json_file.write(text)
+    metrics.count('bytes_serialized', len(text))
 
 def fetch_data_from_db(h_m_db_name):
     """ 从数据库中获取数据并计算通信量 """
     conn = sqlite3.connect(h_m_db_name)
     cursor = conn.cursor()
 
-    cursor.execute('SELECT id,x_result,y_result FROM h_m')  # 查询数据
-    rows = cursor.fetchall()  # 获取所有行
-
-    # 计算获取的数据大小，跳过包含 None 的行
-    total_size = sum(
-        len(str(row[0])) + len(str(row[1])) + len(str(row[2]))
-        for row in rows if row[0] is not None and row[1] is not None and row[2] is not None
-    )  # 总字节数
+    # 在 SQLite 中计算数据大小, 不把整张表读进内存; 包含 NULL 的行不计入
+    cursor.execute('SELECT SUM(LENGTH(id) + LENGTH(x_result) + LENGTH(y_result)) FROM h_m')
+    total_size = cursor.fetchone()[0] or 0
     conn.close()
 
     return total_size
 
 def main():
+    # 补充 t 值池: python DO.py refill [数量] [池文件]
+    if len(sys.argv) > 1 and sys.argv[1] == 'refill':
+        target = int(sys.argv[2]) if len(sys.argv) > 2 else T_POOL_REFILL_TARGET
+        pool_name = sys.argv[3] if len(sys.argv) > 3 else T_POOL
+        added = refill_t_pool(pool_name, target)
+        print(f"Precomputed {added} t values, pool size: {count_t_values(pool_name)}")
+        return
+
+    # 消息模式: python DO.py serve [tables.json], 在本地 socket 上接收查询;
+    # 给出 tables.json (与 server 相同的配置) 时按查询中的名称使用对应的 look table
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        registry = None
+        if len(sys.argv) > 2:
+            registry = TenantRegistry(load_registry_file(sys.argv[2]))
+            print(f"Serving look tables: {', '.join(registry.names())}")
+        mailbox = transport.listen('do')
+        router = transport.Router()
+        print(f"DO listening on {mailbox.address}")
+        try:
+            serve(mailbox, router, registry=registry)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            mailbox.close()
+            router.close()
+            if registry is not None:
+                registry.close()
+            metrics.emit('do')
+        return
+
     check_and_remove_db('query.db')
 
-    r = 86156499679442711534053242367151149324123977413554960226807478980590997969749
+    r = R_VALUE
     print(f"Constant value r: {r}")
+    # r 为常数, 其 wNAF / NAF 表示只需计算一次
+    r_wnaf = wnaf_digits(r, R_WINDOW)
+    r_naf = wnaf_digits(r, 2)
 
     h_m_db_name = 'h_m.db'
     look_table_db_name = 'look_table.db'
@@ -147,108 +402,80 @@ def main():
     print(f"查询client通信：{total_size}")
     # 连接数据库
     conn_h_m = sqlite3.connect(h_m_db_name)
-    conn_look_table = sqlite3.connect(look_table_db_name)
+    conn_look_table = readonly_connection(look_table_db_name)
 
     start = time.time()
 
-    # 加载密钥并解密数据
-    with open("key", "rb") as key_file:
-        key = key_file.read()
-    cipher_suite = Fernet(key)
+    # 加载密钥, 每个密钥只构造一次 cipher
+    cipher_suite = get_cipher('key')
+    bucket_cipher = get_cipher('key_bucket')
 
     data_pk_values = fetch_data_pk(conn_h_m)
 
     results_for_json = []  # 用于保存结果以存入 JSON 文件
-    results_to_insert = []  # 用于批量插入数据库
-
+    # query 表由流水线的写入线程逐块写入
+    create_query_table(conn_h_m)
+    # 按每块的大小选择执行器; 线程池/进程池常驻, 多次查询之间复用
+    num_h_m = conn_h_m.execute('SELECT COUNT(*) FROM h_m').fetchone()[0]
+    executor = scheduler.executor_for(rerandomize_cost(min(num_h_m, PIPELINE_CHUNK)))
+
+    # 所有查询的桶号, 最后加密成一个令牌发给 server; 第 k 个桶号对应 query 表的第 k 块和 results.json 的第 k 项
+    buckets = []
     for row in data_pk_values:
-        encrypted_data = row[1]
-        encrypted_data_bytes = base64.urlsafe_b64decode(encrypted_data)
-
         try:
-            decrypted_data = cipher_suite.decrypt(encrypted_data_bytes)
-            num = int(decrypted_data.decode())
-            look_table_entry = fetch_look_table_entry(conn_look_table, num)
-
-            if look_table_entry:
-                b, b_index = look_table_entry
-                print(f"b: {b}, b_index: {b_index}")
-
-                # 生成椭圆曲线上的随机值 t
-                t = generate_random_value()
-                print(f"Random value t: {t}")
-
-                sum_value = r + t
-                h_m_values = fetch_h_m_values(conn_h_m)
-
-                # 使用线程池来并行处理标量乘法
-                with ThreadPoolExecutor(max_workers=8) as executor:
-                    future_results = []
-                    for i, row in enumerate(h_m_values):
-                        x_result = int(row[1])
-                        y_result = int(row[2])
-
-                        if i + 1 == b_index:
-                            future_results.append(executor.submit(scalar_multiply, sum_value, (x_result, y_result)))
-                            result_t_future = executor.submit(scalar_multiply, t, (x_result, y_result))
-                        else:
-                            future_results.append(executor.submit(scalar_multiply, r, (x_result, y_result)))
-
-                    for future in future_results:
-                        result = future.result()
-                        if result is not None:
-                            results_to_insert.append(result)
+            # client 的令牌可以携带一批下标
+            with metrics.span('decrypt'):
+                nums = cipher_suite.decrypt(row[1])
+            for num in nums:
+                with metrics.span('lookup'):
+                    look_table_entry = fetch_look_table_entry(conn_look_table, num)
+
+                if look_table_entry:
+                    b, b_index = look_table_entry
+                    print(f"b: {b}, b_index: {b_index}")
+
+                    t, t_naf = take_t_value()
+                    print(f"Random value t: {t}")
+
+                    # 流水线: 分块读取 h_m, 线程池重随机化, 写入线程逐块提交 query
+                    result_t = rerandomize_pipeline(conn_h_m, h_m_db_name, b_index, r_wnaf, r_naf, t_naf, executor)
 
                     # 处理 result_t
-                    result_t = result_t_future.result()
                     results_for_json.append({"result_with_t": result_t})
+                    buckets.append(b)
 
         except Exception as e:
             print(f"Decryption failed: {e}")
 
-        # 对server加密部分
-        with open("key_bucket", "rb") as key_file:
-            key_1 = key_file.read()
-        cipher_suite = Fernet(key_1)
+    # 对server加密部分: 整批桶号只有一个令牌
+    with metrics.span('encrypt'):
+        encrypted_data = bucket_cipher.encrypt(buckets)
 
-        # 加密数据并插入数据库
-        num = b  # 获取用户输入的整数
-        data = str(num).encode()
-        encrypted_data = cipher_suite.encrypt(data)
-
-        # 计算耗时
-        elapsed_time = (time.time() - start) * 1000
-
-    # 批量插入结果
-    with conn_h_m:
-        cursor = conn_h_m.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS query (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                x_result TEXT,
-                y_result TEXT
-            )
-        ''')
-        insert_results_to_db(cursor, results_to_insert)
+    # 计算耗时
+    elapsed_time = (time.time() - start) * 1000
 
     # 保存 JSON 文件
-    save_result_to_json(results_for_json)
+    with metrics.span('db_write'):
+        save_result_to_json(results_for_json)
 
     # 将加密后的数据存入 do_pk 表
-    with conn_h_m:
+    with metrics.span('db_write'), conn_h_m:
         cursor = conn_h_m.cursor()
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS do_pk (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                encrypted_data TEXT
+                encrypted_data BLOB
             )
         ''')
+        # 令牌与本次写入的 query 表一一对应, 旧的令牌作废
+        cursor.execute('DELETE FROM do_pk')
         insert_encrypted_data_to_db(cursor, encrypted_data)
 
     print(f"Time taken for computation (excluding file I/O): {elapsed_time:.4f} seconds")
     # 关闭数据库连接
     conn_h_m.close()
-    conn_look_table.close()
+    close_pool(look_table_db_name)
+    metrics.emit('do')
 
 
 
@@ -0,0 +1,159 @@
+import argparse
+import asyncio
+import itertools
+import time
+import metrics
+import scheduler
+import transport
+import client_me
+from client_me import QUERY_TOKEN_POOL
+from con_me import verify_result
+from curve_params import P, A
+from index_token import get_cipher
+from transport import MSG_DO_RESULT, MSG_SERVER_RESULT
+
+DEFAULT_IN_FLIGHT = 64  # 同时在途的查询数上限
+DEFAULT_TIMEOUT = 300  # 单个查询等待两条回复的秒数
+
+
+class AsyncClient:
+    """ 基于 asyncio 的流水线 client: 多个查询同时在途, 每个查询使用自己的 m;
+    令牌生成和结果验证中的标量乘法交给 scheduler 的常驻执行器, 不阻塞事件循环 """
+
+    def __init__(self, db_name='look_table.db', max_in_flight=DEFAULT_IN_FLIGHT, timeout=DEFAULT_TIMEOUT, table=None):
+        self.db_name = db_name
+        self.timeout = timeout
+        self.table = table
+        self.h_points, self.digests = client_me.load_startup_state(db_name)
+        self.cipher_suite = get_cipher('key')
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._query_ids = itertools.count(1)
+        self._pending = {}  # 查询 id -> [total_result, t·P, 收到的回复数, Future]
+        self._listener = None
+        self._writer = None
+        self._send_lock = asyncio.Lock()
+        # 估计耗时决定令牌生成 / 验证在当前线程, 线程池还是进程池中执行
+        self._token_cost = scheduler.estimate_cost(len(self.h_points))
+        self._verify_cost = scheduler.estimate_cost(sum(digest is not None for digest in self.digests))
+
+    async def start(self):
+        """ 在 client 地址上监听回复, 并连接到 DO """
+        self._listener = await transport.start_listener_async(transport.role_address('client'), self._on_message)
+        _, self._writer = await transport.open_connection_async(transport.role_address('do'))
+        return self
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._writer = None
+        if self._listener is not None:
+            self._listener.close()
+            await self._listener.wait_closed()
+            self._listener = None
+        for entry in self._pending.values():
+            if not entry[3].done():
+                entry[3].cancel()
+        self._pending.clear()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _on_message(self, message):
+        """ 按查询 id 收集 server 和 DO 的回复, 两条都到达后完成该查询的 Future """
+        entry = self._pending.get(message.query_id)
+        if entry is None:
+            return  # 已超时或不是本 client 发出的查询
+        if message.kind == MSG_SERVER_RESULT:
+            entry[0] = message.points[0]
+        elif message.kind == MSG_DO_RESULT:
+            entry[1] = message.points[0]
+        else:
+            return
+        entry[2] += 1
+        if entry[2] == 2 and not entry[3].done():
+            entry[3].set_result((entry[0], entry[1]))
+
+    async def _offload(self, cost, func, *args):
+        """ 在 scheduler 选择的执行器中运行 func(*args) 并等待结果 """
+        return await asyncio.wrap_future(scheduler.executor_for(cost).submit(func, *args))
+
+    async def next_token(self):
+        """ 优先从令牌池中取出预计算的 (m, {m·h_i}), 池为空时在执行器中生成 """
+        with metrics.span('token_pop'):
+            token = await asyncio.to_thread(client_me.take_query_token, QUERY_TOKEN_POOL, self.h_points)
+        if token is None:
+            token = await self._offload(self._token_cost, client_me.generate_query_token, self.h_points, A, P)
+        return token
+
+    async def query(self, index):
+        """ 发出一次查询并验证结果, 返回查询到的值 (0/1), 无法验证时返回 None """
+        async with self._in_flight:
+            query_id = next(self._query_ids)
+            token = await self.next_token()
+            m, message = client_me.build_query(self.h_points, self.cipher_suite, index, query_id, token, self.table)
+            future = asyncio.get_running_loop().create_future()
+            self._pending[query_id] = [None, None, 0, future]
+            try:
+                frame = transport.encode_frame(message)
+                async with self._send_lock:
+                    self._writer.write(frame)
+                    await self._writer.drain()
+                total_result, result_t = await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Query {query_id} (index {index}) timed out") from None
+            finally:
+                del self._pending[query_id]
+        # 验证不占用在途名额, 下一个查询可以立即发出
+        with metrics.span('verify'):
+            return await self._offload(self._verify_cost, verify_result, m, total_result, result_t, self.digests)
+
+    async def query_many(self, indices):
+        """ 并发发出一批查询, 按 indices 的顺序返回结果; 失败的查询返回对应的异常对象 """
+        return await asyncio.gather(*(self.query(index) for index in indices), return_exceptions=True)
+
+
+async def run_queries(indices, db_name='look_table.db', max_in_flight=DEFAULT_IN_FLIGHT, timeout=DEFAULT_TIMEOUT,
+                      table=None):
+    """ 建立连接, 发出所有查询后关闭, 返回结果列表 """
+    async with AsyncClient(db_name, max_in_flight, timeout, table) as client:
+        return await client.query_many(indices)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pipelined asyncio client: keep many queries in flight "
+                                                 "against running DO / server services")
+    parser.add_argument('indices', nargs='+', type=int, help="indices to query")
+    parser.add_argument('--repeat', type=int, default=1, help="query the list of indices this many times")
+    parser.add_argument('--in-flight', type=int, default=DEFAULT_IN_FLIGHT, help="maximum queries in flight")
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help="seconds to wait for each query")
+    parser.add_argument('--table', help="look table name (default: EAPIR_TABLE)")
+    parser.add_argument('--db', default='look_table.db')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    indices = args.indices * args.repeat
+    start = time.perf_counter()
+    try:
+        results = asyncio.run(run_queries(indices, args.db, args.in_flight, args.timeout, args.table))
+    finally:
+        metrics.emit('client')
+    elapsed = time.perf_counter() - start
+    failed = 0
+    for index, x in zip(indices, results):
+        if isinstance(x, BaseException):
+            failed += 1
+            print(f"Query {index} failed: {x}")
+        else:
+            print(f"Query {index}: x={x}")
+    print(f"{len(indices) - failed} of {len(indices)} queries in {elapsed:.3f} s "
+          f"({len(indices) / elapsed:.2f} queries/s)")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
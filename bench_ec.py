@@ -0,0 +1,289 @@
+import argparse
+import importlib
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from ecdsa import SECP256k1
+from ecdsa.ellipticcurve import PointJacobi
+from ecdsa.numbertheory import inverse_mod
+import metrics
+import ec_math
+from curve_params import N
+from ec_math import P, A, wnaf_digits, wnaf_multiply, multi_scalar_multiply, batch_mod_inverse
+from point_codec import encode_point, decode_point, compress_point, decompress_point
+
+DEFAULT_BASELINE = 'bench_baseline.json'
+BATCH_SIZE = 16  # 固定标量批量乘法的点数
+INVERSE_SIZE = 64  # 批量求逆的元素个数
+MSM_SIZES = (4, 16, 64)
+MSM_BITS = 64  # MSM 标量的位数, 与数据库中的 value 相当
+CASES = ('add', 'double', 'mul', 'batch_mul', 'msm', 'batch_inverse', 'encode', 'decode', 'compress', 'decompress')
+
+
+def _tuple_backend(module_name, mul_style=None):
+    """ 仓库中各脚本自带的一份点运算实现, 参数传递方式各不相同, 在这里统一成 add(h1, h2) / mul(k, h) """
+    module = importlib.import_module(module_name)
+    a, p = A, P
+    add = lambda h1, h2: module.add_points(h1, h2, a, p)
+    mul = None
+    if mul_style == 'ap':
+        mul = lambda k, h: module.scalar_multiply(k, h, a, p)
+    elif mul_style == 'plain':
+        mul = module.scalar_multiply
+    return {
+        'prepare': lambda point: point,
+        'add': add,
+        'double': lambda h: add(h, h),
+        'mul': mul,
+        'inverse': lambda k: module.mod_inverse(k, p),
+        'to_tuple': lambda point: point,
+    }
+
+
+def _ec_math_batch_mul(k, points):
+    """ 标量的 wNAF 表示只计算一次 """
+    digits = wnaf_digits(k)
+    return [wnaf_multiply(digits, h) for h in points]
+
+
+def _ec_math_backend():
+    """ ec_math: wNAF 标量乘法, Pippenger MSM, Montgomery 批量求逆 """
+    return {
+        'prepare': lambda point: point,
+        'add': ec_math.add_points,
+        'double': ec_math.double_point,
+        'mul': lambda k, h: wnaf_multiply(wnaf_digits(k), h),
+        'batch_mul': _ec_math_batch_mul,
+        'msm': multi_scalar_multiply,
+        'batch_inverse': batch_mod_inverse,
+        'inverse': ec_math.mod_inverse,
+        'to_tuple': lambda point: point,
+    }
+
+
+def _ecdsa_backend():
+    """ ecdsa 库自带的 Jacobian 坐标实现, 作为参照 """
+    curve = SECP256k1.curve
+    return {
+        'prepare': lambda point: PointJacobi(curve, point[0], point[1], 1, N),
+        'add': lambda h1, h2: h1 + h2,
+        'double': lambda h: h.double(),
+        'mul': lambda k, h: h * k,
+        'inverse': lambda k: inverse_mod(k, P),
+        'to_tuple': lambda point: (point.x(), point.y()),
+    }
+
+
+# 后端名 -> 构造函数; 导入失败的后端会被跳过
+BACKENDS = {
+    'ec_math': _ec_math_backend,
+    'ecdsa': _ecdsa_backend,
+    'client_me': lambda: _tuple_backend('client_me', 'ap'),
+    'con_me': lambda: _tuple_backend('con_me', 'plain'),
+}
+
+
+def make_inputs(seed, count):
+    """ 生成固定的测试数据: count 个随机点和 256 位标量, MSM 标量和待求逆的域元素 """
+    rng = random.Random(seed)
+    generator = SECP256k1.generator
+    points = []
+    for _ in range(count):
+        point = generator * rng.randrange(1, N)
+        points.append((point.x(), point.y()))
+    return {
+        'points': points,
+        'scalars': [rng.randrange(1, N) for _ in range(count)],
+        'msm_scalars': [rng.getrandbits(MSM_BITS) | 1 for _ in range(count)],
+        'field': [rng.randrange(1, P) for _ in range(INVERSE_SIZE)],
+        'encoded': [encode_point(point) for point in points],
+        'compressed': [compress_point(point) for point in points],
+    }
+
+
+def backend_cases(backend, inputs, msm_sizes):
+    """ 返回 {用例名: 无参函数}; 后端不支持的运算不出现 """
+    prepare = backend['prepare']
+    add, mul = backend['add'], backend['mul']
+    points = inputs['points']
+    native = [prepare(point) for point in points]
+    scalars = inputs['scalars']
+    cases = {
+        'add': lambda: add(native[0], native[1]),
+        'double': lambda: backend['double'](native[0]),
+    }
+    if mul is not None:
+        cases['mul'] = lambda: mul(scalars[0], native[0])
+        # 同一个标量乘一批点 (DO 的重随机化)
+        batch = native[:BATCH_SIZE]
+        if 'batch_mul' in backend:
+            cases[f'batch_mul_{BATCH_SIZE}'] = lambda: backend['batch_mul'](scalars[0], batch)
+        else:
+            cases[f'batch_mul_{BATCH_SIZE}'] = lambda: [mul(scalars[0], h) for h in batch]
+        for size in msm_sizes:
+            msm_scalars = inputs['msm_scalars'][:size]
+            msm_points = native[:size]
+            if 'msm' in backend:
+                cases[f'msm_{size}'] = lambda k=msm_scalars, h=msm_points: backend['msm'](k, h)
+            else:
+                cases[f'msm_{size}'] = lambda k=msm_scalars, h=msm_points: _naive_msm(add, mul, k, h)
+    field = inputs['field']
+    if 'batch_inverse' in backend:
+        cases[f'batch_inverse_{INVERSE_SIZE}'] = lambda: backend['batch_inverse'](field)
+    else:
+        cases[f'batch_inverse_{INVERSE_SIZE}'] = lambda: [backend['inverse'](k) for k in field]
+    return cases
+
+
+def codec_cases(inputs):
+    """ 点的编码/解码, 与点运算后端无关 """
+    point = inputs['points'][0]
+    encoded = inputs['encoded'][0]
+    compressed = inputs['compressed'][0]
+    return {
+        'encode': lambda: encode_point(point),
+        'decode': lambda: decode_point(encoded),
+        'compress': lambda: compress_point(point),
+        'decompress': lambda: decompress_point(compressed),
+    }
+
+
+def _naive_msm(add, mul, scalars, points):
+    """ 没有 MSM 实现的后端: 逐个标量乘法再相加 """
+    total = None
+    for k, h in zip(scalars, points):
+        term = mul(k, h)
+        total = term if total is None else add(total, term)
+    return total
+
+
+def _normalize(result, to_tuple):
+    if isinstance(result, list):
+        return [_normalize(item, to_tuple) for item in result]
+    if result is None or isinstance(result, int):
+        return result
+    return to_tuple(result)
+
+
+def time_case(func, min_time, repeat):
+    """ 先单次运行估计耗时, 再让每轮至少运行 min_time 秒; 返回每次调用的 (最小, 中位数) 耗时 """
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    number = max(1, int(min_time / elapsed)) if elapsed > 0 else 1000
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return min(timings), statistics.median(timings)
+
+
+def run_benchmarks(backend_names, case_filter, min_time, repeat, seed, msm_sizes):
+    """ 运行所有后端的所有用例, 返回 {'后端.用例': {...}}; 结果与第一个后端 (默认 ec_math) 不一致的用例标记 mismatch """
+    inputs = make_inputs(seed, max(list(msm_sizes) + [BATCH_SIZE]))
+    reference = {}
+    results = {}
+    selected = [('codec', None)] + [(name, BACKENDS[name]) for name in backend_names]
+    for name, factory in selected:
+        if name == 'codec':
+            cases = codec_cases(inputs)
+            to_tuple = None
+        else:
+            try:
+                backend = factory()
+            except ImportError as e:
+                print(f"Skipping backend {name}: {e}")
+                continue
+            cases = backend_cases(backend, inputs, msm_sizes)
+            to_tuple = backend['to_tuple']
+        for case, func in cases.items():
+            if case_filter and not any(case.startswith(prefix) for prefix in case_filter):
+                continue
+            entry = {}
+            if to_tuple is not None:
+                value = _normalize(func(), to_tuple)
+                if case not in reference:
+                    reference[case] = value
+                entry['mismatch'] = value != reference[case]
+            best, median = time_case(func, min_time, repeat)
+            entry.update({'best_s': best, 'median_s': median})
+            results[f'{name}.{case}'] = entry
+            flag = '  MISMATCH' if entry.get('mismatch') else ''
+            print(f"{name:<14}{case:<20}{best * 1e6:>14.1f}{median * 1e6:>14.1f}{1 / best:>14.1f}{flag}")
+    return results
+
+
+def compare(baseline, results, threshold):
+    """ 与基线比较中位数耗时, 返回变慢超过 threshold 的用例列表 """
+    slower = []
+    print(f"{'benchmark':<34}{'baseline us':>14}{'current us':>14}{'ratio':>9}")
+    for key, entry in results.items():
+        old = baseline.get(key)
+        if old is None:
+            print(f"{key:<34}{'-':>14}{entry['median_s'] * 1e6:>14.1f}{'new':>9}")
+            continue
+        ratio = entry['median_s'] / old['median_s']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  SLOWER'
+            slower.append(key)
+        elif ratio < 1 / (1 + threshold):
+            flag = '  faster'
+        print(f"{key:<34}{old['median_s'] * 1e6:>14.1f}{entry['median_s'] * 1e6:>14.1f}{ratio:>9.2f}{flag}")
+    return slower
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the elliptic curve primitives")
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=list(BACKENDS),
+                        help="point arithmetic implementations to measure (codec cases always run)")
+    parser.add_argument('--cases', nargs='+', help="only run cases whose name starts with one of these prefixes, "
+                                                   f"e.g. {' '.join(CASES)}")
+    parser.add_argument('--msm-sizes', nargs='+', type=int, default=list(MSM_SIZES))
+    parser.add_argument('--min-time', type=float, default=0.2, help="minimum seconds per timing round")
+    parser.add_argument('--repeat', type=int, default=5, help="timing rounds per case")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', metavar='FILE', nargs='?', const=DEFAULT_BASELINE, help="write results as a baseline")
+    parser.add_argument('--compare', metavar='FILE', nargs='?', const=DEFAULT_BASELINE,
+                        help="compare against a saved baseline and exit with status 1 on slowdowns")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative slowdown that counts as a regression")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    metrics.disable()  # 计数本身有开销, 测量时关闭
+    print(f"{'backend':<14}{'case':<20}{'best us':>14}{'median us':>14}{'ops/s':>14}")
+    results = run_benchmarks(args.backends, args.cases, args.min_time, args.repeat, args.seed, args.msm_sizes)
+
+    mismatches = [key for key, entry in results.items() if entry.get('mismatch')]
+    if mismatches:
+        print(f"Results differ from ec_math: {', '.join(mismatches)}")
+
+    if args.save:
+        baseline = {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'results': results,
+        }
+        with open(args.save, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=4)
+        print(f"Baseline written to {args.save}")
+
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        slower = compare(baseline['results'], results, args.threshold)
+        if slower:
+            print(f"{len(slower)} benchmarks slower than {args.compare} by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
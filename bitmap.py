@@ -0,0 +1,75 @@
+WORD_BYTES = 8
+WORD_BITS = 64
+
+
+def is_binary(values):
+    """ 判断所有值是否都是 0/1 """
+    return all(value == 0 or value == 1 for value in values)
+
+
+def pack_bits(values):
+    """ 将 0/1 值打包为位图, 第 i 个值对应第 i 位 (小端字节序, 低位在前), 长度补齐到 8 字节 """
+    num_words = (len(values) + WORD_BITS - 1) // WORD_BITS
+    buf = bytearray(num_words * WORD_BYTES)
+    for i, value in enumerate(values):
+        if value:
+            buf[i >> 3] |= 1 << (i & 7)
+    return bytes(buf)
+
+
+def unpack_bits(data, count):
+    """ 将位图还原为 count 个 0/1 值 """
+    return [(data[i >> 3] >> (i & 7)) & 1 for i in range(count)]
+
+
+def count_set_bits(data):
+    """ 统计位图中为 1 的位数 """
+    return bin(int.from_bytes(data, 'little')).count('1')
+
+
+def iter_set_bits(data, start_word=0, stop_word=None):
+    """ 按 64 位字遍历位图, 产生所有为 1 的位的下标; 全 0 的字直接跳过 """
+    view = memoryview(data)
+    if stop_word is None:
+        stop_word = len(view) // WORD_BYTES
+    for w in range(start_word, stop_word):
+        word = int.from_bytes(view[w * WORD_BYTES:(w + 1) * WORD_BYTES], 'little')
+        base = w * WORD_BITS
+        while word:
+            low = word & -word
+            yield base + low.bit_length() - 1
+            word ^= low
+
+
+def iter_bit_groups(data, group_bits, num_bits=None):
+    """ 按每 group_bits 位一组遍历位图的前 num_bits 位, 产生 (组号, 组内的位) , 全 0 的组跳过;
+    逐个 64 位字读入, 只移位不超过一个字加一组的小整数, 耗时与位图长度成线性 """
+    view = memoryview(data)
+    if num_bits is None or num_bits > len(view) * 8:
+        num_bits = len(view) * 8
+    group_mask = (1 << group_bits) - 1
+    pending = 0  # 尚未分组的位, 共 pending_bits 位
+    pending_bits = 0
+    group = 0
+    for w in range((num_bits + WORD_BITS - 1) // WORD_BITS):
+        word = int.from_bytes(view[w * WORD_BYTES:(w + 1) * WORD_BYTES], 'little')
+        take = min(WORD_BITS, num_bits - w * WORD_BITS)
+        if take < WORD_BITS:
+            word &= (1 << take) - 1
+        if not word and not pending:
+            # 全 0 的字: 只推进组号
+            pending_bits += take
+            group += pending_bits // group_bits
+            pending_bits %= group_bits
+            continue
+        pending |= word << pending_bits
+        pending_bits += take
+        while pending_bits >= group_bits:
+            mask = pending & group_mask
+            if mask:
+                yield group, mask
+            pending >>= group_bits
+            pending_bits -= group_bits
+            group += 1
+    if pending:
+        yield group, pending
\ No newline at end of file
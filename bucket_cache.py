@@ -0,0 +1,144 @@
+import os
+import sys
+import threading
+from array import array
+from collections import OrderedDict, namedtuple
+from ec_math import wnaf_digits
+from bitmap import is_binary, pack_bits
+import metrics
+
+NAF_WINDOW = 2  # value 的 NAF 表示, 与 ec_math.wnaf_multiply 的窗口宽度一致
+DEFAULT_BUDGET_MB = 64
+# 缓存配置: EAPIR_BUCKET_CACHE_MB (0 表示关闭), EAPIR_BUCKET_CACHE_POLICY (lru / lfu)
+BUDGET_ENV = 'EAPIR_BUCKET_CACHE_MB'
+POLICY_ENV = 'EAPIR_BUCKET_CACHE_POLICY'
+
+# 解码后的桶: b_index 列, value 列 (整数), 0/1 数据的位图, 非 0/1 数据中非零 value 的 NAF 表示
+DecodedBucket = namedtuple('DecodedBucket', ['indices', 'values', 'bits', 'digits', 'nbytes'])
+
+
+def decode_bucket(look_table_values=None, bits=None):
+    """ 由 look_table 的 (b_index, value) 行或位图构造解码后的桶; 0/1 数据只保留位图 """
+    if bits is not None:
+        bits = bytes(bits)
+        return DecodedBucket(None, None, bits, None, sys.getsizeof(bits))
+    rows = sorted((int(b_index), int(value)) for b_index, value in look_table_values)
+    values = [value for _, value in rows]
+    if rows and is_binary(values) and rows[-1][0] == len(rows):
+        # b_index 为连续的 1..n, 第 b_index - 1 位对应该条目
+        bits = pack_bits(values)
+        return DecodedBucket(None, None, bits, None, sys.getsizeof(bits))
+    indices = array('l', (b_index for b_index, _ in rows))
+    values = array('q', values)
+    digits = [wnaf_digits(value, NAF_WINDOW) if value > 0 else None for value in values]
+    nbytes = (sys.getsizeof(indices) + sys.getsizeof(values) + sys.getsizeof(digits)
+              + sum(sys.getsizeof(d) for d in digits if d is not None))
+    return DecodedBucket(indices, values, None, digits, nbytes)
+
+
+class BucketCache:
+    """ 按内存预算淘汰的桶缓存, policy 为 'lru' (最近最少使用) 或 'lfu' (最不经常使用) """
+
+    def __init__(self, budget_bytes, policy='lru'):
+        if policy not in ('lru', 'lfu'):
+            raise ValueError(f"Unknown cache policy: {policy}")
+        self.budget_bytes = budget_bytes
+        self.policy = policy
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # 桶的键 -> DecodedBucket, 按最近使用排序
+        self._frequency = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, b):
+        return b in self._entries
+
+    def get(self, b):
+        """ 返回缓存中的桶, 不存在时返回 None """
+        with self._lock:
+            entry = self._entries.get(b)
+            if entry is None:
+                self.misses += 1
+                metrics.count('bucket_cache_miss')
+                return None
+            self.hits += 1
+            metrics.count('bucket_cache_hit')
+            self._entries.move_to_end(b)
+            self._frequency[b] += 1
+            return entry
+
+    def put(self, b, entry):
+        """ 放入一个桶, 超出预算时按策略淘汰; 单个桶大于预算时不缓存 """
+        if entry.nbytes > self.budget_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(b, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            while self._entries and self.nbytes + entry.nbytes > self.budget_bytes:
+                self._evict()
+            self._entries[b] = entry
+            self._frequency[b] = self._frequency.get(b, 0) + 1
+            self.nbytes += entry.nbytes
+
+    def _evict(self):
+        if self.policy == 'lru':
+            victim = next(iter(self._entries))
+        else:
+            # 访问次数最少的桶, 次数相同时淘汰最久未使用的
+            victim = min(self._entries, key=self._frequency.__getitem__)
+        entry = self._entries.pop(victim)
+        del self._frequency[victim]
+        self.nbytes -= entry.nbytes
+        self.evictions += 1
+        metrics.count('bucket_cache_eviction')
+
+    def get_or_load(self, b, loader):
+        """ 命中时直接返回, 否则调用 loader() 解码并放入缓存 """
+        entry = self.get(b)
+        if entry is None:
+            entry = loader()
+            self.put(b, entry)
+        return entry
+
+    def discard(self, predicate):
+        """ 删除键满足 predicate 的所有桶, 返回删除的个数 """
+        with self._lock:
+            victims = [key for key in self._entries if predicate(key)]
+            for key in victims:
+                self.nbytes -= self._entries.pop(key).nbytes
+                del self._frequency[key]
+        return len(victims)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._frequency.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """ 命中率等统计信息 """
+        lookups = self.hits + self.misses
+        return {
+            'policy': self.policy,
+            'budget_bytes': self.budget_bytes,
+            'bytes': self.nbytes,
+            'buckets': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else None,
+        }
+
+
+def cache_from_env():
+    """ 按环境变量创建缓存, 预算为 0 时返回 None """
+    budget_mb = float(os.environ.get(BUDGET_ENV, DEFAULT_BUDGET_MB))
+    if budget_mb <= 0:
+        return None
+    return BucketCache(int(budget_mb * 1024 * 1024), os.environ.get(POLICY_ENV, 'lru').lower())
\ No newline at end of file
@@ -2,32 +2,39 @@ import random
 import sqlite3
 import secrets
 import os  # 导入 os 模块以处理文件操作
-from ecdsa import SECP256k1
-from cryptography.fernet import Fernet
-import base64  # 导入 base64 模块以进行编码
+from curve_params import P, A
 import time
-
-def fetch_h_values_from_db(db_name):
-    """ 从指定的数据库中获取 h_value 表的所有值 """
+import sys
+import struct
+import hashlib
+import threading
+import metrics
+import transport
+from transport import MSG_QUERY, MSG_DO_RESULT, MSG_SERVER_RESULT, TABLE_ENV, make_message
+from warm_snapshot import open_snapshot
+from index_token import get_cipher
+import record_pool
+from point_codec import POINT_SIZE, SCALAR_SIZE, encode_point, decode_point, encode_scalar, decode_scalar, encode_points
+
+QUERY_TOKEN_POOL = 'query_tokens.bin'
+QUERY_TOKEN_MAGIC = b'EQTP'
+QUERY_TOKEN_VERSION = 1
+POOL_LOW_WATERMARK = 4  # 池中令牌少于该值时在后台补充
+POOL_REFILL_TARGET = 16
+# 令牌池文件头: magic, 版本, h 值个数, h 值指纹
+_POOL_HEADER = struct.Struct('>4sBI16s')
+
+def load_startup_state(db_name):
+    """ 从 look_table 的快照中读取 (h 值列表, 桶摘要列表); 快照不存在或已过期时自动重建 """
+    snapshot = open_snapshot(db_name)
     try:
-        conn = sqlite3.connect(db_name)
-        cursor = conn.cursor()
-
-        # 查询 h_value 表中的所有值
-        cursor.execute('SELECT x, y FROM h_value')
-        h_values = cursor.fetchall()  # 获取所有行
-
-        return h_values
-    except sqlite3.Error as e:
-        print(f"Database error: {e}")
-        return []
+        return snapshot.h_points(), snapshot.digests()
     finally:
-        conn.close()  # 确保连接关闭
+        snapshot.close()
 
 def generate_random_value(probability=1):
 
-    curve = SECP256k1.curve
-    p = curve.p()  # 获取有限域的素数 p
+    p = P  # 获取有限域的素数 p
     p_length = len(str(p))  # p 的位数
 
     if random.random() < probability:
@@ -49,8 +56,12 @@ def add_points(h1, h2, a, p):
     x2, y2 = h2
 
     if h1 == h2:  # Doubling case
+        if metrics.enabled:
+            metrics.count('point_double')
         m = (3 * x1**2 + a) * mod_inverse(2 * y1, p) % p
     else:  # Addition case
+        if metrics.enabled:
+            metrics.count('point_add')
         m = (y2 - y1) * mod_inverse(x2 - x1, p) % p
 
     x3 = (m**2 - x1 - x2) % p
@@ -60,6 +71,8 @@ def add_points(h1, h2, a, p):
 
 def mod_inverse(k, p):
     """ Calculate the modular inverse of k under modulo p """
+    if metrics.enabled:
+        metrics.count('field_inversion')
     return pow(k, p - 2, p)  # Fermat's little theorem
 
 def scalar_multiply(k, h, a, p):
@@ -102,7 +115,7 @@ def create_data_pk_table(conn):
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS data_pk (
             id INTEGER PRIMARY KEY,
-            encrypted_data TEXT
+            encrypted_data BLOB
         )
     ''')
     conn.commit()
@@ -113,37 +126,187 @@ def remove_existing_db(db_name):
     if os.path.exists(db_name):
         os.remove(db_name)
 
+def h_values_fingerprint(h_points):
+    """ 计算 h 值的指纹, 用于判断令牌池是否与当前 look_table 匹配 """
+    return hashlib.sha256(encode_points(h_points)).digest()[:16]
+
+def generate_query_token(h_points, a, p):
+    """ 生成一个与查询下标无关的查询令牌 (m, {m·h_i}) """
+    m = generate_random_value()
+    with metrics.span('scalar_mult_batch'):
+        h_m_points = [scalar_multiply(m, h_point, a, p) for h_point in h_points]
+    return m, h_m_points
+
+def query_token_pool(pool_name, h_points):
+    """ 令牌池: 每条记录为 m||m·h_1||...||m·h_N; 文件头含 h 值指纹, look_table 重建后旧令牌作废 """
+    header = _POOL_HEADER.pack(QUERY_TOKEN_MAGIC, QUERY_TOKEN_VERSION, len(h_points),
+                               h_values_fingerprint(h_points))
+    return record_pool.RecordPool(pool_name, header, SCALAR_SIZE + POINT_SIZE * len(h_points))
+
+def encode_query_token(token):
+    """ 将令牌 (m, {m·h_i}) 编码为令牌池中的一条记录 """
+    m, h_m_points = token
+    record = encode_scalar(m) + b''.join(encode_point(point) for point in h_m_points)
+    metrics.count('bytes_serialized', len(record))
+    return record
+
+def count_query_tokens(pool_name, h_points):
+    """ 返回令牌池中可用的令牌数量 """
+    return query_token_pool(pool_name, h_points).count()
+
+def append_query_token(pool_name, h_points, token):
+    """ 将一个令牌追加到池中 """
+    query_token_pool(pool_name, h_points).append(encode_query_token(token))
+
+def pop_query_token(pool_name, h_points):
+    """ 从池尾取出一个令牌, 返回 ((m, h_m_points), 剩余数量); 池为空时令牌为 None """
+    record, remaining = query_token_pool(pool_name, h_points).pop()
+    if record is None:
+        return None, remaining
+    m = decode_scalar(record)
+    h_m_points = [decode_point(record, SCALAR_SIZE + i * POINT_SIZE) for i in range(len(h_points))]
+    return (m, h_m_points), remaining
+
+def refill_query_token_pool(pool_name, h_points, target, a, p):
+    """ 离线补充令牌池直到有 target 个令牌, 逐个追加以便在线查询可随时取用 """
+    return query_token_pool(pool_name, h_points).refill(
+        target, lambda: encode_query_token(generate_query_token(h_points, a, p)))
+
+def refill_in_background(target, pool_name=QUERY_TOKEN_POOL):
+    """ 启动一个独立的离线进程补充令牌池; 已有补充进程在运行时不再启动 """
+    return record_pool.refill_in_background(__file__, 'offline', pool_name, target)
+
+def take_query_token(pool_name, h_points):
+    """ 从令牌池中取出一个令牌, 池为空时返回 None; 池快用完或池文件还不存在时在后台补充,
+    同一个池同时只有一个补充进程 """
+    token, remaining = pop_query_token(pool_name, h_points)
+    if record_pool.needs_refill(remaining, POOL_LOW_WATERMARK):
+        refill_in_background(POOL_REFILL_TARGET, pool_name)
+    return token
+
+def build_query(h_points, cipher_suite, num, query_id, token=None, table=None):
+    """ 生成查询消息 (加密的下标 + {m·h_i}), 返回 (m, 消息); cipher_suite 为 index_token.IndexCipher,
+    table 为 look table 名称, 默认取 EAPIR_TABLE """
+    if token is None:
+        token = generate_query_token(h_points, A, P)
+    m, h_m_points = token
+    with metrics.span('encrypt'):
+        encrypted_data = cipher_suite.encrypt([num])
+    tokens = [encrypted_data]
+    table = table or os.environ.get(TABLE_ENV)
+    if table:
+        tokens.append(table.encode())
+    return m, make_message(MSG_QUERY, query_id, tokens, h_m_points)
+
+def collect_replies(mailbox, query_ids, timeout=None):
+    """ 从信箱中收集每个查询的 t·P 和 total_result, 返回 {query_id: (total_result, t·P)} """
+    pending = {query_id: [None, None, 0] for query_id in query_ids}
+    replies = {}
+    while pending:
+        message = mailbox.recv(timeout=timeout)
+        if message is None:
+            break
+        entry = pending.get(message.query_id)
+        if entry is None:
+            continue
+        if message.kind == MSG_SERVER_RESULT:
+            entry[0] = message.points[0]
+        elif message.kind == MSG_DO_RESULT:
+            entry[1] = message.points[0]
+        else:
+            continue
+        entry[2] += 1
+        if entry[2] == 2:
+            replies[message.query_id] = (entry[0], entry[1])
+            del pending[message.query_id]
+    return replies
+
+def run_query(num, h_points, digests, cipher_suite, router, mailbox, query_id=1, token=None, timeout=None):
+    """ 通过消息发送一次查询并验证结果, 返回查询到的值 (0/1), 无法验证时返回 None """
+    from con_me import verify_result
+    m, message = build_query(h_points, cipher_suite, num, query_id, token)
+    router.send('do', message)
+    total_result, result_t = collect_replies(mailbox, [query_id], timeout)[query_id]
+    with metrics.span('verify'):
+        return verify_result(m, total_result, result_t, digests)
+
+def start_in_process_roles(look_table_db_name='look_table.db'):
+    """ 在当前进程的线程中启动 DO 和 server, 角色之间使用进程内 transport; 返回 (router, client 信箱, 关闭函数) """
+    import DO
+    import server_me
+    mailboxes = {role: transport.InProcessTransport() for role in ('client', 'do', 'server')}
+    router = transport.Router(mailboxes)
+    threads = [threading.Thread(target=DO.serve, args=(mailboxes['do'], router, look_table_db_name), daemon=True),
+               threading.Thread(target=server_me.serve, args=(mailboxes['server'], router, look_table_db_name),
+                                daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    def shutdown():
+        mailboxes['do'].close()
+        mailboxes['server'].close()
+        for thread in threads:
+            thread.join()
+
+    return router, mailboxes['client'], shutdown
+
 def main():
     db_name = 'look_table.db'  # 要连接的数据库名
-    h_values = fetch_h_values_from_db(db_name)
+    # 启动时 mmap 快照中已解码的 h 值和桶摘要, 不再逐行解析数据库中的十进制字符串
+    h_points, digests = load_startup_state(db_name)
+
+    # 获取椭圆曲线的参数
+    a = A
+    p = P
+
+    # 离线模式: python client_me.py offline [数量] [池文件], 只预计算令牌, 不发起查询
+    if len(sys.argv) > 1 and sys.argv[1] == 'offline':
+        target = int(sys.argv[2]) if len(sys.argv) > 2 else POOL_REFILL_TARGET
+        pool_name = sys.argv[3] if len(sys.argv) > 3 else QUERY_TOKEN_POOL
+        added = refill_query_token_pool(pool_name, h_points, target, a, p)
+        print(f"Precomputed {added} query tokens, pool size: {count_query_tokens(pool_name, h_points)}")
+        metrics.emit('client')
+        return
+
+    # 消息模式: python client_me.py send [下标] 发给运行中的 DO / server; inprocess [下标] 在本进程内运行所有角色
+    if len(sys.argv) > 1 and sys.argv[1] in ('send', 'inprocess'):
+        num = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+        cipher_suite = get_cipher('key')
+        token = take_query_token(QUERY_TOKEN_POOL, h_points)
+        if sys.argv[1] == 'send':
+            mailbox = transport.listen('client')
+            router = transport.Router()
+            shutdown = router.close
+        else:
+            router, mailbox, shutdown = start_in_process_roles(db_name)
+        try:
+            start = time.time()
+            x = run_query(num, h_points, digests, cipher_suite, router, mailbox, token=token)
+            elapsed_time = (time.time() - start) * 1000
+            print(f"Query {num}: x={x}")
+            print(f"Time taken for query: {elapsed_time:.4f} ms")
+        finally:
+            shutdown()
+            if sys.argv[1] == 'send':
+                mailbox.close()
+            metrics.emit('client')
+        return
 
     # 打印获取到的 h 值
     print("Fetched h_values from the database:")
-    for x, y in h_values:
+    for x, y in h_points:
         print(f"x: {x}, y: {y}")
 
-
-    # 生成椭圆曲线 P-256 上的随机值 m
-    m = generate_random_value()
-    # m = 23
-
-
-    # 获取椭圆曲线的参数
-    curve = SECP256k1.curve
-    a = curve.a()
-    p = curve.p()
+    # 在线模式: 优先从令牌池中取出预计算好的 (m, {m·h_i})
+    with metrics.span('token_pop'):
+        token = take_query_token(QUERY_TOKEN_POOL, h_points)
     # 加载密钥
-    with open("key", "rb") as key_file:
-        key = key_file.read()
-    cipher_suite = Fernet(key)
+    cipher_suite = get_cipher('key')
 
-    # 加密数据
-    num = 1  # 获取用户输入的整数
-    data = str(num).encode()
-    encrypted_data = cipher_suite.encrypt(data)
-
-    # 将加密数据编码为 Base64 字符串
-    encrypted_data_str = base64.urlsafe_b64encode(encrypted_data).decode('utf-8')
+    # 加密数据: 二进制令牌直接存入 data_pk, 一个令牌可以携带多个下标 (python client_me.py [下标 ...], 默认为 1)
+    nums = [int(arg) for arg in sys.argv[1:]] or [1]
+    with metrics.span('encrypt'):
+        encrypted_data = cipher_suite.encrypt(nums)
 
 
     # 检查并删除现有的 h_m.db 数据库
@@ -158,11 +321,16 @@ def main():
     create_data_pk_table(conn)  # 创建 data_pk 表
 
     start = time.time()
-    # 对每个 h 值与 m 进行标量乘法，并存储结果
-    for index, (x, y) in enumerate(h_values):
-        h_point = (int(x), int(y))  # 将字符串转为整数元组
-        result = scalar_multiply(m, h_point, a, p)
+    if token is None:
+        # 令牌池为空, 退回到在线计算: 生成椭圆曲线上的随机值 m 并对每个 h 值做标量乘法
+        m, h_m_points = generate_query_token(h_points, a, p)
+    else:
+        m, h_m_points = token
+
+    # 存储每个 h 值与 m 的标量乘法结果
+    for index, result in enumerate(h_m_points):
         if result is None:
+            x, y = h_points[index]
             print(f"Scalar multiplication of h ({x}, {y}) with m results in: None (Point at infinity)")
             x_result, y_result = None, None  # 处理无效结果
         else:
@@ -171,9 +339,11 @@ def main():
 
         # 将结果插入 h_m 表中，使用文本格式存储大整数
 
-        cursor = conn.cursor()
-        cursor.execute('INSERT INTO h_m (id, x_result, y_result) VALUES (?, ?, ?)', (index + 1, str(x_result), str(y_result)))  # index 从 1 开始
-        cursor.close()  # 显式关闭游标
+        with metrics.span('db_write'):
+            cursor = conn.cursor()
+            cursor.execute('INSERT INTO h_m (id, x_result, y_result) VALUES (?, ?, ?)', (index + 1, str(x_result), str(y_result)))  # index 从 1 开始
+            cursor.close()  # 显式关闭游标
+        metrics.count('bytes_serialized', len(str(x_result)) + len(str(y_result)))
 
         # 计算耗时
     elapsed_time = (time.time() - start)*1000
@@ -182,12 +352,14 @@ def main():
 
     # 将加密数据插入 data_pk 表中
     cursor = conn.cursor()
-    cursor.execute('INSERT INTO data_pk (id, encrypted_data) VALUES (?, ?)', (1, encrypted_data_str))  # 插入一条记录，id 从 1 开始
+    cursor.execute('INSERT INTO data_pk (id, encrypted_data) VALUES (?, ?)', (1, encrypted_data))  # 插入一条记录，id 从 1 开始
     cursor.close()  # 显式关闭游标
 
     # 提交事务并关闭连接
-    conn.commit()
+    with metrics.span('db_write'):
+        conn.commit()
     conn.close()
+    metrics.emit('client')
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
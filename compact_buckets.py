@@ -0,0 +1,131 @@
+import hashlib
+import secrets
+from array import array
+from itertools import repeat
+import scheduler
+from point_array import split_ranges
+
+HASH_SECONDS = 1.5e-6  # 每个条目哈希加局部计数排序的大致耗时, 用于选择执行方式和切分块数
+HASH_KEY_SIZE = 16
+
+
+class CompactBuckets:
+    """ 分桶结果: 所有桶共用平行的 index / value 列, 桶 b 占 [b*capacity, b*capacity + fill[b]) """
+
+    def __init__(self, num_buckets, capacity):
+        self.num_buckets = num_buckets
+        self.capacity = capacity
+        self.ids = array('q', bytes(8 * num_buckets * capacity))
+        self.values = array('q', bytes(8 * num_buckets * capacity))
+        self.fill = array('l', [0] * num_buckets)  # 每个桶的实际条目数, 其余位置为隐含的填充值
+
+    @property
+    def max_count(self):
+        """ 最大桶容量, 即填充后每个桶的条目数 """
+        return max(self.fill) if self.num_buckets else 0
+
+    def __len__(self):
+        return sum(self.fill)
+
+    def bucket(self, b):
+        """ 返回桶 b 中实际条目的 (index 列, value 列) 视图, 不含填充值 """
+        start = b * self.capacity
+        stop = start + self.fill[b]
+        return memoryview(self.ids)[start:stop], memoryview(self.values)[start:stop]
+
+    def bucket_values(self, b):
+        return self.bucket(b)[1]
+
+    def rows(self):
+        """ 逐行产生 (b, b_index, id, value), 只包含实际条目; 每个桶的四列直接由切片组合 """
+        for b in range(self.num_buckets):
+            start = b * self.capacity
+            stop = start + self.fill[b]
+            yield from zip(repeat(b), range(1, self.fill[b] + 1), self.ids[start:stop], self.values[start:stop])
+
+    def nbytes(self):
+        """ 列数据占用的字节数 """
+        return (len(self.ids) * self.ids.itemsize + len(self.values) * self.values.itemsize
+                + len(self.fill) * self.fill.itemsize)
+
+
+def partition_chunk(ids, values, num_buckets, key):
+    """ 工作进程: 计算一块条目的桶号 (以 key 为密钥的 8 字节 blake2b 摘要对桶数取模) 和直方图,
+    再按桶号做稳定的计数排序; 返回 (按桶排列的 ids, values, 每个桶的条目数) """
+    blake2b = hashlib.blake2b
+    from_bytes = int.from_bytes
+    homes = array('l', [from_bytes(blake2b(index.to_bytes(8, 'little', signed=True), digest_size=8, key=key).digest(),
+                                   'little') % num_buckets for index in ids])
+    counts = array('l', [0]) * num_buckets
+    for b in homes:
+        counts[b] += 1
+    positions = []
+    total = 0
+    for count in counts:
+        positions.append(total)
+        total += count
+    sorted_ids = array('q', bytes(8 * len(ids)))
+    sorted_values = array('q', bytes(8 * len(ids)))
+    for index, value, b in zip(ids, values, homes):
+        pos = positions[b]
+        positions[b] = pos + 1
+        sorted_ids[pos] = index
+        sorted_values[pos] = value
+    return sorted_ids, sorted_values, counts
+
+
+def spill_fill(counts, capacity):
+    """ 线性探测的结果只取决于每个桶落入的条目数 (与插入顺序无关): 满桶的多余条目依次溢出到下一个桶,
+    最后一个桶溢出的条目绕回桶 0; 返回 (每个桶的条目数, 绕回桶 0 的条目数) """
+    wrap = 0
+    while True:
+        fill = array('l', [0]) * len(counts)
+        carry = wrap
+        for b, count in enumerate(counts):
+            load = count + carry
+            fill[b] = min(load, capacity)
+            carry = load - fill[b]
+        if carry == wrap:
+            return fill, wrap
+        wrap = carry
+
+
+def partition_entries(ids, values, num_buckets, key=None):
+    """ 将 (ids, values) 两列按 blake2b 桶号分桶, 桶满时线性探测到下一个桶, 返回 CompactBuckets;
+    哈希和局部计数排序分块并行执行, 合并和写入桶都是整段切片复制. key 默认每次随机生成 """
+    if key is None:
+        key = secrets.token_bytes(HASH_KEY_SIZE)
+    count = len(ids)
+    capacity = (count // num_buckets) + 1  # 每个桶的容量上限
+    cost = count * HASH_SECONDS
+    ranges = split_ranges(count, scheduler.plan_parts(cost))
+    chunks = scheduler.run_tasks(partition_chunk, [(ids[start:stop], values[start:stop], num_buckets, key)
+                                                   for start, stop in ranges], cost)
+
+    # 合并各块: 按桶号拼接每块中该桶的一段, 得到按初始桶号稳定排序的两列
+    counts = array('l', [0]) * num_buckets
+    merged_ids, merged_values = array('q'), array('q')
+    chunk_starts = [0] * len(chunks)
+    for b in range(num_buckets):
+        for i, (chunk_ids, chunk_values, chunk_counts) in enumerate(chunks):
+            start = chunk_starts[i]
+            stop = start + chunk_counts[b]
+            merged_ids += chunk_ids[start:stop]
+            merged_values += chunk_values[start:stop]
+            chunk_starts[i] = stop
+            counts[b] += chunk_counts[b]
+
+    # 溢出的条目紧跟在前一个桶之后, 所以每个桶是排序后序列中连续的一段; 绕回桶 0 的条目来自序列末尾
+    fill, wrap = spill_fill(counts, capacity)
+    if wrap:
+        merged_ids = merged_ids[count - wrap:] + merged_ids[:count - wrap]
+        merged_values = merged_values[count - wrap:] + merged_values[:count - wrap]
+    buckets = CompactBuckets(num_buckets, capacity)
+    pos = 0
+    for b in range(num_buckets):
+        start = b * capacity
+        buckets.ids[start:start + fill[b]] = merged_ids[pos:pos + fill[b]]
+        buckets.values[start:start + fill[b]] = merged_values[pos:pos + fill[b]]
+        pos += fill[b]
+    buckets.fill = fill
+    return buckets
\ No newline at end of file
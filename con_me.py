@@ -1,16 +1,20 @@
 import json
 import os
 import sqlite3
-from ecdsa import SECP256k1
+from curve_params import P, A
 import time
+import metrics
+from warm_snapshot import open_snapshot
 
 
-def load_total_result(filename='total_result_me.json'):
-    """ 从 JSON 文件中加载 total_result 数据 """
+def load_total_results(filename='total_result_me.json'):
+    """ 从 JSON 文件中加载 server 的 total_result 列表, 每个查询一项 (按 results.json 的顺序) """
     try:
         with open(filename, 'r') as json_file:
             data = json.load(json_file)
-            return data.get('total_result_me')  # 返回 total_result 的值
+            if isinstance(data, dict):  # 旧格式: 只有一个查询的结果
+                data = [data]
+            return [entry.get('total_result_me') for entry in data]
     except FileNotFoundError:
         print(f"文件 {filename} 未找到。")
         return None
@@ -23,11 +27,11 @@ def load_total_result(filename='total_result_me.json'):
 
 
 def load_results(filename='results.json'):
-    """ 从 results.json 文件中加载结果数据 """
+    """ 从 results.json 文件中加载 DO 的 result_with_t 列表, 每个查询一项 """
     try:
         with open(filename, 'r') as json_file:
             data = json.load(json_file)
-            return data[0].get('result_with_t')  # 返回 result_with_t 的值
+            return [entry.get('result_with_t') for entry in data]
     except FileNotFoundError:
         print(f"文件 {filename} 未找到。")
         return None
@@ -39,23 +43,18 @@ def load_results(filename='results.json'):
         return None
 
 
-def fetch_buck_digest_data(conn):
-    """ 从 buck_digest 表中获取所有数据 """
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM buck_digest')
-    buck_digest_data = cursor.fetchall()  # 获取所有行
-    cursor.close()
-    return buck_digest_data
-
-
 def add_points(h1, h2, a, p):
     """ Add two points on the elliptic curve """
     x1, y1 = h1
     x2, y2 = h2
 
     if h1 == h2:  # Doubling case
+        if metrics.enabled:
+            metrics.count('point_double')
         m = (3 * x1 ** 2 + a) * mod_inverse(2 * y1, p) % p
     else:  # Addition case
+        if metrics.enabled:
+            metrics.count('point_add')
         m = (y2 - y1) * mod_inverse(x2 - x1, p) % p
 
     x3 = (m ** 2 - x1 - x2) % p
@@ -66,10 +65,12 @@ def add_points(h1, h2, a, p):
 
 def mod_inverse(k, p):
     """ Calculate the modular inverse of k under modulo p """
+    if metrics.enabled:
+        metrics.count('field_inversion')
     return pow(k, p - 2, p)  # Fermat's little theorem
 
 
-def scalar_multiply(k, h, curve):
+def scalar_multiply(k, h):
     """ Perform scalar multiplication on an elliptic curve point """
     if k == 0:
         return None  # Point at infinity (无穷远点)
@@ -84,8 +85,8 @@ def scalar_multiply(k, h, curve):
             if R is None:
                 R = H  # First addition
             else:
-                R = add_points(R, H, curve.a(), curve.p())
-        H = add_points(H, H, curve.a(), curve.p())  # Double the point
+                R = add_points(R, H, A, P)
+        H = add_points(H, H, A, P)  # Double the point
         k //= 2  # Shift right
 
     return R
@@ -96,9 +97,38 @@ def negate_point(point):
     if point is None:
         return None  # 无穷远点的负值仍然是无穷远点
     x, y = point
-    return (x, -y % SECP256k1.curve.p())  # 计算负值
+    return (x, -y % P)  # 计算负值
+
+
+
+def check_digest(m, digest, total_point, result_t):
+    """ 用一个桶摘要检查 total_result: total = m·d 时 x=0, total - m·d = t·P 时 x=1, 都不满足时返回 None """
+    with metrics.span('scalar_mult'):
+        result = scalar_multiply(m, digest)
+    negated_result = negate_point(result)
+    if negate_point(total_point) == negated_result:
+        return 0
+    if result_t is None:
+        return None
+    with metrics.span('verify'):
+        summed_result = add_points(negated_result, total_point, A, P)
+    if summed_result == tuple(result_t):
+        return 1
+    return None
 
 
+def verify_result(m, total_point, result_t, digests):
+    """ 依次用各桶摘要验证, 返回查询到的值 0/1, 无法验证时返回 None """
+    if total_point is None:
+        return None
+    for digest in digests:
+        if digest is None:
+            continue
+        x = check_digest(m, digest, tuple(total_point), result_t)
+        if x is not None:
+            return x
+    return None
+
 
 def main():
 
@@ -106,75 +136,31 @@ def main():
 
     print(f"m = {m}")
 
-    # 获取 total_result
-    total_result = load_total_result()
-    if total_result is not None:
-        # print(f"server响应值 : {total_result}")
-        # 获取 total_result 的 x 和 y 值
-        total_x = total_result[0]  # 第一个数作为 x 值
-        total_y = total_result[1]  # 第二个数作为 y 值
-        total_point = (total_x, total_y)  # 总结果作为椭圆曲线上的点
-
+    # 获取 server 的 total_result 和 DO 的 result_with_t, 第 k 项属于第 k 个查询
+    total_results = load_total_results()
+    results_data = load_results()
 
-    # 连接到 look_table 数据库以获取 buck_digest 数据
+    # 从 look_table 的快照中获取已解码的 buck_digest 数据
     look_table_db_name = 'look_table.db'  # 数据库名称
+    snapshot = None
+    start = time.time()
 
     try:
-        conn_look_table = sqlite3.connect(look_table_db_name)
-
-        # 获取 buck_digest 表中的所有数据
-        buck_digest_data = fetch_buck_digest_data(conn_look_table)
-
-        # 椭圆曲线参数
-        curve = SECP256k1.curve
-        p = curve.p()  # 获取有限域的素数 p
-        a = curve.a()
-        start = time.time()
-        for row in buck_digest_data:
-            # print(f"桶摘要: {row}")  # 打印桶摘要
-            if row[1] is None:
-                print("x=0")  # 如果 row 为 None，输出 x=0
-                continue  # 跳过当前循环，继续下一次迭代
-            # 假设 row 的格式为 (id, b_value, x, y)，获取 x 和 y 值
-            x = int(row[1])  # 第1列为 x 值
-            y = int(row[2])  # 第2列为 y 值
-            point = (x, y)  # 椭圆曲线上的点
-
-            # 计算标量乘法
-            result = scalar_multiply(m, point, curve)
-            # print(f" d^m : {result}")
-
-            # 计算结果的负值
-            negated_result = negate_point(result)
-            # print(f"d^m的负值: {negated_result}")
-
-            # 计算 negated_result 与 total_result 的加法
-            summed_result = add_points(negated_result, total_point, a, p)
-            # print(f"Summed result : {summed_result}")
-
-            # 加载 results.json 数据
-            results_data = load_results()
+        snapshot = open_snapshot(look_table_db_name)
+        buck_digests = snapshot.digests()
+
+        if total_results is not None and results_data is not None:
             # 计算文件的字节数并保存
-            if results_data is not None:
-                file_size = os.path.getsize('results.json')
-            if results_data is not None:
-                # 取出 result_with_t 的 x 和 y 值
-                results_point = (results_data[0], results_data[1])  # 取出 x 和 y 值
-
-                # 计算 total_point 的负值
-                neg = negate_point(total_point)
-
-                # 检查条件
-                if neg == negated_result:
-                    print("找到满足条件: x=0")
-                    break  # 停止后续操作
-                elif summed_result == results_point:
-                    print("找到满足条件: x=1")
-                    break  # 停止后续操作
+            file_size = os.path.getsize('results.json')
+            if len(total_results) != len(results_data):
+                print(f"server 返回 {len(total_results)} 个结果, DO 返回 {len(results_data)} 个")
+            for k, (total_result, result_t) in enumerate(zip(total_results, results_data), 1):
+                # 检查条件: total = m·d 时 x=0, total - m·d = t·P 时 x=1
+                x = verify_result(m, total_result, result_t, buck_digests)
+                if x is not None:
+                    print(f"查询 {k} 找到满足条件: x={x}")
                 else:
-                    print("evail")
-
-
+                    print(f"查询 {k}: evail")
 
     except sqlite3.Error as e:
         print(f"SQLite error: {e}")
@@ -185,8 +171,9 @@ def main():
         print(f"Time taken for computation (excluding file I/O): {elapsed_time:.4f} seconds")
         if results_data is not None:
             print(f"server 的字节数: {file_size} bytes")  # 在最后打印字节数
-        if conn_look_table:
-            conn_look_table.close()  # 关闭 look_table 数据库连接
+        if snapshot is not None:
+            snapshot.close()  # 关闭快照
+        metrics.emit('verify')
 
 # 计算耗时
 
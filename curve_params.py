@@ -0,0 +1,9 @@
+# secp256k1 曲线参数 y^2 = x^3 + a·x + b (mod p), 与 ecdsa.SECP256k1 相同
+# 直接写成整数常量, 各角色不必为了读取曲线参数而导入 ecdsa
+P = 0xfffffffffffffffffffffffffffffffffffffffffffffffffffffffefffffc2f
+A = 0
+B = 7
+N = 0xfffffffffffffffffffffffffffffffebaaedce6af48a03bbfd25e8cd0364141  # 基点的阶
+GX = 0x79be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798
+GY = 0x483ada7726a3c4655da4fbfc0e1108a8fd17b448a68554199c47d08ffb10d4b8
+G = (GX, GY)  # 基点
\ No newline at end of file
@@ -1,11 +1,23 @@
 import sqlite3
-import hashlib
 import os
 import random
 import secrets
-from ecdsa import SECP256k1
+from curve_params import P, A, B
 import time
-from concurrent.futures import ThreadPoolExecutor
+from array import array
+import metrics
+import scheduler
+from point_array import PointArray
+from flat_table import export_flat_table
+from warm_snapshot import build_snapshot, snapshot_path
+from digest_engine import digest_worker, subset_digests
+from subset_sums import subset_sum_tables
+from compact_buckets import partition_entries
+from bitmap import is_binary, pack_bits
+from set import fetch_packed_data
+
+DIGEST_BATCH = 64  # 每批计算并提交的桶摘要个数, 中断后从最后提交的一批之后继续
+R_FILE_SUFFIX = '.r'  # 建表期间保存随机值 r 的文件 (不写入 look_table.db), 建表完成后删除
 
 def create_new_database(db_name):
     """ 创建一个新的数据库文件 """
@@ -13,12 +25,17 @@ def create_new_database(db_name):
     return conn
 
 def fetch_data_from_existing_db(existing_db_name):
-    """ 从已有的数据库中获取 data 表的值 """
+    """ 从已有的数据库中获取 data 表的值, data 为空时读取位图形式的 data_bits 表 """
     conn = sqlite3.connect(existing_db_name)
     cursor = conn.cursor()
     cursor.execute('SELECT id, value FROM data')  # 查询 id 和 value 列
     rows = cursor.fetchall()  # 获取所有行
+    has_bits = cursor.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'data_bits'").fetchone()[0]
+    if not rows and has_bits:
+        rows = fetch_packed_data(conn)
     conn.close()  # 关闭连接
+    metrics.count('sql_rows_read', len(rows))
     return rows
 
 def fetch_h_values(conn):
@@ -26,62 +43,35 @@ def fetch_h_values(conn):
     cursor = conn.cursor()
     cursor.execute('SELECT x, y FROM h_value')  # 查询 x 和 y 列
     rows = cursor.fetchall()  # 获取所有行
+    metrics.count('sql_rows_read', len(rows))
     return [(int(x), int(y)) for x, y in rows]  # 转换为整数元组
 
 def fetch_lookup_table_values(conn):
-    """ 获取 look_table 中每个桶的 value """
+    """ 获取 look_table 中每个桶的 value (按 b_index 排列的 array 列) """
     cursor = conn.cursor()
-    cursor.execute('SELECT b, value FROM look_table')  # 查询 b 和 value 列
-    rows = cursor.fetchall()  # 获取所有行
+    cursor.execute('SELECT b, value FROM look_table ORDER BY b, b_index')  # 查询 b 和 value 列
     buckets = {}
+    rows_read = 0
 
-    for b, value in rows:
-        if b not in buckets:
-            buckets[b] = []
-        buckets[b].append(value)
+    for b, value in cursor:
+        column = buckets.get(b)
+        if column is None:
+            column = buckets[b] = array('q')
+        column.append(value)
+        rows_read += 1
 
+    metrics.count('sql_rows_read', rows_read)
     return buckets  # 返回每个桶的值字典
 
 def is_square(n, p):
     """ Check if n is a quadratic residue modulo p """
     return pow(n, (p - 1) // 2, p) == 1
 
-def sha1_hash(entry):
-    """ Generate SHA-1 hash of the entry index, return as an integer """
-    hash_object = hashlib.sha1(str(entry['index']).encode())
-    hash_hex = hash_object.hexdigest()  # 获取十六进制表示
-    return int(hash_hex, 16)  # 将十六进制转换为整数
-
-def distribute_entries(entries, num_buckets):
-    """ Distribute entries into buckets using linear probing for better uniformity """
-    buckets = {i: [] for i in range(num_buckets)}  # 初始化桶
-    bucket_counts = [0] * num_buckets  # 初始化桶的计数器
-
-    for entry in entries:
-        hash_value = sha1_hash(entry)
-        bucket_index = hash_value % num_buckets  # 计算初始桶索引
-
-        while len(buckets[bucket_index]) >= (len(entries) // num_buckets) + 1:
-            bucket_index = (bucket_index + 1) % num_buckets  # 循环到下一个桶
-
-        buckets[bucket_index].append(entry)
-        bucket_counts[bucket_index] += 1  # 更新当前桶的计数
-
-    max_count = max(bucket_counts)
-    return buckets, max_count
-
-def fill_virtual_values(buckets, max_count):
-    """ 对每个桶不足最大元素的桶添加虚拟值 (id=0, value=0) """
-    for bucket in buckets.values():
-        while len(bucket) < max_count:
-            bucket.append({'index': 0, 'value': 0})  # 添加虚拟值
-
 def insert_h_values(conn, num_entries):
     """ 在椭圆曲线 P-256 上生成 h 值并插入数据库 """
-    curve = SECP256k1.curve
-    p = curve.p()
-    a = curve.a()
-    b = curve.b()
+    p = P
+    a = A
+    b = B
 
     cursor = conn.cursor()
     h_values = []
@@ -94,13 +84,13 @@ def insert_h_values(conn, num_entries):
                 h_values.append((i + 1, str(x), str(y)))
                 break
 
-    cursor.executemany('INSERT INTO h_value (id, x, y) VALUES (?, ?, ?)', h_values)
-    conn.commit()
+    with metrics.span('db_write'):
+        cursor.executemany('INSERT INTO h_value (id, x, y) VALUES (?, ?, ?)', h_values)
+    metrics.count('bytes_serialized', sum(len(x) + len(y) for _, x, y in h_values))
 
 def generate_random_value(probability=0):
     """ 生成有限域 P-256 中的随机值 """
-    curve = SECP256k1.curve
-    p = curve.p()  # 获取有限域的素数 p
+    p = P  # 获取有限域的素数 p
 
     if random.random() < probability:
         smaller_length = (len(str(p)) * 2) // 3
@@ -108,49 +98,6 @@ def generate_random_value(probability=0):
     else:
         return secrets.randbelow(p)
 
-def add_points(h1, h2, a, p):
-    """ Add two points on the elliptic curve """
-    if h1 is None or h2 is None:
-        return None
-
-    x1, y1 = h1
-    x2, y2 = h2
-
-    # 计算斜率 m
-    if h1 == h2:
-        m = (3 * x1 ** 2 + a) * mod_inverse(2 * y1, p) % p
-    else:
-        m = (y2 - y1) * mod_inverse(x2 - x1, p) % p
-
-    # 计算新点的坐标
-    x3 = (m ** 2 - x1 - x2) % p
-    y3 = (m * (x1 - x3) - y1) % p
-
-    return (x3, y3)
-
-def mod_inverse(k, p):
-    """ Calculate the modular inverse of k under modulo p """
-    return pow(k, p - 2, p)
-
-def scalar_multiply(k, h, a, p):
-    """ Perform scalar multiplication on an elliptic curve point """
-    if k == 0:
-        return None
-    if k == 1:
-        return h
-
-    R = None
-    H = h
-
-    # 使用倍加法
-    while k > 0:
-        if k % 2 == 1:
-            R = add_points(R, H, a, p) if R else H
-        H = add_points(H, H, a, p)
-        k //= 2
-
-    return R
-
 def create_tables(conn):
     """ 创建 h_value 和 look_table 数据库表 """
     cursor = conn.cursor()
@@ -180,18 +127,159 @@ def create_tables(conn):
         )
     ''')
 
-def create_lookup_table(conn, buckets):
-    """ 创建 look_table 数据库并插入分桶数据 """
-    cursor = conn.cursor()
+    # 每个桶的实际条目数; 不足 max_count 的部分是隐含的填充值 (id=0, value=0), 不写入 look_table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bucket_fill (
+            b INTEGER PRIMARY KEY,
+            fill INTEGER
+        )
+    ''')
 
-    for bucket_index, bucket in buckets.items():
-        for b_index, entry in enumerate(bucket):
-            cursor.execute('''
-                INSERT INTO look_table (b, b_index, id, value)
-                VALUES (?, ?, ?, ?)
-            ''', (bucket_index, b_index + 1, entry['index'], entry['value']))
+    # 数据全为 0/1 时, 每个桶的 value 按 b_index 顺序打包成位图
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bucket_bits (
+            b INTEGER PRIMARY KEY,
+            bits BLOB
+        )
+    ''')
 
+    # 建表进度: input 为输入数据的指纹, buckets / generators / flat / done 为已完成的阶段,
+    # digests 为已提交摘要的桶数
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS setup_progress (
+            stage TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+def input_fingerprint(existing_db_name, num_buckets):
+    """ 输入数据的指纹 (文件大小, 修改时间, 桶数), 不同时不能沿用上次的进度 """
+    stat = os.stat(existing_db_name)
+    return f'{stat.st_size}:{stat.st_mtime_ns}:{num_buckets}'
+
+def load_progress(conn):
+    """ 读取建表进度, 没有进度表时返回空字典 """
+    try:
+        return dict(conn.execute('SELECT stage, value FROM setup_progress').fetchall())
+    except sqlite3.OperationalError:
+        return {}
+
+def mark_progress(conn, stage, value='1'):
+    """ 记录一个阶段的进度; 与该阶段写入的数据在同一个事务中提交 """
+    conn.execute('INSERT OR REPLACE INTO setup_progress (stage, value) VALUES (?, ?)', (stage, str(value)))
+
+def open_checkpointed_database(db_name, fingerprint):
+    """ 打开上次中断的 look_table 数据库继续建表; 输入数据变化或没有进度时删除后重新开始; 返回 (连接, 进度) """
+    r_file = db_name + R_FILE_SUFFIX
+    if os.path.exists(db_name):
+        conn = sqlite3.connect(db_name)
+        progress = load_progress(conn)
+        if progress.get('input') == fingerprint:
+            return conn, progress
+        conn.close()
+        os.remove(db_name)  # 删除已有的数据库文件
+        print(f"Deleted existing database: {db_name}")
+    if os.path.exists(r_file):
+        os.remove(r_file)
+    conn = create_new_database(db_name)
+    create_tables(conn)  # 创建表
+    mark_progress(conn, 'input', fingerprint)
     conn.commit()
+    return conn, {'input': fingerprint}
+
+def load_or_create_r(path):
+    """ 读取上次保存的随机值 r, 没有时生成新的并先写入文件, 保证中断前后的摘要使用同一个 r """
+    if os.path.exists(path):
+        with open(path, 'r') as r_file:
+            return int(r_file.read())
+    r = generate_random_value()
+    with open(path + '.tmp', 'w') as r_file:
+        r_file.write(str(r))
+    os.replace(path + '.tmp', path)
+    return r
+
+def remove_r_file(path):
+    """ 摘要全部写入后删除 r 文件; 先用 0 覆盖内容, 不在磁盘上留下 r """
+    if not os.path.exists(path):
+        return
+    with open(path, 'r+b') as r_file:
+        r_file.write(bytes(os.path.getsize(path)))
+        r_file.flush()
+        os.fsync(r_file.fileno())
+    os.remove(path)
+
+def fetch_max_bucket_count(conn):
+    """ 由 bucket_fill 表得到最大桶容量 """
+    return conn.execute('SELECT MAX(fill) FROM bucket_fill').fetchone()[0] or 0
+
+def digest_batch(h_array, batch, values, r):
+    """ 计算一批桶的摘要 Σ value·(r·h) = r·(Σ value·h): 先做桶内多标量乘法, 每个桶只乘一次 r """
+    digests = PointArray.create(len(batch))
+    try:
+        # 填充值不参与计算; 数据量小时不启动进程池
+        cost = (scheduler.estimate_cost(sum(len(v) for v in values),
+                                        max((max(v, default=0) for v in values), default=0).bit_length())
+                + scheduler.estimate_cost(len(batch), r.bit_length()))
+        with metrics.span('aggregation'):
+            scheduler.run_tasks(digest_worker, [(i, bucket_values, h_array.handle(), digests.handle(), r)
+                                                for i, bucket_values in enumerate(values)], cost)
+        return [digests[i] for i in range(len(batch))]
+    finally:
+        digests.close()
+
+def compute_digests(conn, num_buckets, start_bucket, r):
+    """ 从 start_bucket 开始分批计算桶摘要, 每批的摘要和进度在同一个事务中提交 """
+    bucket_values = fetch_lookup_table_values(conn)
+    # h 值放在共享内存中, 工作进程只接收桶内下标和 value
+    h_array = PointArray.from_points(fetch_h_values(conn))
+    tables = None
+    try:
+        # 0/1 数据: 所有桶共用同一组 h 值, 为剩余的桶建一次子集和表, 各批之间复用
+        if all(is_binary(values) and len(values) <= h_array.count for values in bucket_values.values()):
+            bitmaps = {b: pack_bits(bucket_values.get(b, ())) for b in range(start_bucket, num_buckets)}
+            tables = subset_sum_tables(h_array, list(bitmaps.values()))
+        for batch_start in range(start_bucket, num_buckets, DIGEST_BATCH):
+            batch = range(batch_start, min(batch_start + DIGEST_BATCH, num_buckets))
+            if tables is not None:
+                results = subset_digests(tables, [bitmaps[bucket_index] for bucket_index in batch], r)
+            else:
+                values = [bucket_values.get(bucket_index, array('q')) for bucket_index in batch]
+                results = digest_batch(h_array, batch, values, r)
+
+            # 将 final_result 的 x 和 y 存储到 buck_digest 表中
+            with metrics.span('db_write'):
+                cursor = conn.cursor()
+                for bucket_index, final_result in zip(batch, results):
+                    if final_result is None:
+                        cursor.execute('INSERT INTO buck_digest (b, x, y) VALUES (?, ?, ?)', (bucket_index, None, None))
+                    else:
+                        print(f" bucket {bucket_index} digest: {final_result}")
+                        x_str, y_str = str(final_result[0]), str(final_result[1])
+                        cursor.execute('INSERT INTO buck_digest (b, x, y) VALUES (?, ?, ?)',
+                                       (bucket_index, x_str, y_str))
+                        metrics.count('bytes_serialized', len(x_str) + len(y_str))
+                mark_progress(conn, 'digests', batch.stop)
+                conn.commit()
+            print(f"Digests committed for buckets 0..{batch.stop - 1} of {num_buckets}")
+    finally:
+        if tables is not None:
+            tables.close()
+        h_array.close()
+
+def create_lookup_table(conn, buckets):
+    """ 创建 look_table 数据库并插入分桶数据 (只写实际条目) 及每个桶的填充数量 """
+    cursor = conn.cursor()
+
+    with metrics.span('db_write'):
+        cursor.executemany('''
+            INSERT INTO look_table (b, b_index, id, value)
+            VALUES (?, ?, ?, ?)
+        ''', buckets.rows())
+        cursor.executemany('INSERT INTO bucket_fill (b, fill) VALUES (?, ?)',
+                           enumerate(buckets.fill))
+        if is_binary(buckets.values):
+            cursor.executemany('INSERT INTO bucket_bits (b, bits) VALUES (?, ?)',
+                               ((b, pack_bits(buckets.bucket_values(b))) for b in range(buckets.num_buckets)))
 
 def calculate_look_table_b_size(conn):
     """计算 look_table 表中 b 和 b_index 的存储大小"""
@@ -200,140 +288,97 @@ def calculate_look_table_b_size(conn):
     b_count, b_index_count = cursor.fetchone()
     return b_count, b_index_count
 
-def process_scalar_multiplication(h_values, r, a, p):
-    """ 处理标量乘法的辅助函数 """
-    results = []
-    for h in h_values:
-        results.append(scalar_multiply(r, h, a, p))
-    return results
-
-def process_bucket_scalar_results(bucket_index, values, results, a, p):
-    """ 处理每个桶的标量乘法计算 """
-    scalar_result_list = []
-    for i, value in enumerate(values):
-        result_h = results[i % len(results)]
-        scalar_result = scalar_multiply(value, result_h, a, p)
-        if scalar_result is not None:
-            scalar_result_list.append(scalar_result)
-    return bucket_index, scalar_result_list
-def distribute_entries(entries, num_buckets):
-    """ Distribute entries into buckets using linear probing for better uniformity """
-    buckets = {i: [] for i in range(num_buckets)}  # 初始化桶
-    bucket_counts = [0] * num_buckets  # 初始化桶的计数器
-
-    for entry in entries:
-        hash_value = sha1_hash(entry)
-        bucket_index = hash_value % num_buckets  # 计算初始桶索引
-
-        while len(buckets[bucket_index]) >= (len(entries) // num_buckets) + 1:
-            bucket_index = (bucket_index + 1) % num_buckets  # 循环到下一个桶
-
-        buckets[bucket_index].append(entry)
-        bucket_counts[bucket_index] += 1  # 更新当前桶的计数
-
-    max_count = max(bucket_counts)  # 计算最大桶容量
-    return buckets, max_count
+def distribute_entries(rows, num_buckets):
+    """ 将 (index, value) 行按 blake2b 桶号分桶 (桶满时线性探测到下一个桶), 返回 (CompactBuckets, 最大桶容量) """
+    ids = array('q', [index for index, _ in rows])
+    values = array('q', [value for _, value in rows])
+    buckets = partition_entries(ids, values, num_buckets)
+    return buckets, buckets.max_count
 
 def main():
     existing_db_name = 'data.db'  # 假设已有数据库名为 data.db
     look_table_db_name = 'look_table.db'  # 创建的数据库名
-
-    # 检查并删除现有的数据库文件
-    if os.path.exists(look_table_db_name):
-        os.remove(look_table_db_name)  # 删除已有的数据库文件
-        print(f"Deleted existing database: {look_table_db_name}")
+    flat_table_name = 'look_table.flat'  # 平面文件格式的 look table
+    r_file_name = look_table_db_name + R_FILE_SUFFIX
 
     num_buckets = 13  # 设置桶的个数
 
-    # 从已有数据库中获取数据
-    data_rows = fetch_data_from_existing_db(existing_db_name)
-
-    # 将获取到的数据转化为适合分桶处理的格式
-    entries = [{'index': row[0], 'value': row[1]} for row in data_rows]
-
-    # 分桶处理并获取最大桶数量
-    buckets, max_bucket_count = distribute_entries(entries, num_buckets)
-
-    # 创建数据库并插入 h 值
-    conn = create_new_database(look_table_db_name)
-    create_tables(conn)  # 创建表
-    insert_h_values(conn, max_bucket_count)  # 生成 h 值并插入数据库
+    # 输入数据与上次相同时沿用已完成的阶段, 否则删除已有的数据库重新开始
+    conn, progress = open_checkpointed_database(look_table_db_name, input_fingerprint(existing_db_name, num_buckets))
+    if progress.get('done'):
+        print(f"Lookup table in '{look_table_db_name}' is already complete.")
+        conn.close()
+        remove_r_file(r_file_name)  # 旧版本在标记完成之后才删除 r, 中断时可能留下
+        return
+    if len(progress) > 1:
+        print(f"Resuming setup of '{look_table_db_name}': {progress}")
 
     start = time.time()
 
-    # 填充虚拟值
-    fill_virtual_values(buckets, max_bucket_count)
-
-    # 打印分桶情况
-    for bucket_index, bucket in buckets.items():
-        print(f"Bucket {bucket_index}: {[(entry['index'], entry['value']) for entry in bucket]}")
-
-    # 创建 look_table 数据库和表，并插入数据
-    create_lookup_table(conn, buckets)
-
-    # 获取 h_value 表中的数据
-    h_values = fetch_h_values(conn)
-
-    # 生成随机值 r
-    r = generate_random_value()
-
-    # 计算每个 h 值与 r 的标量乘法，使用多线程
-    curve = SECP256k1.curve
-    a = curve.a()
-    p = curve.p()
-
-    with ThreadPoolExecutor() as executor:
-        results = list(executor.submit(process_scalar_multiplication, h_values, r, a, p).result())
-
-    # 获取 look_table 中每个桶的 value
-    lookup_table_values = fetch_lookup_table_values(conn)
-
-    # 对每个桶中的 value 和生成的结果进行标量乘法，使用多线程
-    scalar_results = {}
-    with ThreadPoolExecutor() as executor:
-        futures = {executor.submit(process_bucket_scalar_results, bucket_index, values, results, a, p): bucket_index
-                   for bucket_index, values in lookup_table_values.items()}
-
-        for future in futures.keys():
-            bucket_index, scalar_result_list = future.result()
-            scalar_results[bucket_index] = scalar_result_list
-
-    # 对每个桶的所有 scalar_result 做椭圆曲线加法
-    for bucket_index, scalar_result_list in scalar_results.items():
-        if scalar_result_list:
-            final_result = scalar_result_list[0]  # 初始化为第一个结果
-            for scalar_result in scalar_result_list[1:]:
-                final_result = add_points(final_result, scalar_result, a, p)
-            print(f" bucket {bucket_index} digest: {final_result}")
-        else:
-            final_result = None
-
-        # 将 final_result 的 x 和 y 存储到 buck_digest 表中
-        cursor = conn.cursor()
-        if final_result is None:
-            cursor.execute('INSERT INTO buck_digest (b, x, y) VALUES (?, ?, ?)', (bucket_index, None, None))
-        else:
-            x_final, y_final = final_result
-            cursor.execute('INSERT INTO buck_digest (b, x, y) VALUES (?, ?, ?)',
-                           (bucket_index, str(x_final), str(y_final)))
+    # 阶段 1: 分桶并写入 look_table / bucket_fill / bucket_bits
+    if not progress.get('buckets'):
+        # 从已有数据库中获取数据
+        data_rows = fetch_data_from_existing_db(existing_db_name)
+
+        # 分桶处理并获取最大桶数量
+        with metrics.span('bucketing'):
+            buckets, max_bucket_count = distribute_entries(data_rows, num_buckets)
+
+        # 打印分桶情况 (填充值是隐含的, 不再实际存储)
+        for bucket_index in range(num_buckets):
+            ids, values = buckets.bucket(bucket_index)
+            print(f"Bucket {bucket_index}: {list(zip(ids, values))}")
+        print(f"Compact bucket storage: {buckets.nbytes()} bytes")
+
+        create_lookup_table(conn, buckets)
+        mark_progress(conn, 'buckets')
+        conn.commit()
+    max_bucket_count = fetch_max_bucket_count(conn)
+
+    # 阶段 2: 生成 h 值并插入数据库
+    if not progress.get('generators'):
+        insert_h_values(conn, max_bucket_count)
+        mark_progress(conn, 'generators')
+        conn.commit()
+
+    # 阶段 3: 分批计算桶摘要; r 先写入单独的文件, 中断后继续时使用同一个 r.
+    # 摘要都已提交时跳过, 不再读取 value 和 h 值
+    digests_done = int(progress.get('digests', 0))
+    if digests_done < num_buckets:
+        r = load_or_create_r(r_file_name)
+        compute_digests(conn, num_buckets, digests_done, r)
+        print(f"Generated random value r: {r}")
+    # 之后的阶段不再需要 r, 在标记完成之前删除
+    remove_r_file(r_file_name)
 
     # 计算耗时
     elapsed_time = (time.time() - start) * 1000
     print(f"Time taken for computation (excluding file I/O): {elapsed_time:.4f} milliseconds")
-    print(f"Generated random value r: {r}")
 
     # 计算并打印 look_table 表中 b 和 b_index 的大小
     b_count, b_index_count = calculate_look_table_b_size(conn)
     total_count = num_buckets + b_index_count
     print(f"Number of entries in 'b': {b_count}, Number of entries in 'b_index': {b_index_count}")
     print(f"The total count: {total_count}")
-    # 提交事务
-    conn.commit()
 
     print(f"Lookup table created in database '{look_table_db_name}' with bucket data.")
+    # 阶段 4: 同时导出 mmap 平面文件, 服务器优先使用
+    if not progress.get('flat'):
+        with metrics.span('db_write'):
+            export_flat_table(conn, flat_table_name)
+        mark_progress(conn, 'flat')
+        conn.commit()
+    print(f"Flat look table written to '{flat_table_name}'.")
     # 在这里打印桶的最大容量
     print(f"Maximum bucket capacity: {max_bucket_count}")
+
+    mark_progress(conn, 'done')
+    conn.commit()
     conn.close()
+    # 数据库不再修改, 生成供各角色启动时 mmap 的快照 (h 值和桶摘要)
+    build_snapshot(look_table_db_name)
+    print(f"Warm-start snapshot written to '{snapshot_path(look_table_db_name)}'.")
+    metrics.emit('setup')
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
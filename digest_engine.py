@@ -0,0 +1,49 @@
+from curve_params import N
+from ec_math import add_points, multi_scalar_multiply, wnaf_digits, wnaf_multiply
+from point_array import PointArray
+import metrics
+import scheduler
+
+R_WINDOW = 5  # r 使用的 wNAF 窗口宽度
+
+
+def bucket_inner_sum(values, h_points):
+    """ 计算桶内和 Σ value_j · h_j, 第 j 个条目对应第 j % len(h) 个 h 值 """
+    count = len(h_points)
+    return multi_scalar_multiply(values, [h_points[i % count] for i in range(len(values))])
+
+
+def bucket_digest(values, h_points, r, r_digits=None):
+    """ 由线性性 Σ value_j · (r·h_j) = r · Σ value_j · h_j, 每个桶只做一次乘 r """
+    if r_digits is None:
+        r_digits = wnaf_digits(r % N, R_WINDOW)
+    with metrics.span('aggregation'):
+        inner = bucket_inner_sum(values, h_points)
+    with metrics.span('scalar_mult'):
+        return wnaf_multiply(r_digits, inner, R_WINDOW)
+
+
+def subset_digests(tables, bitmaps, r):
+    """ 0/1 数据: 由同一组 h 值的共享子集和表 (subset_sums.SubsetSumTables) 一次求出一批桶的桶内和, 再各乘一次 r """
+    r_digits = wnaf_digits(r % N, R_WINDOW)
+    with metrics.span('aggregation'):
+        inners = tables.sums(bitmaps)
+    with metrics.span('scalar_mult'):
+        return scheduler.run_tasks(wnaf_multiply, [(r_digits, inner, R_WINDOW) for inner in inners],
+                                   scheduler.estimate_cost(len(inners), r.bit_length(), window=R_WINDOW))
+
+
+def digest_worker(bucket_index, values, h_handle, digests_handle, r):
+    """ 工作进程: 从共享内存读取 h 值, 计算桶摘要并写回共享内存中的摘要数组 """
+    h_points = PointArray.attach(h_handle)
+    digests = PointArray.attach(digests_handle)
+    digests[bucket_index] = bucket_digest(values, h_points, r)
+    return bucket_index
+
+
+def update_digest(digest, r, value, h_point):
+    """ 流式更新: 桶中新增条目 (value, h) 后的摘要为 digest + (r·value mod n)·h, 不需要重新计算整个桶 """
+    if value % N == 0:
+        return digest
+    delta = wnaf_multiply(wnaf_digits(r * value % N, R_WINDOW), h_point, R_WINDOW)
+    return add_points(digest, delta)
\ No newline at end of file
@@ -0,0 +1,43 @@
+import importlib
+import sys
+
+# 子命令 -> 依次执行 main() 的模块; 模块只在对应的子命令中导入, 其余角色的依赖不会被加载
+COMMANDS = {
+    'setup': (('set', 'database_test'), "generate data.db (set.py arguments) and build look_table.db"),
+    'client': (('client_me',), "client: offline [count] | send [index] | inprocess [index] | [index...] (file mode)"),
+    'batch': (('async_client',), "pipelined client: index... [--in-flight N] [--repeat N]"),
+    'do': (('DO',), "data owner: refill [count] | serve [tables.json] | no argument for file mode"),
+    'server': (('server_me',), "server: serve [tables.json] | no argument for file mode"),
+    'verify': (('con_me',), "verify total_result.json against the bucket digests"),
+}
+
+
+def usage():
+    lines = ["usage: python eapir.py <command> [arguments...]", "", "commands:"]
+    for name, (_, description) in COMMANDS.items():
+        lines.append(f"  {name:<8}{description}")
+    return '\n'.join(lines)
+
+
+def run(command, args):
+    """ 执行子命令: 其余参数原样交给角色脚本, 与直接运行该脚本相同 """
+    modules, _ = COMMANDS[command]
+    for i, module_name in enumerate(modules):
+        # setup 的参数只属于第一个脚本 (set.py)
+        sys.argv = [f'{module_name}.py'] + (args if i == 0 else [])
+        importlib.import_module(module_name).main()
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] in ('-h', '--help'):
+        print(usage())
+        return
+    command = sys.argv[1]
+    if command not in COMMANDS:
+        print(f"Unknown command: {command}\n\n{usage()}")
+        sys.exit(2)
+    run(command, sys.argv[2:])
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
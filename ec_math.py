@@ -0,0 +1,221 @@
+from array import array
+import metrics
+from curve_params import P, A, B
+
+
+def mod_inverse(k, p=P):
+    """ Calculate the modular inverse of k under modulo p """
+    if metrics.enabled:
+        metrics.count('field_inversion')
+    return pow(k, p - 2, p)
+
+
+def batch_mod_inverse(values, p=P):
+    """ Montgomery 技巧: 用一次模逆和约 3n 次模乘求出一组非零元素的逆 """
+    prefix = []
+    acc = 1
+    for value in values:
+        prefix.append(acc)
+        acc = acc * value % p
+    inv = mod_inverse(acc, p)
+    result = [0] * len(prefix)
+    for i in range(len(prefix) - 1, -1, -1):
+        result[i] = inv * prefix[i] % p
+        inv = inv * values[i] % p
+    return result
+
+
+def negate_point(point):
+    """ 计算椭圆曲线点的负值, 无穷远点 (None) 的负值仍为 None """
+    if point is None:
+        return None
+    x, y = point
+    return (x, -y % P)
+
+
+def add_points(h1, h2):
+    """ Add two points on the elliptic curve, None 表示无穷远点 """
+    if h1 is None:
+        return h2
+    if h2 is None:
+        return h1
+
+    x1, y1 = h1
+    x2, y2 = h2
+
+    if x1 == x2:
+        if (y1 + y2) % P == 0:  # P + (-P) = 无穷远点
+            return None
+        if metrics.enabled:
+            metrics.count('point_double')
+        m = (3 * x1 * x1 + A) * mod_inverse(2 * y1) % P
+    else:
+        if metrics.enabled:
+            metrics.count('point_add')
+        m = (y2 - y1) * mod_inverse(x2 - x1) % P
+
+    x3 = (m * m - x1 - x2) % P
+    y3 = (m * (x1 - x3) - y1) % P
+
+    return (x3, y3)
+
+
+def double_point(h):
+    """ 倍点运算 """
+    return add_points(h, h)
+
+
+def scalar_multiply(k, h):
+    """ Perform scalar multiplication on an elliptic curve point (double-and-add) """
+    R = None
+    H = h
+    while k > 0:
+        if k & 1:
+            R = add_points(R, H)
+        k >>= 1
+        if k:
+            H = add_points(H, H)
+    return R
+
+
+def wnaf_digits(k, w=5):
+    """ 计算标量 k 的宽度为 w 的 NAF 表示 (低位在前), 每个非零位为奇数且 |d| < 2^(w-1) """
+    digits = array('b')
+    full = 1 << w
+    half = 1 << (w - 1)
+    while k > 0:
+        if k & 1:
+            d = k & (full - 1)
+            if d >= half:
+                d -= full
+            k -= d
+        else:
+            d = 0
+        digits.append(d)
+        k >>= 1
+    return digits
+
+
+def odd_multiples(point, w=5):
+    """ 预计算窗口表 [P, 3P, 5P, ..., (2^(w-1) - 1)P] """
+    table = [point]
+    if w <= 2:
+        return table
+    twice = add_points(point, point)
+    for _ in range((1 << (w - 2)) - 1):
+        table.append(add_points(table[-1], twice))
+    return table
+
+
+def wnaf_multiply(digits, point, w=5, table=None):
+    """ 使用预先计算好的 wNAF 表示计算 k·P, table 可复用同一个点的窗口表 """
+    if point is None or not digits:
+        return None
+    if table is None:
+        table = odd_multiples(point, w)
+    R = None
+    for d in reversed(digits):
+        R = add_points(R, R)
+        if d > 0:
+            R = add_points(R, table[d >> 1])
+        elif d < 0:
+            R = add_points(R, negate_point(table[(-d) >> 1]))
+    return R
+
+
+def multiply_pair(digits1, digits2, point):
+    """ 共享同一条倍点链, 由低位到高位同时计算 k1·P 与 k2·P (digits 为 w=2 的 NAF) """
+    R1 = None
+    R2 = None
+    H = point
+    length = max(len(digits1), len(digits2))
+    for i in range(length):
+        d1 = digits1[i] if i < len(digits1) else 0
+        d2 = digits2[i] if i < len(digits2) else 0
+        if d1:
+            R1 = add_points(R1, H if d1 > 0 else negate_point(H))
+        if d2:
+            R2 = add_points(R2, H if d2 > 0 else negate_point(H))
+        if i + 1 < length:
+            H = add_points(H, H)
+    return R1, R2
+
+
+def sum_points(points):
+    """ 将一组点相加 """
+    total = None
+    for point in points:
+        total = add_points(total, point)
+    return total
+
+
+def batch_add_points(pairs):
+    """ 批量计算 h1 + h2: 一般情况的点加共用一次 Montgomery 批量求逆; 无穷远点、倍点和互为相反数的情况逐个处理 """
+    results = [None] * len(pairs)
+    general = []
+    denominators = []
+    for i, (h1, h2) in enumerate(pairs):
+        if h1 is None or h2 is None or h1[0] == h2[0]:
+            results[i] = add_points(h1, h2)
+        else:
+            general.append(i)
+            denominators.append(h2[0] - h1[0])
+    if not general:
+        return results
+    if metrics.enabled:
+        metrics.count('point_add', len(general))
+    for i, inv in zip(general, batch_mod_inverse(denominators)):
+        (x1, y1), (x2, y2) = pairs[i]
+        m = (y2 - y1) * inv % P
+        x3 = (m * m - x1 - x2) % P
+        results[i] = (x3, (m * (x1 - x3) - y1) % P)
+    return results
+
+
+def batch_sum_points(point_lists):
+    """ 分别求每个列表中所有点的和: 所有列表同时两两相加 (树形归约), 每一轮只做一次批量求逆 """
+    lists = [list(points) for points in point_lists]
+    while True:
+        pairs = []
+        for points in lists:
+            pairs.extend(zip(points[0::2], points[1::2]))
+        if not pairs:
+            break
+        sums = iter(batch_add_points(pairs))
+        for j, points in enumerate(lists):
+            half = len(points) // 2
+            reduced = [next(sums) for _ in range(half)]
+            if len(points) % 2:
+                reduced.append(points[-1])
+            lists[j] = reduced
+    return [points[0] if points else None for points in lists]
+
+
+def multi_scalar_multiply(scalars, points, c=None):
+    """ 多标量乘法 Σ k_i·P_i (Pippenger 桶方法), 标量全为 0/1 时退化为点加 """
+    pairs = [(k, point) for k, point in zip(scalars, points) if k and point is not None]
+    if not pairs:
+        return None
+    max_bits = max(k.bit_length() for k, _ in pairs)
+    if max_bits == 1:
+        return sum_points(point for _, point in pairs)
+    if c is None:
+        c = max(2, len(pairs).bit_length() - 2)
+    mask = (1 << c) - 1
+    result = None
+    for window in reversed(range((max_bits + c - 1) // c)):
+        for _ in range(c):
+            result = add_points(result, result)
+        buckets = [None] * (mask + 1)
+        shift = window * c
+        for k, point in pairs:
+            index = (k >> shift) & mask
+            if index:
+                buckets[index] = add_points(buckets[index], point)
+        running = None
+        window_sum = None
+        for index in range(mask, 0, -1):
+            running = add_points(running, buckets[index])
+            window_sum = add_points(window_sum, running)
+        result = add_points(result, window_sum)
+    return result
\ No newline at end of file
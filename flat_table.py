@@ -0,0 +1,254 @@
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from point_codec import POINT_SIZE, encode_point
+from point_array import PointArray
+from bitmap import WORD_BITS, WORD_BYTES
+import metrics
+
+FLAT_MAGIC = b'EFLT'
+FLAT_VERSION = 2
+# 文件头: magic, 版本, 标志位, 桶数, 每桶条目数 (max_count), h 值个数, 补齐到 64 字节
+_HEADER = struct.Struct('<4sHHIII')
+FLAG_BUCKET_BITS = 1  # 文件末尾附带每个桶的 value 位图 (数据全为 0/1 时)
+HEADER_SIZE = 64
+# 每个桶的实际条目数, 4 字节小端无符号整数; 桶内其余位置是隐含的填充值, 内容为 0
+_FILL = struct.Struct('<I')
+# look_table 记录: id, value, 均为 8 字节小端无符号整数; b_index 由记录在桶内的位置隐含
+_RECORD = struct.Struct('<QQ')
+RECORD_SIZE = _RECORD.size
+
+
+def bits_stride(max_count):
+    """ 每个桶位图的字节数, 补齐到 8 字节 """
+    return (max_count + WORD_BITS - 1) // WORD_BITS * WORD_BYTES
+
+
+def _section_offsets(num_buckets, max_count, num_h, flags=0):
+    """ 计算填充数量区、look 记录区、h 值区、桶摘要区、位图区的起始偏移和文件总长度 """
+    fill_offset = HEADER_SIZE
+    look_offset = fill_offset + (num_buckets * _FILL.size + 7) // 8 * 8
+    h_offset = look_offset + num_buckets * max_count * RECORD_SIZE
+    digest_offset = h_offset + num_h * POINT_SIZE
+    bits_offset = digest_offset + num_buckets * POINT_SIZE
+    end = bits_offset
+    if flags & FLAG_BUCKET_BITS:
+        end += num_buckets * bits_stride(max_count)
+    return fill_offset, look_offset, h_offset, digest_offset, bits_offset, end
+
+
+def _table_exists(cursor, name):
+    return cursor.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()[0] > 0
+
+
+def _fetch_bucket_fill(cursor):
+    """ 读取每个桶的实际条目数; 没有 bucket_fill 表的旧数据库按 look_table 行数统计 """
+    if _table_exists(cursor, 'bucket_fill'):
+        rows = cursor.execute('SELECT b, fill FROM bucket_fill').fetchall()
+    else:
+        rows = cursor.execute('SELECT b, COUNT(*) FROM look_table GROUP BY b').fetchall()
+    num_buckets = max((b for b, _ in rows), default=-1) + 1
+    fill = [0] * num_buckets
+    for b, count in rows:
+        fill[b] = count
+    return fill
+
+
+def export_flat_table(conn, path):
+    """ 将 SQLite 中的 look_table、h_value、buck_digest 导出为定长记录的平面文件 """
+    cursor = conn.cursor()
+    fill = _fetch_bucket_fill(cursor)
+    num_buckets = len(fill)
+    max_count = max(fill, default=0)
+    num_h = cursor.execute('SELECT COUNT(*) FROM h_value').fetchone()[0]
+    flags = 0
+    if _table_exists(cursor, 'bucket_bits') and cursor.execute('SELECT COUNT(*) FROM bucket_bits').fetchone()[0]:
+        flags |= FLAG_BUCKET_BITS
+    fill_offset, look_offset, h_offset, digest_offset, bits_offset, end = _section_offsets(
+        num_buckets, max_count, num_h, flags)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w+b') as flat_file:
+        flat_file.truncate(end)
+        with mmap.mmap(flat_file.fileno(), end) as buf:
+            buf[:_HEADER.size] = _HEADER.pack(FLAT_MAGIC, FLAT_VERSION, flags, num_buckets, max_count, num_h)
+            for b, count in enumerate(fill):
+                _FILL.pack_into(buf, fill_offset + b * _FILL.size, count)
+            for b, b_index, entry_id, value in cursor.execute(
+                    'SELECT b, b_index, id, value FROM look_table WHERE b_index <= ? ORDER BY b, b_index',
+                    (max_count,)):
+                if b_index > fill[b]:
+                    continue  # 旧数据库中的填充行
+                offset = look_offset + (b * max_count + b_index - 1) * RECORD_SIZE
+                _RECORD.pack_into(buf, offset, entry_id, value)
+            for i, (x, y) in enumerate(cursor.execute('SELECT x, y FROM h_value ORDER BY id')):
+                offset = h_offset + i * POINT_SIZE
+                buf[offset:offset + POINT_SIZE] = encode_point((int(x), int(y)))
+            for b, x, y in cursor.execute('SELECT b, x, y FROM buck_digest'):
+                point = None if x is None else (int(x), int(y))
+                offset = digest_offset + b * POINT_SIZE
+                buf[offset:offset + POINT_SIZE] = encode_point(point)
+            if flags & FLAG_BUCKET_BITS:
+                stride = bits_stride(max_count)
+                for b, bits in cursor.execute('SELECT b, bits FROM bucket_bits'):
+                    offset = bits_offset + b * stride
+                    buf[offset:offset + len(bits)] = bits
+            buf.flush()
+    os.replace(tmp_path, path)
+    metrics.count('bytes_serialized', end)
+    return end
+
+
+def import_flat_table(path, conn):
+    """ 将平面文件导入 SQLite (look_table、h_value、buck_digest) """
+    table = FlatTable(path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('CREATE TABLE IF NOT EXISTS h_value (id INTEGER PRIMARY KEY, x TEXT, y TEXT)')
+        cursor.execute('CREATE TABLE IF NOT EXISTS look_table (b INTEGER, b_index INTEGER, id INTEGER, value INTEGER)')
+        cursor.execute('CREATE TABLE IF NOT EXISTS buck_digest (b INTEGER, x TEXT, y TEXT)')
+        cursor.execute('CREATE TABLE IF NOT EXISTS bucket_fill (b INTEGER PRIMARY KEY, fill INTEGER)')
+        for b in range(table.num_buckets):
+            ids, values = table.bucket(b)
+            cursor.executemany('INSERT INTO look_table (b, b_index, id, value) VALUES (?, ?, ?, ?)',
+                               ((b, i + 1, ids[i], values[i]) for i in range(len(ids))))
+        cursor.executemany('INSERT INTO bucket_fill (b, fill) VALUES (?, ?)', enumerate(table.fill))
+        cursor.execute('CREATE TABLE IF NOT EXISTS bucket_bits (b INTEGER PRIMARY KEY, bits BLOB)')
+        if table.has_bits:
+            cursor.executemany('INSERT INTO bucket_bits (b, bits) VALUES (?, ?)',
+                               ((b, bytes(table.bucket_bits(b))) for b in range(table.num_buckets)))
+        cursor.executemany('INSERT INTO h_value (id, x, y) VALUES (?, ?, ?)',
+                           ((i + 1, str(x), str(y)) for i, (x, y) in enumerate(table.h_points())))
+        cursor.executemany('INSERT INTO buck_digest (b, x, y) VALUES (?, ?, ?)',
+                           ((b, None, None) if point is None else (b, str(point[0]), str(point[1]))
+                            for b, point in enumerate(table.digests())))
+        conn.commit()
+    finally:
+        table.close()
+
+
+class FlatTable:
+    """ 以 mmap 方式只读打开的平面 look table, 桶 b 是记录区中的一段连续切片 """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.flags, self.num_buckets, self.max_count, self.num_h = _HEADER.unpack_from(self._mmap, 0)
+        if magic != FLAT_MAGIC or version != FLAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a flat look table (version {FLAT_VERSION})")
+        fill_offset, self._look_offset, self._h_offset, self._digest_offset, self._bits_offset, end = \
+            _section_offsets(self.num_buckets, self.max_count, self.num_h, self.flags)
+        self.has_bits = bool(self.flags & FLAG_BUCKET_BITS)
+        if len(self._mmap) < end:
+            self.close()
+            raise ValueError(f"{path} is truncated")
+        self._view = memoryview(self._mmap)
+        self.fill = [count for (count,) in _FILL.iter_unpack(
+            self._view[fill_offset:fill_offset + self.num_buckets * _FILL.size])]
+        look_bytes = self._view[self._look_offset:self._h_offset]
+        if sys.byteorder == 'little':
+            self._records = look_bytes.cast('Q')
+        else:
+            records = array('Q', look_bytes)
+            records.byteswap()
+            self._records = memoryview(records)
+
+    def bucket(self, b):
+        """ 返回桶 b 中实际条目的 (id 列, value 列) 视图, 不拷贝数据; 第 i 个条目的 b_index 为 i + 1 """
+        if not 0 <= b < self.num_buckets:
+            raise IndexError(b)
+        start = b * self.max_count * 2
+        stop = start + self.fill[b] * 2
+        return self._records[start:stop:2], self._records[start + 1:stop:2]
+
+    def bucket_values(self, b):
+        """ 返回桶 b 的 value 列视图 """
+        return self.bucket(b)[1]
+
+    def bucket_bits(self, b):
+        """ 返回桶 b 的 value 位图视图 (仅当 has_bits 为真时可用) """
+        if not self.has_bits:
+            raise ValueError(f"{self.path} has no bucket bitmaps")
+        stride = bits_stride(self.max_count)
+        offset = self._bits_offset + b * stride
+        return self._view[offset:offset + stride]
+
+    def h_points(self):
+        """ 以 PointArray 形式返回 h 值, 直接引用 mmap 中的数据 """
+        return PointArray.from_buffer(self._view[self._h_offset:self._digest_offset], self.num_h)
+
+    def digests(self):
+        """ 以 PointArray 形式返回各桶摘要 """
+        end = self._digest_offset + self.num_buckets * POINT_SIZE
+        return PointArray.from_buffer(self._view[self._digest_offset:end], self.num_buckets)
+
+    def close(self):
+        """ 关闭 mmap 和文件 """
+        self._records = None
+        self._view = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # 仍有外部视图引用 mmap 时由垃圾回收释放
+            self._mmap = None
+        self._file.close()
+
+
+# 本进程中已打开的平面 look table, 按最近使用排序; 服务多个 look table 时只保留最近使用的若干个
+_opened = OrderedDict()
+_opened_lock = threading.Lock()
+MAX_OPEN_TABLES = 32
+
+
+def open_flat_table(path):
+    """ 打开 (并在本进程内缓存) 平面 look table """
+    with _opened_lock:
+        table = _opened.get(path)
+        if table is not None:
+            _opened.move_to_end(path)
+            return table
+        table = FlatTable(path)
+        _opened[path] = table
+        while len(_opened) > MAX_OPEN_TABLES:
+            _opened.popitem(last=False)[1].close()
+        return table
+
+
+def close_flat_table(path):
+    """ 关闭本进程中缓存的平面 look table (没有打开时什么也不做) """
+    with _opened_lock:
+        table = _opened.pop(path, None)
+    if table is not None:
+        table.close()
+
+
+def main():
+    """ python flat_table.py export|import [look_table.db] [look_table.flat] """
+    command = sys.argv[1] if len(sys.argv) > 1 else 'export'
+    db_name = sys.argv[2] if len(sys.argv) > 2 else 'look_table.db'
+    flat_name = sys.argv[3] if len(sys.argv) > 3 else 'look_table.flat'
+    conn = sqlite3.connect(db_name)
+    try:
+        if command == 'export':
+            size = export_flat_table(conn, flat_name)
+            print(f"Exported '{db_name}' to '{flat_name}' ({size} bytes)")
+        elif command == 'import':
+            import_flat_table(flat_name, conn)
+            print(f"Imported '{flat_name}' into '{db_name}'")
+        else:
+            print(f"Unknown command: {command}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
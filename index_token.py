@@ -0,0 +1,83 @@
+import base64
+import hashlib
+import os
+import struct
+import threading
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# 加密下标 / 桶号的二进制令牌: 版本 (1 字节) + nonce (12 字节) + AES-GCM(若干个 8 字节无符号整数) + 标签 (16 字节);
+# 一个令牌可以携带一批整数, 整批只有一个认证标签, 不再对 Fernet 令牌做第二次 base64
+TOKEN_VERSION = 1
+NONCE_SIZE = 12
+TAG_SIZE = 16
+_HEADER = struct.Struct('>B')
+_VALUE = struct.Struct('>Q')
+TOKEN_OVERHEAD = _HEADER.size + NONCE_SIZE + TAG_SIZE
+# AES 密钥由 key / key_bucket 中的 Fernet 密钥派生, 密钥文件的格式不变 (RSA.py 照常生成)
+_KDF_PERSON = b'eapir-index-tok'
+
+
+def derive_key(fernet_key):
+    """ 由 Fernet 密钥 (urlsafe base64 的 32 字节) 派生 256 位的 AES-GCM 密钥 """
+    raw = base64.urlsafe_b64decode(fernet_key.strip())
+    return hashlib.blake2b(raw, digest_size=32, person=_KDF_PERSON).digest()
+
+
+class IndexCipher:
+    """ 加密/解密一批非负整数 (查询下标或桶号) """
+
+    def __init__(self, fernet_key):
+        self._aead = AESGCM(derive_key(fernet_key))
+
+    def encrypt(self, values):
+        """ 将一批整数加密为一个令牌; 每个令牌使用新的随机 nonce """
+        header = _HEADER.pack(TOKEN_VERSION)
+        nonce = os.urandom(NONCE_SIZE)
+        payload = b''.join(_VALUE.pack(value) for value in values)
+        # 版本字节作为附加认证数据, 被篡改时解密失败
+        return header + nonce + self._aead.encrypt(nonce, payload, header)
+
+    def decrypt(self, token):
+        """ 解密令牌, 返回其中的整数列表; 令牌无效时抛出 ValueError """
+        token = bytes(token)
+        if len(token) < TOKEN_OVERHEAD or (len(token) - TOKEN_OVERHEAD) % _VALUE.size:
+            raise ValueError(f"Invalid index token length: {len(token)}")
+        (version,) = _HEADER.unpack_from(token, 0)
+        if version != TOKEN_VERSION:
+            raise ValueError(f"Unsupported index token version: {version}")
+        header = token[:_HEADER.size]
+        nonce = token[_HEADER.size:_HEADER.size + NONCE_SIZE]
+        try:
+            payload = self._aead.decrypt(nonce, token[_HEADER.size + NONCE_SIZE:], header)
+        except InvalidTag:
+            raise ValueError("Index token failed authentication") from None
+        return [value for (value,) in _VALUE.iter_unpack(payload)]
+
+    def decrypt_one(self, token):
+        """ 解密只携带一个整数的令牌 (消息模式下的单个查询) """
+        values = self.decrypt(token)
+        if len(values) != 1:
+            raise ValueError(f"Expected one value in the index token, got {len(values)}")
+        return values[0]
+
+
+def load_cipher(path):
+    """ 从密钥文件构造新的 IndexCipher """
+    with open(path, 'rb') as key_file:
+        return IndexCipher(key_file.read())
+
+
+_ciphers = {}
+_ciphers_lock = threading.Lock()
+
+
+def get_cipher(path='key'):
+    """ 返回本进程中密钥文件 path 对应的 IndexCipher, 每个密钥文件只读取并构造一次 """
+    key = os.path.abspath(path)
+    with _ciphers_lock:
+        cipher = _ciphers.get(key)
+        if cipher is None:
+            cipher = load_cipher(path)
+            _ciphers[key] = cipher
+        return cipher
\ No newline at end of file
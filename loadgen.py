@@ -0,0 +1,351 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+import transport
+from sqlite_pool import close_pool, get_pool
+from index_token import get_cipher
+from transport import MSG_DO_RESULT, MSG_SERVER_RESULT, encode_frame, decode_frame
+
+# queue 为从计划到达时间到开始处理的排队时间 (并发已满时查询在这里等待), total 为处理时间,
+# end_to_end 为从计划到达时间到验证完成的时间 (开环负载下的实际延迟, 包含排队);
+# remote 为 socket 模式下从发出查询到收到 DO 和 server 两条回复的时间
+PHASES = ('queue', 'client', 'transport', 'do', 'server', 'remote', 'verify', 'total', 'end_to_end')
+PERCENTILES = (50, 95, 99)
+
+
+def load_workload(path, rate=None, limit=None):
+    """ 读取 JSONL 工作负载, 每行 {"index": 下标, "at": 到达时间 (秒, 可选)}; 返回 ([(到达时间, 下标)], 跳过的行数) """
+    queries = []
+    skipped = 0
+    with open(path, 'r', encoding='utf-8') as workload_file:
+        for line in workload_file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+                index = int(entry['index'])
+            except (ValueError, KeyError, TypeError):
+                skipped += 1  # 不是查询请求的行
+                continue
+            queries.append((entry.get('at'), index))
+            if limit is not None and len(queries) >= limit:
+                break
+    # 没有给出到达时间的请求按 rate 均匀到达, rate 也没有时尽快发送
+    schedule = []
+    for i, (at, index) in enumerate(queries):
+        if at is None:
+            at = i / rate if rate else 0.0
+        schedule.append((float(at), index))
+    schedule.sort(key=lambda item: item[0])
+    return schedule, skipped
+
+
+def percentile(sorted_values, q):
+    """ 最近秩法计算百分位数 """
+    if not sorted_values:
+        return None
+    rank = max(1, -(-q * len(sorted_values) // 100))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies, completed, errors, wall_time):
+    """ 计算每个阶段的 p50/p95/p99 (ms) 和整体吞吐量 """
+    phases = {}
+    for phase in PHASES:
+        values = sorted(latencies.get(phase, []))
+        if not values:
+            continue
+        stats = {'count': len(values), 'mean_ms': sum(values) / len(values) * 1000, 'max_ms': values[-1] * 1000}
+        for q in PERCENTILES:
+            stats[f'p{q}_ms'] = percentile(values, q) * 1000
+        stats['throughput_qps'] = len(values) / wall_time if wall_time > 0 else None
+        phases[phase] = stats
+    return {
+        'completed': completed,
+        'errors': errors,
+        'wall_time_s': wall_time,
+        'throughput_qps': completed / wall_time if wall_time > 0 else None,
+        'phases': phases,
+    }
+
+
+def print_report(report):
+    print(f"Completed: {report['completed']}, errors: {report['errors']}, "
+          f"wall time: {report['wall_time_s']:.3f} s, throughput: {report['throughput_qps'] or 0:.3f} q/s")
+    print(f"{'phase':<10}{'count':>7}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}{'mean ms':>12}{'max ms':>12}")
+    for phase, stats in report['phases'].items():
+        print(f"{phase:<10}{stats['count']:>7}{stats['p50_ms']:>12.3f}{stats['p95_ms']:>12.3f}"
+              f"{stats['p99_ms']:>12.3f}{stats['mean_ms']:>12.3f}{stats['max_ms']:>12.3f}")
+
+
+class PoolFiles:
+    """ 压测使用的令牌池 / t 值池文件: 没有指定时放在临时目录中, 不消耗正式的预计算池, 关闭时删除 """
+
+    def __init__(self, token_pool=None, t_pool=None):
+        self._tmpdir = None
+        if token_pool is None or t_pool is None:
+            self._tmpdir = tempfile.mkdtemp(prefix='eapir-loadgen-')
+        self.token_pool = token_pool or os.path.join(self._tmpdir, 'query_tokens.bin')
+        self.t_pool = t_pool or os.path.join(self._tmpdir, 't_pool.bin')
+
+    def close(self):
+        if self._tmpdir is not None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+
+class InProcessDriver:
+    """ 在本进程中依次调用各角色的核心函数, 分别计时; 角色之间的消息经过帧编码/解码.
+    令牌和 t 值只从压测自己的池中取出, 不在后台补充, 池为空时在查询中现场计算 """
+
+    def __init__(self, db_name='look_table.db', flat_table_name='look_table.flat', max_workers=8,
+                 token_pool=None, t_pool=None):
+        import client_me
+        import DO
+        import server_me
+        from con_me import verify_result
+        from ec_math import wnaf_digits
+        self.client_me = client_me
+        self.DO = DO
+        self.server_me = server_me
+        self.verify_result = verify_result
+        self.db_name = db_name
+        self.flat_table_name = flat_table_name
+        self.max_workers = max_workers
+        self.h_points, self.digests = client_me.load_startup_state(db_name)
+        self.cipher_suite = get_cipher('key')
+        self.bucket_cipher = get_cipher('key_bucket')
+        self.r_wnaf = wnaf_digits(DO.R_VALUE, DO.R_WINDOW)
+        self.r_naf = wnaf_digits(DO.R_VALUE, 2)
+        self.pools = PoolFiles(token_pool, t_pool)
+        # 每个线程使用自己的只读 look_table 连接
+        self.pool = get_pool(db_name)
+
+    def prefill(self, count):
+        """ 在开始计时之前把令牌池和 t 值池补充到 count 个 """
+        from curve_params import A, P
+        self.client_me.refill_query_token_pool(self.pools.token_pool, self.h_points, count, A, P)
+        self.DO.refill_t_pool(self.pools.t_pool, count)
+
+    def run(self, query_id, index):
+        """ 执行一次查询, 返回 (查询到的值, {阶段: 耗时 (秒)}) """
+        timings = {}
+        conn = self.pool.connection()
+
+        start = time.perf_counter()
+        token, _ = self.client_me.pop_query_token(self.pools.token_pool, self.h_points)
+        m, message = self.client_me.build_query(self.h_points, self.cipher_suite, index, query_id, token)
+        timings['client'] = time.perf_counter() - start
+
+        wire = time.perf_counter()
+        message = decode_frame(encode_frame(message))
+        transport_time = time.perf_counter() - wire
+
+        phase_start = time.perf_counter()
+        t_entry, _ = self.DO.pop_t_value(self.pools.t_pool)
+        if t_entry is None:
+            t_entry = self.DO.precompute_t_value()
+        server_message, do_message = self.DO.answer_query(message, conn, self.cipher_suite, self.bucket_cipher,
+                                                          self.r_wnaf, self.r_naf, t_entry=t_entry)
+        timings['do'] = time.perf_counter() - phase_start
+
+        wire = time.perf_counter()
+        server_message = decode_frame(encode_frame(server_message))
+        do_message = decode_frame(encode_frame(do_message))
+        transport_time += time.perf_counter() - wire
+
+        phase_start = time.perf_counter()
+        # server 用 key_bucket 解密桶号, 与 DO 加密桶号的密钥相同
+        reply = self.server_me.answer_query(server_message, conn, self.bucket_cipher,
+                                            self.flat_table_name, self.max_workers)
+        timings['server'] = time.perf_counter() - phase_start
+
+        wire = time.perf_counter()
+        reply = decode_frame(encode_frame(reply))
+        timings['transport'] = transport_time + time.perf_counter() - wire
+
+        phase_start = time.perf_counter()
+        x = self.verify_result(m, reply.points[0], do_message.points[0], self.digests)
+        timings['verify'] = time.perf_counter() - phase_start
+        timings['total'] = time.perf_counter() - start
+        return x, timings
+
+    def close(self):
+        close_pool(self.db_name)
+        self.pools.close()
+
+
+class SocketDriver:
+    """ 向运行中的 DO / server 服务发送查询, 由后台线程按查询 id 分发回复; 令牌只从压测自己的池中取出 """
+
+    def __init__(self, db_name='look_table.db', token_pool=None):
+        import client_me
+        from con_me import verify_result
+        self.client_me = client_me
+        self.verify_result = verify_result
+        self.h_points, self.digests = client_me.load_startup_state(db_name)
+        self.cipher_suite = get_cipher('key')
+        self.pools = PoolFiles(token_pool)
+        self.mailbox = transport.listen('client')
+        self.router = transport.Router()
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def prefill(self, count):
+        """ 在开始计时之前把令牌池补充到 count 个; t 值池在运行中的 DO 那里 """
+        from curve_params import A, P
+        self.client_me.refill_query_token_pool(self.pools.token_pool, self.h_points, count, A, P)
+
+    def _collect(self):
+        while True:
+            message = self.mailbox.recv()
+            if message is None:
+                break
+            with self._pending_lock:
+                entry = self._pending.get(message.query_id)
+            if entry is None:
+                continue
+            if message.kind == MSG_SERVER_RESULT:
+                entry['total'] = message.points[0]
+            elif message.kind == MSG_DO_RESULT:
+                entry['t'] = message.points[0]
+            if 'total' in entry and 't' in entry:
+                entry['done'].set()
+
+    def run(self, query_id, index, timeout=300):
+        timings = {}
+        entry = {'done': threading.Event()}
+        with self._pending_lock:
+            self._pending[query_id] = entry
+
+        start = time.perf_counter()
+        token, _ = self.client_me.pop_query_token(self.pools.token_pool, self.h_points)
+        m, message = self.client_me.build_query(self.h_points, self.cipher_suite, index, query_id, token)
+        timings['client'] = time.perf_counter() - start
+
+        # DO 和 server 在其他进程中运行, 这里只能测量发送到收到两条回复的时间
+        phase_start = time.perf_counter()
+        with self._send_lock:
+            self.router.send('do', message)
+        finished = entry['done'].wait(timeout)
+        with self._pending_lock:
+            del self._pending[query_id]
+        if not finished:
+            raise TimeoutError(f"Query {query_id} timed out")
+        timings['remote'] = time.perf_counter() - phase_start
+
+        phase_start = time.perf_counter()
+        x = self.verify_result(m, entry['total'], entry['t'], self.digests)
+        timings['verify'] = time.perf_counter() - phase_start
+        timings['total'] = time.perf_counter() - start
+        return x, timings
+
+    def close(self):
+        self.router.close()
+        self.mailbox.close()
+        self.pools.close()
+
+
+def run_load(driver, schedule, concurrency=1):
+    """ 按到达时间发出查询 (开环), 返回 (每阶段耗时列表, 完成数, 错误数, 墙钟时间, 每个查询的结果);
+    延迟从计划到达时间算起: 并发已满时查询的排队时间计入 queue 和 end_to_end, 不会被漏掉 """
+    latencies = {}
+    results = []
+    errors = 0
+    lock = threading.Lock()
+
+    def issue(query_id, index, arrival):
+        nonlocal errors
+        queue_wait = max(0.0, time.perf_counter() - arrival)
+        try:
+            x, timings = driver.run(query_id, index)
+        except Exception as e:
+            print(f"Query {query_id} (index {index}) failed: {e}")
+            with lock:
+                errors += 1
+            return
+        timings['queue'] = queue_wait
+        timings['end_to_end'] = time.perf_counter() - arrival
+        with lock:
+            for phase, elapsed in timings.items():
+                latencies.setdefault(phase, []).append(elapsed)
+            results.append({'query_id': query_id, 'index': index, 'x': x})
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for query_id, (at, index) in enumerate(schedule, 1):
+            arrival = start + at
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(issue, query_id, index, arrival)
+    wall_time = time.perf_counter() - start
+    return latencies, len(results), errors, wall_time, results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Drive client -> DO -> server -> verify and report latencies")
+    parser.add_argument('workload', nargs='?', default='requests.jsonl',
+                        help='JSONL file with one {"index": n, "at": seconds} per line')
+    parser.add_argument('--rate', type=float, help="arrival rate (queries/s) for lines without \"at\"")
+    parser.add_argument('--mode', choices=('inprocess', 'socket'), default='inprocess')
+    parser.add_argument('--concurrency', type=int, default=1, help="queries in flight at the same time")
+    parser.add_argument('--limit', type=int, help="only run the first N queries")
+    parser.add_argument('--workers', type=int, default=8, help="server worker processes (in-process mode)")
+    parser.add_argument('--token-pool', help="query token pool to use (default: a temporary, empty pool)")
+    parser.add_argument('--t-pool', help="t value pool to use in in-process mode (default: a temporary, empty pool)")
+    parser.add_argument('--prefill', action='store_true',
+                        help="fill the pools with one entry per query before the clock starts")
+    parser.add_argument('--report', default='loadgen_report.json')
+    parser.add_argument('--db', default='look_table.db')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    schedule, skipped = load_workload(args.workload, args.rate, args.limit)
+    if skipped:
+        print(f"Skipped {skipped} lines without a query index")
+    if not schedule:
+        print(f"No queries in {args.workload}")
+        return
+    print(f"Running {len(schedule)} queries ({args.mode}, concurrency {args.concurrency})")
+
+    if args.mode == 'socket':
+        driver = SocketDriver(args.db, token_pool=args.token_pool)
+    else:
+        driver = InProcessDriver(args.db, max_workers=args.workers, token_pool=args.token_pool, t_pool=args.t_pool)
+    try:
+        if args.prefill:
+            driver.prefill(len(schedule))
+        latencies, completed, errors, wall_time, results = run_load(driver, schedule, args.concurrency)
+    finally:
+        driver.close()
+
+    report = summarize(latencies, completed, errors, wall_time)
+    report.update({'mode': args.mode, 'concurrency': args.concurrency, 'workload': args.workload,
+                   'results': sorted(results, key=lambda result: result['query_id'])})
+    if args.mode == 'inprocess':
+        cache = driver.server_me.get_bucket_cache()
+        if cache is not None:
+            report['bucket_cache'] = cache.stats()
+            print(f"Bucket cache hit rate: {cache.stats()['hit_rate']}")
+    print_report(report)
+    with open(args.report, 'w') as report_file:
+        json.dump(report, report_file, indent=4)
+    print(f"Report written to {args.report}")
+    metrics.emit('loadgen')
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
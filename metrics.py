@@ -0,0 +1,172 @@
+import json
+import os
+import sys
+import threading
+import time
+
+# 由环境变量开启: EAPIR_METRICS=json 或 EAPIR_METRICS=prom
+# 输出文件由 EAPIR_METRICS_FILE 指定, 未指定时写到 stderr
+enabled = False
+output_format = 'json'
+output_path = None
+
+_lock = threading.Lock()
+_counters = {}
+_spans = {}
+
+
+class _NullSpan:
+    """ 关闭时使用的空计时器, 不做任何事 """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """ 记录一个阶段的耗时 """
+
+    def __init__(self, name):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        with _lock:
+            stat = _spans.get(self.name)
+            if stat is None:
+                _spans[self.name] = [1, elapsed, elapsed]
+            else:
+                stat[0] += 1
+                stat[1] += elapsed
+                if elapsed > stat[2]:
+                    stat[2] = elapsed
+        return False
+
+
+def enable(fmt='json', path=None):
+    """ 开启统计并设置输出格式 (json / prom) 与输出文件 """
+    global enabled, output_format, output_path
+    if fmt not in ('json', 'prom'):
+        raise ValueError(f"Unknown metrics format: {fmt}")
+    enabled = True
+    output_format = fmt
+    output_path = path
+
+
+def disable():
+    """ 关闭统计 """
+    global enabled
+    enabled = False
+
+
+def reset():
+    """ 清空已记录的计数与耗时 """
+    with _lock:
+        _counters.clear()
+        _spans.clear()
+
+
+def span(name):
+    """ 返回一个记录阶段耗时的上下文管理器, 关闭时返回空对象 """
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def count(name, n=1):
+    """ 累加计数器 (点加、倍点、求逆、读取行数、序列化字节数等) """
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def snapshot():
+    """ 返回当前计数器和阶段耗时的拷贝 """
+    with _lock:
+        return dict(_counters), {name: list(stat) for name, stat in _spans.items()}
+
+
+def merge(counters, spans):
+    """ 合并来自其他进程的统计结果 """
+    if not enabled:
+        return
+    with _lock:
+        for name, n in counters.items():
+            _counters[name] = _counters.get(name, 0) + n
+        for name, (n, total, longest) in spans.items():
+            stat = _spans.get(name)
+            if stat is None:
+                _spans[name] = [n, total, longest]
+            else:
+                stat[0] += n
+                stat[1] += total
+                stat[2] = max(stat[2], longest)
+
+
+def format_json_lines(role):
+    """ 以 JSON lines 格式输出统计结果 """
+    counters, spans = snapshot()
+    lines = []
+    for name, (n, total, longest) in sorted(spans.items()):
+        lines.append(json.dumps({'role': role, 'type': 'span', 'name': name, 'count': n,
+                                 'total_ms': total * 1000, 'max_ms': longest * 1000}))
+    for name, n in sorted(counters.items()):
+        lines.append(json.dumps({'role': role, 'type': 'counter', 'name': name, 'value': n}))
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def format_prometheus(role):
+    """ 以 Prometheus 文本格式输出统计结果 """
+    counters, spans = snapshot()
+    lines = []
+    if spans:
+        lines.append('# TYPE eapir_span_seconds_total counter')
+        for name, (n, total, longest) in sorted(spans.items()):
+            lines.append(f'eapir_span_seconds_total{{role="{role}",span="{name}"}} {total:.9f}')
+        lines.append('# TYPE eapir_span_count counter')
+        for name, (n, total, longest) in sorted(spans.items()):
+            lines.append(f'eapir_span_count{{role="{role}",span="{name}"}} {n}')
+        lines.append('# TYPE eapir_span_max_seconds gauge')
+        for name, (n, total, longest) in sorted(spans.items()):
+            lines.append(f'eapir_span_max_seconds{{role="{role}",span="{name}"}} {longest:.9f}')
+    if counters:
+        lines.append('# TYPE eapir_ops_total counter')
+        for name, n in sorted(counters.items()):
+            lines.append(f'eapir_ops_total{{role="{role}",op="{name}"}} {n}')
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def emit(role):
+    """ 将统计结果写入输出文件 (追加) 或 stderr """
+    if not enabled:
+        return
+    if output_format == 'prom':
+        text = format_prometheus(role)
+    else:
+        text = format_json_lines(role)
+    if output_path:
+        with open(output_path, 'a') as out_file:
+            out_file.write(text)
+    else:
+        sys.stderr.write(text)
+
+
+def _configure_from_env():
+    """ 根据环境变量初始化 """
+    fmt = os.environ.get('EAPIR_METRICS')
+    if fmt:
+        enable(fmt, os.environ.get('EAPIR_METRICS_FILE'))
+
+
+_configure_from_env()
\ No newline at end of file
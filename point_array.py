@@ -0,0 +1,121 @@
+from multiprocessing import shared_memory
+from point_codec import POINT_SIZE, encode_point, decode_point
+
+# 每个进程中已经打开的共享内存, 避免同一进程对同一块共享内存重复 attach
+_attached = {}
+# 常驻工作进程会不断 attach 新的共享内存, 只保留最近使用的若干块
+MAX_ATTACHED = 16
+
+
+def _attach_shared_memory(name):
+    """ 打开已存在的共享内存 (由创建者负责 unlink) """
+    shm = _attached.pop(name, None)
+    if shm is None:
+        shm = shared_memory.SharedMemory(name=name)
+        while len(_attached) >= MAX_ATTACHED:
+            old = _attached.pop(next(iter(_attached)))
+            try:
+                old.close()
+            except BufferError:
+                pass  # 仍有视图引用时由垃圾回收释放
+    _attached[name] = shm  # 重新插入, 保持最近使用的在最后
+    return shm
+
+
+class PointArray:
+    """ 由定长 64 字节 x||y 记录组成的点数组, 可放在共享内存中供多个进程按下标读取 """
+
+    def __init__(self, buffer, count, shm=None, owner=False):
+        self.buffer = buffer
+        self.count = count
+        self.shm = shm
+        self.owner = owner
+
+    @classmethod
+    def create(cls, count, shared=True):
+        """ 新建一个 count 个点的数组, 初始均为无穷远点 """
+        if not shared:
+            return cls(memoryview(bytearray(count * POINT_SIZE)), count)
+        shm = shared_memory.SharedMemory(create=True, size=max(count * POINT_SIZE, 1))
+        return cls(shm.buf, count, shm, owner=True)
+
+    @classmethod
+    def from_points(cls, points, shared=True):
+        """ 由 (x, y) 元组列表构造点数组 """
+        points = list(points)
+        array = cls.create(len(points), shared)
+        for i, point in enumerate(points):
+            array[i] = point
+        return array
+
+    @classmethod
+    def from_buffer(cls, buffer, count=None):
+        """ 直接在已有的缓冲区 (bytes / mmap) 上构造只读视图, 不拷贝数据 """
+        view = memoryview(buffer)
+        if count is None:
+            count = len(view) // POINT_SIZE
+        return cls(view[:count * POINT_SIZE], count)
+
+    @classmethod
+    def attach(cls, handle):
+        """ 在工作进程中根据 handle 打开共享内存中的点数组 """
+        name, count = handle
+        shm = _attach_shared_memory(name)
+        return cls(shm.buf, count, shm)
+
+    def handle(self):
+        """ 返回可以跨进程传递的 (共享内存名, 点数) """
+        if self.shm is None:
+            raise ValueError("PointArray is not backed by shared memory")
+        return self.shm.name, self.count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return decode_point(self.buffer, i * POINT_SIZE)
+
+    def __setitem__(self, i, point):
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        offset = i * POINT_SIZE
+        self.buffer[offset:offset + POINT_SIZE] = encode_point(point)
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield decode_point(self.buffer, i * POINT_SIZE)
+
+    def points(self, start=0, stop=None):
+        """ 解码 [start, stop) 范围内的点 """
+        if stop is None:
+            stop = self.count
+        return [decode_point(self.buffer, i * POINT_SIZE) for i in range(start, stop)]
+
+    def tobytes(self):
+        return bytes(self.buffer[:self.count * POINT_SIZE])
+
+    def close(self):
+        """ 释放缓冲区; 创建者同时删除共享内存 """
+        self.buffer = None
+        if self.shm is not None and self.owner:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+def split_ranges(count, parts):
+    """ 将 [0, count) 尽量平均地切分为 parts 段, 返回 (start, stop) 列表 """
+    parts = max(1, min(parts, count))
+    step, extra = divmod(count, parts)
+    ranges = []
+    start = 0
+    for i in range(parts):
+        stop = start + step + (1 if i < extra else 0)
+        if stop > start:
+            ranges.append((start, stop))
+        start = stop
+    return ranges
\ No newline at end of file
@@ -0,0 +1,72 @@
+from ec_math import P, A, B
+
+POINT_SIZE = 64  # x 和 y 各 32 字节, 大端序
+SCALAR_SIZE = 32
+COMPRESSED_POINT_SIZE = 33  # 1 字节 y 的奇偶性 (0x02 / 0x03) + 32 字节 x
+
+_INFINITY = bytes(POINT_SIZE)
+_COMPRESSED_INFINITY = bytes(COMPRESSED_POINT_SIZE)
+
+
+def encode_scalar(k):
+    """ 将标量编码为 32 字节大端序 """
+    return k.to_bytes(SCALAR_SIZE, 'big')
+
+
+def decode_scalar(data, offset=0):
+    """ 从 32 字节大端序中解码标量 """
+    return int.from_bytes(data[offset:offset + SCALAR_SIZE], 'big')
+
+
+def encode_point(point):
+    """ 将椭圆曲线点编码为 64 字节 x||y, 无穷远点编码为全 0 """
+    if point is None:
+        return _INFINITY
+    x, y = point
+    return x.to_bytes(32, 'big') + y.to_bytes(32, 'big')
+
+
+def decode_point(data, offset=0):
+    """ 从 64 字节 x||y 中解码椭圆曲线点, 全 0 表示无穷远点 """
+    x = int.from_bytes(data[offset:offset + 32], 'big')
+    y = int.from_bytes(data[offset + 32:offset + POINT_SIZE], 'big')
+    if x == 0 and y == 0:
+        return None
+    return (x, y)
+
+
+def compress_point(point):
+    """ 将椭圆曲线点压缩为 33 字节 (SEC1 格式), 无穷远点编码为全 0 """
+    if point is None:
+        return _COMPRESSED_INFINITY
+    x, y = point
+    return bytes((2 | (y & 1),)) + x.to_bytes(32, 'big')
+
+
+def decompress_point(data, offset=0):
+    """ 从 33 字节压缩格式中恢复椭圆曲线点; p ≡ 3 (mod 4), 平方根为 (x^3+ax+b)^((p+1)/4) """
+    prefix = data[offset]
+    x = int.from_bytes(data[offset + 1:offset + COMPRESSED_POINT_SIZE], 'big')
+    if prefix == 0:
+        return None
+    if prefix not in (2, 3):
+        raise ValueError(f"Invalid compressed point prefix: {prefix}")
+    y_squared = (x * x * x + A * x + B) % P
+    y = pow(y_squared, (P + 1) // 4, P)
+    if y * y % P != y_squared:
+        raise ValueError("Compressed point is not on the curve")
+    if (y & 1) != (prefix & 1):
+        y = P - y
+    return (x, y)
+
+
+def encode_points(points):
+    """ 将点列表编码为连续的定长记录 """
+    return b''.join(encode_point(point) for point in points)
+
+
+def decode_points(data, count=None):
+    """ 从连续的定长记录中解码点列表 """
+    if count is None:
+        count = len(data) // POINT_SIZE
+    return [decode_point(data, i * POINT_SIZE) for i in range(count)]
\ No newline at end of file
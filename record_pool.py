@@ -0,0 +1,91 @@
+import os
+import subprocess
+import sys
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl, 池文件不加文件锁
+    fcntl = None
+
+
+class RecordPool:
+    """ 预计算随机值的池文件 (client 的查询令牌, DO 的 t 值): 文件头 + 定长记录;
+    取用和补充都在排他文件锁下进行, 多个进程可以同时使用; 文件头不一致时旧记录作废 """
+
+    def __init__(self, path, header, record_size):
+        self.path = path
+        self.header = header
+        self.record_size = record_size
+
+    def _open(self):
+        """ 打开 (必要时重建) 池文件, 返回加锁后的文件对象, 文件关闭时自动释放锁 """
+        pool_file = open(self.path, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(pool_file.fileno(), fcntl.LOCK_EX)
+        pool_file.seek(0)
+        if pool_file.read(len(self.header)) != self.header:
+            # 文件为空, 格式已变化或记录所依赖的数据已重建
+            pool_file.truncate(0)
+            pool_file.write(self.header)
+            pool_file.flush()
+        return pool_file
+
+    def count(self):
+        """ 返回池中可用的记录数 """
+        if not os.path.exists(self.path):
+            return 0
+        with self._open() as pool_file:
+            return (pool_file.seek(0, os.SEEK_END) - len(self.header)) // self.record_size
+
+    def append(self, record):
+        """ 在池尾追加一条记录 """
+        with self._open() as pool_file:
+            pool_file.seek(0, os.SEEK_END)
+            pool_file.write(record)
+
+    def pop(self):
+        """ 从池尾取出一条记录, 返回 (记录, 剩余数量); 池文件不存在时为 (None, None), 池为空时为 (None, 0) """
+        if not os.path.exists(self.path):
+            return None, None
+        with self._open() as pool_file:
+            end = pool_file.seek(0, os.SEEK_END)
+            remaining = (end - len(self.header)) // self.record_size
+            if remaining == 0:
+                return None, 0
+            offset = len(self.header) + (remaining - 1) * self.record_size
+            pool_file.seek(offset)
+            record = pool_file.read(self.record_size)
+            pool_file.truncate(offset)
+        return record, remaining - 1
+
+    def refill(self, target, generate):
+        """ 补充池直到有 target 条记录, generate() 生成一条记录; 逐条追加, 补充期间已写入的记录可随时取用 """
+        added = 0
+        while self.count() < target:
+            self.append(generate())
+            added += 1
+        return added
+
+
+def needs_refill(remaining, low_watermark):
+    """ pop 之后是否需要补充: 池文件不存在 (remaining 为 None) 或剩余记录少于 low_watermark """
+    return remaining is None or remaining < low_watermark
+
+
+# 池文件的绝对路径 -> 本进程启动的补充进程; 同一个池同时只有一个补充进程
+_refills = {}
+_refills_lock = threading.Lock()
+
+
+def refill_in_background(script, command, pool_path, target):
+    """ 启动一个独立进程 (python script command target pool_path) 补充池, 池文件不存在时由它创建;
+    本进程已为该池启动的补充进程还在运行时不再启动新的, 返回正在运行的进程 """
+    key = os.path.abspath(pool_path)
+    with _refills_lock:
+        process = _refills.get(key)
+        if process is None or process.poll() is not None:
+            process = subprocess.Popen([sys.executable, os.path.abspath(script), command, str(target), key],
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            _refills[key] = process
+        return process
\ No newline at end of file
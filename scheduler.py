@@ -0,0 +1,168 @@
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from curve_params import G, P
+import metrics
+
+# 一次点加 / 倍点 (含一次模逆) 的耗时; 导入时由 calibrate() 在本机测量, 可用 EAPIR_POINT_OP_US 固定
+POINT_OP_ENV = 'EAPIR_POINT_OP_US'
+POINT_OP_SECONDS = float(os.environ.get(POINT_OP_ENV, 100)) / 1e6
+INLINE_MAX_SECONDS = 0.01  # 估计耗时低于该值时直接在当前线程执行
+PROCESS_MIN_SECONDS = 0.2  # 估计耗时高于该值时分块交给进程池, 两者之间使用线程池
+MIN_CHUNK_SECONDS = 0.05  # 进程池中每块的最小估计耗时, 块太小时 IPC 开销占主导
+# 进程池大小, 默认为 CPU 数
+MAX_WORKERS = int(os.environ.get('EAPIR_WORKERS', 0)) or os.cpu_count() or 1
+
+_lock = threading.Lock()
+_thread_pool = None
+_process_pool = None
+
+
+def scalar_mult_ops(scalar_bits, window=2):
+    """ 一次 wNAF 标量乘法的点运算次数: 约 bits 次倍点和 bits/(w+1) 次点加 """
+    if scalar_bits <= 0:
+        return 0
+    return scalar_bits + scalar_bits // (window + 1) + (1 << max(window - 2, 0))
+
+
+def estimate_cost(num_mults=0, scalar_bits=256, num_adds=0, window=2):
+    """ 估计一批椭圆曲线运算的耗时 (秒): num_mults 次 scalar_bits 位的标量乘法加上 num_adds 次点加 """
+    return (num_mults * scalar_mult_ops(scalar_bits, window) + num_adds) * POINT_OP_SECONDS
+
+
+def calibrate(samples=64):
+    """ 测量本机一次点加 (一次模逆和三次模乘) 的耗时并更新 POINT_OP_SECONDS;
+    直接做域运算, 不计入 EC 运算计数 """
+    global POINT_OP_SECONDS
+    x, y = G
+    start = time.perf_counter()
+    for i in range(1, samples + 1):
+        m = (y + i) * pow(x + i, P - 2, P) % P
+        x3 = (m * m - x - i) % P
+        y = (m * (x - x3) - y) % P
+    POINT_OP_SECONDS = (time.perf_counter() - start) / samples
+    return POINT_OP_SECONDS
+
+
+# 估计耗时与 INLINE_MAX_SECONDS / PROCESS_MIN_SECONDS 比较, 按本机实测的点加耗时换算才有意义
+if POINT_OP_ENV not in os.environ:
+    calibrate()
+
+
+def choose_mode(cost):
+    """ 根据估计耗时选择执行方式: 'inline' / 'thread' / 'process' """
+    if cost < INLINE_MAX_SECONDS:
+        return 'inline'
+    if cost < PROCESS_MIN_SECONDS or MAX_WORKERS <= 1:
+        return 'thread'
+    return 'process'
+
+
+def plan_parts(cost, limit=None):
+    """ 计算应把一批任务切分为几块: 只有进程池才切分, 每块至少 MIN_CHUNK_SECONDS """
+    if choose_mode(cost) != 'process':
+        return 1
+    parts = min(MAX_WORKERS, max(1, int(cost / MIN_CHUNK_SECONDS)))
+    return min(parts, limit) if limit else parts
+
+
+class InlineExecutor:
+    """ 在调用线程中立即执行, 接口与 concurrent.futures 的 Executor 相同 """
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def _run_in_worker(func, args):
+    """ 在工作进程中执行任务, 同时返回这次任务产生的统计结果 """
+    if not metrics.enabled:
+        return func(*args), None
+    metrics.reset()
+    result = func(*args)
+    return result, metrics.snapshot()
+
+
+def _unwrap(outer, inner):
+    try:
+        result, snapshot = inner.result()
+    except BaseException as e:
+        outer.set_exception(e)
+        return
+    if snapshot is not None:
+        metrics.merge(*snapshot)  # 工作进程中的点运算计数合并到本进程
+    outer.set_result(result)
+
+
+class ProcessExecutor:
+    """ 包装常驻进程池: 任务结果返回时合并工作进程的统计结果 """
+
+    def __init__(self, pool):
+        self._pool = pool
+
+    def submit(self, func, *args):
+        outer = Future()
+        inner = self._pool.submit(_run_in_worker, func, args)
+        inner.add_done_callback(lambda future: _unwrap(outer, future))
+        return outer
+
+    def shutdown(self, wait=True):
+        pass  # 进程池常驻, 由 shutdown() 在退出时关闭
+
+
+_INLINE = InlineExecutor()
+
+
+def get_executor(mode):
+    """ 返回对应执行方式的执行器; 线程池和进程池在第一次使用时创建, 之后一直保持 """
+    global _thread_pool, _process_pool
+    if mode == 'inline':
+        return _INLINE
+    with _lock:
+        if mode == 'thread':
+            if _thread_pool is None:
+                _thread_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+            return _thread_pool
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+        return ProcessExecutor(_process_pool)
+
+
+def executor_for(cost):
+    """ 按估计耗时返回执行器 """
+    return get_executor(choose_mode(cost))
+
+
+def run_tasks(func, arg_list, cost):
+    """ 以 func(*args) 执行每一组参数, 按顺序返回结果; 执行方式由整批任务的估计耗时决定 """
+    mode = choose_mode(cost)
+    metrics.count(f'scheduler_{mode}')
+    if mode == 'inline' or (len(arg_list) <= 1 and mode == 'thread'):
+        return [func(*args) for args in arg_list]
+    executor = get_executor(mode)
+    futures = [executor.submit(func, *args) for args in arg_list]
+    return [future.result() for future in futures]
+
+
+def shutdown():
+    """ 关闭常驻的线程池和进程池 """
+    global _thread_pool, _process_pool
+    with _lock:
+        if _process_pool is not None:
+            _process_pool.shutdown()
+            _process_pool = None
+        if _thread_pool is not None:
+            _thread_pool.shutdown()
+            _thread_pool = None
+
+
+atexit.register(shutdown)
\ No newline at end of file
@@ -1,18 +1,53 @@
 import sqlite3
-from cryptography.fernet import Fernet
-from ecdsa import SECP256k1
-import concurrent.futures
 import json  # 导入 json 模块
+import os
+import sys
 import time
+import metrics
+from point_array import PointArray, split_ranges
+from flat_table import close_flat_table, open_flat_table
+from bitmap import WORD_BITS, count_set_bits, iter_set_bits
+from bucket_cache import NAF_WINDOW, cache_from_env, decode_bucket
+from ec_math import add_points, scalar_multiply, sum_points, wnaf_multiply
+import scheduler
+from sqlite_pool import BUCKET_BITS_SQL, BUCKET_VALUES_SQL, close_pool, get_pool, readonly_connection
+from index_token import get_cipher
+from tenant_registry import DEFAULT_TABLE, TenantRegistry, load_registry_file
+import transport
+from transport import MSG_SERVER_QUERY, MSG_SERVER_RESULT, make_message, message_table
+
+# 解码后的热点桶缓存, 第一次使用时按环境变量创建
+_bucket_cache = None
+_bucket_cache_loaded = False
+
+
+def fetch_query_count(conn):
+    """ 返回每个查询的 query 点数 (即 h_m 的行数); DO 按查询依次写入, 第 k 个查询的 b_index = i 在 id = kN + i """
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*) FROM h_m')
+    count = cursor.fetchone()[0]
+    cursor.close()
+    return count
 
 
-def fetch_query_data(conn):
-    """ 从 query 表中获取所有数据 """
+def fetch_query_points(conn, indices, count, offset=0):
+    """ 只读取 indices 中引用到的 query 点 (一次按主键的批量查询), 每个点只解码一次;
+    b_index 对应 query 表中 id 为 offset + b_index 的行 (offset 为该查询所在块的起点);
+    返回 count 个点的共享内存数组, 未引用的位置为无穷远点 """
+    query_points = PointArray.create(count)
+    ids = sorted(set(offset + b_index for b_index in indices))
+    if not ids:
+        return query_points
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM query')
-    query_data = cursor.fetchall()  # 获取所有行
+    cursor.execute('SELECT id, x_result, y_result FROM query WHERE id IN (SELECT value FROM json_each(?))',
+                   (json.dumps(ids),))
+    rows = 0
+    for query_id, x_result, y_result in cursor:
+        query_points[query_id - offset - 1] = (int(x_result), int(y_result))
+        rows += 1
     cursor.close()
-    return query_data
+    metrics.count('sql_rows_read', rows)
+    return query_points
 
 
 def fetch_do_pk_data(conn):
@@ -21,71 +56,206 @@ def fetch_do_pk_data(conn):
     cursor.execute('SELECT * FROM do_pk')
     do_pk_data = cursor.fetchall()  # 获取所有行
     cursor.close()
+    metrics.count('sql_rows_read', len(do_pk_data))
     return do_pk_data
 
 
-def load_key_from_file(filename='key_bucket'):
-    """ 从密钥文件中加载密钥 """
-    with open(filename, 'rb') as key_file:
-        return key_file.read()  # 返回密钥字节
-
-
-def decrypt_data(cipher_suite, encrypted_data):
-    """ 解密数据 """
-    decrypted_data = cipher_suite.decrypt(encrypted_data)
-    return decrypted_data.decode()
-
-
 def fetch_look_table_values(conn, num):
     """ 从 look_table 表中获取 b = num 的所有 b_index 和 value 值 """
     cursor = conn.cursor()
-    cursor.execute('SELECT b_index, value FROM look_table WHERE b = ?', (num,))
+    cursor.execute(BUCKET_VALUES_SQL, (num,))
     values = cursor.fetchall()  # 获取所有匹配的记录
     cursor.close()
+    metrics.count('sql_rows_read', len(values))
     return [(value[0], value[1]) for value in values]  # 返回 (b_index, value) 的元组列表
 
 
-def add_points(h1, h2, a, p):
-    """ Add two points on the elliptic curve """
-    x1, y1 = h1
-    x2, y2 = h2
-
-    if h1 == h2:  # Doubling case
-        m = (3 * x1 ** 2 + a) * mod_inverse(2 * y1, p) % p
-    else:  # Addition case
-        m = (y2 - y1) * mod_inverse(x2 - x1, p) % p
-
-    x3 = (m ** 2 - x1 - x2) % p
-    y3 = (m * (x1 - x3) - y1) % p
-
-    return (x3, y3)
-
-
-def mod_inverse(k, p):
-    """ Calculate the modular inverse of k under modulo p """
-    return pow(k, p - 2, p)  # Fermat's little theorem
-
-
-def scalar_multiply(k, h, curve):
-    """ Perform scalar multiplication on an elliptic curve point """
-    if k == 0:
-        return None  # Point at infinity (无穷远点)
-    if k == 1:
-        return h  # Return the point itself
-
-    R = None  # Initialize result as the point at infinity
-    H = h  # Current point
-
-    while k > 0:
-        if k % 2 == 1:  # If the current bit is 1
-            if R is None:
-                R = H  # First addition
+def fetch_bucket_bits(conn, num):
+    """ 从 bucket_bits 表中获取桶 num 的 value 位图, 没有位图时返回 None """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(BUCKET_BITS_SQL, (num,))
+    except sqlite3.OperationalError:
+        return None  # 旧数据库没有 bucket_bits 表
+    row = cursor.fetchone()
+    cursor.close()
+    metrics.count('sql_rows_read', 1 if row else 0)
+    return row[0] if row else None
+
+
+def get_bucket_cache():
+    """ 返回本进程的桶缓存 (EAPIR_BUCKET_CACHE_MB 为 0 时为 None) """
+    global _bucket_cache, _bucket_cache_loaded
+    if not _bucket_cache_loaded:
+        _bucket_cache = cache_from_env()
+        _bucket_cache_loaded = True
+    return _bucket_cache
+
+
+def load_bucket(conn, num):
+    """ 从 SQLite 读取桶 num 并解码: 有位图时使用位图, 否则读取 look_table 中的 value """
+    bits = fetch_bucket_bits(conn, num)
+    if bits is not None:
+        return decode_bucket(bits=bits)
+    return decode_bucket(fetch_look_table_values(conn, num))
+
+
+def aggregate_bucket_range(query_handle, entries):
+    """ 工作进程: 从共享内存中读取 query 点, 计算 Σ value·Q_{b_index} 的部分和 """
+    query_points = PointArray.attach(query_handle)
+    total_result = None
+    for b_index, k in entries:
+        total_result = add_points(total_result, scalar_multiply(k, query_points[b_index - 1]))
+    return total_result
+
+def aggregate_naf_range(query_handle, entries):
+    """ 工作进程: entries 为 (b_index, NAF(value)), 使用预先计算好的 NAF 表示计算部分和 """
+    query_points = PointArray.attach(query_handle)
+    total_result = None
+    for b_index, digits in entries:
+        total_result = add_points(total_result, wnaf_multiply(digits, query_points[b_index - 1], NAF_WINDOW))
+    return total_result
+
+def sum_partial_results(results):
+    """ 将各任务返回的部分和相加, None 表示无穷远点 """
+    return sum_points(results)
+
+def aggregate_bitmap_range(query_handle, bits, start_word, stop_word):
+    """ 工作进程: 按 64 位字遍历位图, 只累加位为 1 的条目对应的 query 点 """
+    query_points = PointArray.attach(query_handle)
+    query_count = query_points.count
+    total_result = None
+    for i in iter_set_bits(bits, start_word, stop_word):
+        if i >= query_count:
+            break
+        total_result = add_points(total_result, query_points[i])
+    return total_result
+
+def aggregate_flat_bits_range(query_handle, flat_path, num, start_word, stop_word):
+    """ 工作进程: 直接使用 mmap 平面文件中桶 num 的位图计算部分和 """
+    bits = open_flat_table(flat_path).bucket_bits(num)
+    return aggregate_bitmap_range(query_handle, bits, start_word, stop_word)
+
+def open_query_bucket(num, conn_look_table, flat_table_name, cache=None):
+    """ 打开桶 num: 有平面文件时返回 (平面文件, None), 否则返回 (None, 解码后的桶); SQLite 中的桶解码后放入 cache """
+    flat_table = open_flat_table(flat_table_name) if os.path.exists(flat_table_name) else None
+    bucket = None
+    with metrics.span('lookup'):
+        if flat_table is None:
+            # 平面文件本身不需要解码, 不经过缓存
+            if cache is not None:
+                # 多个 look table 共用一个缓存, 以 (平面文件路径, 桶号) 区分
+                bucket = cache.get_or_load((flat_table_name, num), lambda: load_bucket(conn_look_table, num))
             else:
-                R = add_points(R, H, curve.a(), curve.p())
-        H = add_points(H, H, curve.a(), curve.p())  # Double the point
-        k //= 2  # Shift right
-
-    return R
+                bucket = load_bucket(conn_look_table, num)
+    print(f"Values from look_table where b = {num}:")
+    return flat_table, bucket
+
+def bucket_query_indices(num, flat_table, bucket):
+    """ 返回桶 num 中 value 非零的条目的 b_index, 即聚合时需要的 query 点 """
+    if flat_table is not None and flat_table.has_bits:
+        return [i + 1 for i in iter_set_bits(flat_table.bucket_bits(num))]
+    if flat_table is not None:
+        return [i + 1 for i, value in enumerate(flat_table.bucket_values(num)) if value]
+    if bucket.bits is not None:
+        return [i + 1 for i in iter_set_bits(bucket.bits)]
+    return [b_index for b_index, digits in zip(bucket.indices, bucket.digits) if digits is not None]
+
+def aggregate_query_bucket(num, query_points, conn_look_table, flat_table_name, max_workers, cache=None, opened=None):
+    """ 计算桶 num 的 Σ value·Q_{b_index}; 优先使用平面文件, 0/1 数据使用位图; opened 为 open_query_bucket 的结果 """
+    if opened is None:
+        opened = open_query_bucket(num, conn_look_table, flat_table_name, cache)
+    flat_table, bucket = opened
+    handle = query_points.handle()
+
+    # 先按桶中非零条目的个数和 value 的位数估计耗时, 再由 scheduler 决定在本线程、线程池还是进程池中执行
+    with metrics.span('aggregation'):
+        if flat_table is not None and flat_table.has_bits:
+            # 平面文件中的位图, 工作进程只接收字下标范围
+            num_words = (flat_table.fill[num] + WORD_BITS - 1) // WORD_BITS
+            cost = scheduler.estimate_cost(num_adds=count_set_bits(flat_table.bucket_bits(num)))
+            args = [(handle, flat_table_name, num, start, stop)
+                    for start, stop in split_ranges(num_words, scheduler.plan_parts(cost, max_workers))]
+            results = scheduler.run_tasks(aggregate_flat_bits_range, args, cost)
+        elif flat_table is not None:
+            # 平面文件中桶 num 是一段连续切片, 工作进程只接收下标范围
+            bucket_size = flat_table.fill[num]
+            values = [value for value in flat_table.bucket_values(num) if value]
+            cost = scheduler.estimate_cost(len(values), max(values, default=0).bit_length())
+            args = [(handle, flat_table_name, num, start, stop)
+                    for start, stop in split_ranges(bucket_size, scheduler.plan_parts(cost, max_workers))]
+            results = scheduler.run_tasks(aggregate_flat_range, args, cost)
+        elif bucket.bits is not None:
+            num_words = len(bucket.bits) // 8
+            cost = scheduler.estimate_cost(num_adds=count_set_bits(bucket.bits))
+            args = [(handle, bucket.bits, start, stop)
+                    for start, stop in split_ranges(num_words, scheduler.plan_parts(cost, max_workers))]
+            results = scheduler.run_tasks(aggregate_bitmap_range, args, cost)
+        else:
+            # 只保留有对应 query 数据且 value 非零的条目
+            entries = [(b_index, digits) for b_index, digits in zip(bucket.indices, bucket.digits)
+                       if digits is not None and b_index <= len(query_points)]
+            cost = scheduler.estimate_cost(len(entries), max((len(digits) for _, digits in entries), default=0),
+                                           window=NAF_WINDOW)
+
+            # 每一块处理一段条目并返回部分和
+            args = [(handle, entries[start:stop])
+                    for start, stop in split_ranges(len(entries), scheduler.plan_parts(cost, max_workers))]
+            results = scheduler.run_tasks(aggregate_naf_range, args, cost)
+        return sum_partial_results(results)
+
+def aggregate_flat_range(query_handle, flat_path, num, start, stop):
+    """ 工作进程: 直接从 mmap 的平面 look table 中读取桶 num 的 [start, stop) 条目并计算部分和 """
+    values = open_flat_table(flat_path).bucket_values(num)[start:stop]
+    query_count = PointArray.attach(query_handle).count
+    entries = [(start + i + 1, value) for i, value in enumerate(values)
+               if value and start + i + 1 <= query_count]
+    return aggregate_bucket_range(query_handle, entries)
+
+def answer_query(message, conn_look_table, cipher_suite, flat_table_name='look_table.flat', max_workers=8):
+    """ 处理 DO 转发的查询消息, 返回发给 client 的 total_result 消息 """
+    with metrics.span('decrypt'):
+        num = cipher_suite.decrypt_one(message.tokens[0])
+    query_points = PointArray.from_points(message.points)
+    try:
+        total_result = aggregate_query_bucket(num, query_points, conn_look_table, flat_table_name,
+                                              max_workers, get_bucket_cache())
+    finally:
+        query_points.close()
+    return make_message(MSG_SERVER_RESULT, message.query_id, points=[total_result])
+
+def answer_tenant_query(message, registry, max_workers=8):
+    """ 多 look table 模式: 按消息中的名称找到对应的 look table (按需加载) 后处理查询 """
+    with registry.use(message_table(message, DEFAULT_TABLE)) as tenant:
+        return answer_query(message, tenant.pool.connection(), tenant.cipher_suite, tenant.flat_path, max_workers)
+
+def serve(mailbox, router, look_table_db_name='look_table.db', flat_table_name='look_table.flat', max_workers=8,
+          registry=None):
+    """ 消息模式: 从信箱中接收 DO 转发的查询, 将 total_result 发给 client, 信箱关闭时返回;
+    给出 registry 时按查询中的名称路由到多个 look table """
+    if registry is None:
+        cipher_suite = get_cipher('key_bucket')
+        # look_table 建表后不再修改, 使用只读连接池, 每个线程一个连接
+        pool = get_pool(look_table_db_name)
+    try:
+        while True:
+            message = mailbox.recv()
+            if message is None:
+                break
+            if message.kind != MSG_SERVER_QUERY:
+                continue
+            try:
+                if registry is not None:
+                    reply = answer_tenant_query(message, registry, max_workers)
+                else:
+                    reply = answer_query(message, pool.connection(), cipher_suite, flat_table_name, max_workers)
+                router.send('client', reply)
+            except Exception as e:
+                print(f"Query {message.query_id} failed: {e}")
+    finally:
+        # registry 的连接池由 registry.close() 关闭
+        if registry is None:
+            close_pool(look_table_db_name)
 
 def fetch_data_from_db(query_db_name):
     """ 从数据库中获取数据并计算通信量 """
@@ -94,6 +264,7 @@ def fetch_data_from_db(query_db_name):
 
     cursor.execute('SELECT x_result,y_result FROM h_m')  # 查询数据
     rows = cursor.fetchall()  # 获取所有行
+    metrics.count('sql_rows_read', len(rows))
 
     # 计算获取的数据大小，跳过包含 None 的行
     total_size = sum(
@@ -104,18 +275,39 @@ def fetch_data_from_db(query_db_name):
     return total_size
 
 def main():
-    # 加载密钥
-    key = load_key_from_file()
-    cipher_suite = Fernet(key)
+    # 消息模式: python server_me.py serve [tables.json], 在本地 socket 上接收 DO 转发的查询;
+    # 给出 tables.json 时同一个进程服务其中登记的所有 look table
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        registry = None
+        if len(sys.argv) > 2:
+            registry = TenantRegistry(load_registry_file(sys.argv[2]), cache=get_bucket_cache())
+            print(f"Serving look tables: {', '.join(registry.names())}")
+        mailbox = transport.listen('server')
+        router = transport.Router()
+        print(f"Server listening on {mailbox.address}")
+        try:
+            serve(mailbox, router, registry=registry)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            mailbox.close()
+            router.close()
+            cache = get_bucket_cache()
+            if cache is not None:
+                print(f"Bucket cache: {cache.stats()}")
+            if registry is not None:
+                print(f"Look tables: {registry.stats()}")
+                registry.close()
+            metrics.emit('server')
+        return
 
-    # 椭圆曲线参数
-    curve = SECP256k1.curve
-    p = curve.p()  # 获取有限域的素数 p
-    a = curve.a()
+    # 加载密钥
+    cipher_suite = get_cipher('key_bucket')
 
     # 连接到 query 数据库
     query_db_name = 'h_m.db'
     look_table_db_name = 'look_table.db'  # look_table 数据库名称
+    flat_table_name = 'look_table.flat'  # 存在时优先使用 mmap 平面文件
     total_size = fetch_data_from_db(query_db_name)
     print(f"查询query通信：{total_size}")
     # 用户输入线程数量
@@ -126,76 +318,48 @@ def main():
     try:
         # 连接到 query 数据库
         conn_query = sqlite3.connect(query_db_name)
-        # 连接到 look_table 数据库
-        conn_look_table = sqlite3.connect(look_table_db_name)
-
-        # 获取 query 表的数据·
-        query_data = fetch_query_data(conn_query)
-
-        # for row in query_data:
-            # print(f"id: {row[0]},x_result: {row[1]},y_result: {row[2]}")  # 打印 x_result
+        # 连接到 look_table 数据库 (只读)
+        conn_look_table = readonly_connection(look_table_db_name)
 
+        # 每个查询的 query 点数; 点在确定桶之后按需读取
+        query_count = fetch_query_count(conn_query)
 
         # 获取 do_pk 表的数据
         do_pk_data = fetch_do_pk_data(conn_query)
 
         start = time.time()
+        results_for_json = []  # 每个桶一项, 顺序与 DO 的 results.json 相同
+        block = 0  # 当前桶对应 query 表中的第几块
         for row in do_pk_data:
-            # 解密数据
-            encrypted_data = row[1].encode()  # 假设加密数据在第二列
-            decrypted_data = decrypt_data(cipher_suite, encrypted_data)
-            num = int(decrypted_data)
-
-
-            look_table_values = fetch_look_table_values(conn_look_table, num)
-            print(f"Values from look_table where b = {num}:")
-
-            results = []  # 用于存储所有计算的结果
-
-            # 使用 ThreadPoolExecutor 进行并行计算
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                futures = []
-                for b_index, value in look_table_values:
-
-                    # print(f"b_index={b_index}, value={value}")  # 按照要求格式输出
-
-                    # 进行椭圆曲线标量乘法
-                    if b_index <= len(query_data):  # 确保有对应的 query 数据
-                        query_value = int(query_data[b_index - 1][1])  # 获取对应的 query 值并转换为整数
-                        y_result = int(query_data[b_index - 1][2])  # 获取对应的 y_result 值并转换为整数
-                        point = (query_value, y_result)  # 椭圆曲线上的点
-                        k = int(value)  # 将 value 作为标量并转换为整数
-
-                        # 提交标量乘法任务
-                        futures.append(executor.submit(scalar_multiply, k, point, curve))
-
-                # 处理每个任务的结果
-                total_result = None
-                for future in concurrent.futures.as_completed(futures):
-                    res = future.result()
-                    if res is not None:  # 检查 res 是否为 None
-                        if total_result is None:
-                            total_result = res  # 第一个有效结果赋值给 total_result
-                        else:
-                            # 将 total_result 和 res 转换为整数进行加法操作
-                            total_result = add_points(
-                                (int(total_result[0]), int(total_result[1])),
-                                (int(res[0]), int(res[1])),
-                                a, p
-                            )
+            # 解密数据: 一个令牌携带 DO 这一批查询的所有桶号
+            with metrics.span('decrypt'):
+                nums = cipher_suite.decrypt(row[1])  # 加密数据在第二列
+            for num in nums:
+                opened = open_query_bucket(num, conn_look_table, flat_table_name, get_bucket_cache())
+                # 每个查询都有 DO 单独重随机化的 query 点, 各桶之间没有共用的点, 只能逐桶聚合:
+                # 只读取并解码本查询那一块中桶 num 引用到的点, 解码后放入共享内存, 工作进程按下标读取
+                indices = [b_index for b_index in bucket_query_indices(num, *opened) if b_index <= query_count]
+                with metrics.span('lookup'):
+                    query_points = fetch_query_points(conn_query, indices, query_count, block * query_count)
+                block += 1
+                try:
+                    # 使用 ProcessPoolExecutor 进行并行计算
+                    total_result = aggregate_query_bucket(num, query_points, conn_look_table, flat_table_name,
+                                                          max_workers, opened=opened)
+                finally:
+                    query_points.close()
 
                 print(f"total_result: {total_result}")
-
-
-
-                # 将最终结果写入 JSON 文件
-                with open('total_result_me.json', 'w') as json_file:
-                    json.dump({'total_result_me': total_result}, json_file)
+                results_for_json.append({'total_result_me': total_result})
                 # 计算耗时
                 elapsed_time = (time.time() - start) * 1000
                 print(f"Time taken for computation (excluding file I/O): {elapsed_time:.4f} seconds")
 
-            conn_look_table.close()  # 关闭 look_table 数据库连接
+        # 将所有桶的结果写入 JSON 文件
+        text = json.dumps(results_for_json)
+        with metrics.span('db_write'), open('total_result_me.json', 'w') as json_file:
+            json_file.write(text)
+        metrics.count('bytes_serialized', len(text))
 
     except sqlite3.Error as e:
         print(f"SQLite error: {e}")
@@ -205,6 +369,8 @@ def main():
     finally:
         if conn_query:
             conn_query.close()  # 关闭 query 数据库连接
+        close_pool(look_table_db_name)
+        metrics.emit('server')
 
 
 if __name__ == '__main__':
@@ -1,10 +1,20 @@
+import argparse
 import math
 import sqlite3
 import random
 import os
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.asymmetric import ec
-from ecdsa import SECP256k1
+import re
+import metrics
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from bitmap import WORD_BITS, WORD_BYTES, unpack_bits
+from curve_params import P, A, B
+
+
+DATA_CHUNK_BITS = 8 * 4096  # data_bits 表中每行位图包含的值个数
+ENTRY_BYTES = 8  # data 表中每个值按 8 字节计算数据集大小
+SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+MAX_DOMAIN = 2 ** 63  # 值以有符号 64 位整数存储 (array('q'), 平面文件的 <QQ 记录), 最大为 2^63 - 1
+CHUNKS_PER_WORKER = 2  # 每个工作进程同时在途的块数
 
 
 def is_square(n, p):
@@ -34,34 +44,137 @@ def create_tables(conn):
             y TEXT NOT NULL
         )
     ''')
+    # 0/1 数据的位图存储: 第 chunk 行保存 id 为 chunk*DATA_CHUNK_BITS+1 起的 count 个值
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_bits (
+            chunk INTEGER PRIMARY KEY,
+            count INTEGER NOT NULL,
+            bits BLOB NOT NULL
+        )
+    ''')
     conn.commit()
 
 
-# 插入随机数据到第一个数据库
-def insert_random_data(conn, num_entries):
+# 读取位图形式的数据, 返回 (id, value) 列表
+def fetch_packed_data(conn):
     cursor = conn.cursor()
-    for _ in range(num_entries):
-        value = random.randint(0, 1)  # 生成0或1
-        cursor.execute('INSERT INTO data (value) VALUES (?)', (value,))
-    conn.commit()
-
-
-# 生成椭圆曲线P-256上的随机点并插入到h_value表
-def insert_h_value(conn, num_entries):
-    curve = SECP256k1.curve
-    p = curve.p()
-    a = curve.a()
-    b = curve.b()
-
+    cursor.execute('SELECT chunk, count, bits FROM data_bits ORDER BY chunk')
+    rows = []
+    for chunk, count, bits in cursor:
+        base = chunk * DATA_CHUNK_BITS + 1
+        rows.extend((base + i, value) for i, value in enumerate(unpack_bits(bits, count)))
+    return rows
+
+
+def parse_size(text):
+    """ 解析 '8KiB' / '64MiB' / '1GiB' / '4096' 形式的数据集大小, 返回字节数 """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmg]?)(?:i?b)?\s*', text, re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"Invalid size: {text}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+
+def parse_domain(text):
+    """ 解析 --domain: 值取自 [0, domain), 必须能以有符号 64 位整数存储 """
+    domain = int(text)
+    if not 1 <= domain <= MAX_DOMAIN:
+        raise argparse.ArgumentTypeError(f"domain must be between 1 and 2**63, got {domain}")
+    return domain
+
+
+def entries_for_size(size, packed):
+    """ 由目标大小计算条目数: data 表每个值 8 字节, 位图每个值 1 位 """
+    if packed:
+        return size * 8
+    return math.ceil(size / ENTRY_BYTES)
+
+
+def chunk_rng(seed, chunk, stream=0):
+    """ 每个块使用独立的随机数生成器, 输出只由 (seed, 块号) 决定, 与进程数无关 """
+    return random.Random((seed << 40) ^ (stream << 32) ^ chunk)
+
+
+def generate_value_chunk(seed, chunk, count, domain, packed):
+    """ 工作进程: 生成第 chunk 块的 count 个值, packed 时直接返回位图 """
+    rng = chunk_rng(seed, chunk)
+    if domain == 2:
+        # 0/1 数据直接取随机位, 行存储和位图存储得到相同的值
+        num_words = (count + WORD_BITS - 1) // WORD_BITS
+        bits = rng.getrandbits(count).to_bytes(num_words * WORD_BYTES, 'little') if count else b''
+        if packed:
+            return chunk, count, bits
+        return chunk, count, unpack_bits(bits, count)
+    return chunk, count, [rng.randrange(domain) for _ in range(count)]
+
+
+def bounded_map(executor, fn, arg_tuples, window):
+    """ 最多 window 个任务同时在途, 按完成顺序产生 fn(*args) 的结果; 内存只与 window 有关, 与任务总数无关 """
+    pending = set()
+    for args in arg_tuples:
+        if len(pending) >= window:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        pending.add(executor.submit(fn, *args))
+    for future in as_completed(pending):
+        yield future.result()
+
+
+def chunk_window(workers):
+    """ 同时在途的块数: 每个工作进程 CHUNKS_PER_WORKER 块 """
+    return CHUNKS_PER_WORKER * (workers or os.cpu_count() or 1)
+
+
+def generate_dataset(conn, num_entries, domain=2, seed=0, workers=None, packed=False):
+    """ 按 DATA_CHUNK_BITS 分块并行生成数据, 每块生成后由主进程立即写入 data 或 data_bits;
+    各块的 id 由块号决定, 写入顺序不影响结果 """
+    if packed and domain != 2:
+        raise ValueError("Packed output requires a 0/1 value domain")
+    if not 1 <= domain <= MAX_DOMAIN:
+        raise ValueError(f"Value domain must be between 1 and 2**63, got {domain}")
     cursor = conn.cursor()
-    for i in range(num_entries):
+    chunks = ((seed, chunk, min(DATA_CHUNK_BITS, num_entries - start), domain, packed)
+              for chunk, start in enumerate(range(0, num_entries, DATA_CHUNK_BITS)))
+    with metrics.span('db_write'), ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk, count, payload in bounded_map(executor, generate_value_chunk, chunks, chunk_window(workers)):
+            if packed:
+                cursor.execute('INSERT INTO data_bits (chunk, count, bits) VALUES (?, ?, ?)',
+                               (chunk, count, payload))
+                metrics.count('bytes_serialized', len(payload))
+            else:
+                base = chunk * DATA_CHUNK_BITS + 1
+                cursor.executemany('INSERT INTO data (id, value) VALUES (?, ?)',
+                                   ((base + i, value) for i, value in enumerate(payload)))
+        conn.commit()
+
+
+def generate_h_chunk(seed, chunk, start, count):
+    """ 工作进程: 生成 id 为 start+1 起的 count 个 h 值 """
+    p = P
+    a = A
+    b = B
+    rng = chunk_rng(seed, chunk, stream=1)
+    rows = []
+    for i in range(start, start + count):
         while True:
-            x = random.randrange(1, p)
+            x = rng.randrange(1, p)
             y_squared = (x ** 3 + a * x + b) % p
             if is_square(y_squared, p):
                 y = pow(y_squared, (p + 1) // 4, p)
-                cursor.execute('INSERT INTO h_value (id, x, y) VALUES (?, ?, ?)', (i + 1, str(x), str(y)))
-                break  # 找到有效的点后退出循环
+                rows.append((i + 1, str(x), str(y)))
+                break
+    return rows
+
+
+def generate_h_values(conn, num_h, seed=0, workers=None):
+    """ 并行生成 num_h 个可复现的 h 值并写入 h_value 表 """
+    cursor = conn.cursor()
+    chunk_size = 1024
+    chunks = ((seed, chunk, start, min(chunk_size, num_h - start))
+              for chunk, start in enumerate(range(0, num_h, chunk_size)))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for rows in bounded_map(executor, generate_h_chunk, chunks, chunk_window(workers)):
+            cursor.executemany('INSERT INTO h_value (id, x, y) VALUES (?, ?, ?)', rows)
     conn.commit()
 
 
@@ -77,27 +190,6 @@ def fetch_data(conn):
     return data_rows, h_value_rows
 
 
-def add_points(h1, h2, a, p):
-    """ Add two points on the elliptic curve """
-    x1, y1 = h1
-    x2, y2 = h2
-
-    if h1 == h2:  # Doubling case
-        m = (3 * x1 ** 2 + a) * mod_inverse(2 * y1, p) % p
-    else:  # Addition case
-        m = (y2 - y1) * mod_inverse(x2 - x1, p) % p
-
-    x3 = (m ** 2 - x1 - x2) % p
-    y3 = (m * (x1 - x3) - y1) % p
-
-    return (x3, y3)
-
-
-def mod_inverse(k, p):
-    """ Calculate the modular inverse of k under modulo p """
-    return pow(k, p - 2, p)
-
-
 def calculate_data_table_size(conn):
     """ 计算 data 表的存储大小 """
     cursor = conn.cursor()
@@ -106,9 +198,32 @@ def calculate_data_table_size(conn):
     return total_size if total_size is not None else 0  # 如果没有数据，则返回 0
 
 
+def calculate_packed_data_size(conn):
+    """ 计算 data_bits 表中位图的存储大小 """
+    cursor = conn.cursor()
+    cursor.execute("SELECT SUM(LENGTH(bits)) FROM data_bits;")
+    total_size = cursor.fetchone()[0]
+    return total_size if total_size is not None else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate the synthetic data.db dataset")
+    parser.add_argument('size', nargs='?', type=parse_size, help="target data size, e.g. 8KiB, 64MiB, 1GiB (default: 49 entries)")
+    parser.add_argument('--entries', type=int, help="number of entries (overrides size)")
+    parser.add_argument('--domain', type=parse_domain, default=2,
+                        help="values are drawn from [0, domain), at most 2**63")
+    parser.add_argument('--seed', type=int, help="random seed; the same seed gives the same dataset")
+    parser.add_argument('--workers', type=int, help="number of generator processes")
+    parser.add_argument('--packed', action='store_true', help="store 0/1 values as bitmaps in data_bits")
+    parser.add_argument('--num-h', type=int, help="number of h values (default: one per entry)")
+    parser.add_argument('--db', default='data.db')
+    return parser.parse_args()
+
+
 # 主程序
 def main():
-    db_name = 'data.db'
+    args = parse_args()
+    db_name = args.db
 
     # 检查并删除现有的数据库文件
     if os.path.exists(db_name):
@@ -126,24 +241,43 @@ def main():
     create_tables(conn)
 
     # 插入数据  1kib = 1024 1mib = 1024*1024 1gib = 1024*1024*1024
-    # size = 1024*8
-    # bytes = 8
-    # num_entries = math.ceil(size // bytes)
-    num_entries = 49
-    insert_random_data(conn, num_entries)
-    insert_h_value(conn, num_entries)  # 将 h 值插入到 h_value 表中
-
-    # 查询并打印数据
-    data_rows, h_value_rows = fetch_data(conn)
-    print("Data from first database:", data_rows)
-    print("Data from h_value table (points):", h_value_rows)
+    # data 表每个值按 8 字节计算, 位图 (data_bits) 每个值只占 1 位
+    packed = args.packed
+    if args.entries is not None:
+        num_entries = args.entries
+    elif args.size is not None:
+        num_entries = entries_for_size(args.size, packed)
+    else:
+        num_entries = 49
+    seed = args.seed if args.seed is not None else random.getrandbits(32)
+    num_h = args.num_h if args.num_h is not None else num_entries
+    print(f"Generating {num_entries} entries (domain {args.domain}, seed {seed}, {num_h} h values)")
+    try:
+        generate_dataset(conn, num_entries, args.domain, seed, args.workers, packed)
+    except ValueError as e:
+        print(f"Error: {e}")
+        conn.close()
+        return
+    generate_h_values(conn, num_h, seed, args.workers)  # 将 h 值插入到 h_value 表中
+
+    # 查询并打印数据 (数据量较大时只打印条目数)
+    if num_entries <= 1024:
+        data_rows, h_value_rows = fetch_data(conn)
+        if packed:
+            data_rows = fetch_packed_data(conn)
+        print("Data from first database:", data_rows)
+        print("Data from h_value table (points):", h_value_rows)
 
     # 计算并打印 data 表的大小
-    data_table_size = calculate_data_table_size(conn)
+    if packed:
+        data_table_size = calculate_packed_data_size(conn)
+    else:
+        data_table_size = calculate_data_table_size(conn)
     print(f"Size of data table in bytes: {data_table_size}")
 
     # 关闭连接
     conn.close()
+    metrics.emit('dataset')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,115 @@
+import os
+import sqlite3
+import threading
+from urllib.request import pathname2url
+import metrics
+
+# 建表完成后 look_table.db 不再修改, 以 immutable 方式打开时 SQLite 不再加锁也不检查文件变化;
+# 运行期间需要重新建表时设置 EAPIR_SQLITE_IMMUTABLE=0, 只使用只读模式
+IMMUTABLE_ENV = 'EAPIR_SQLITE_IMMUTABLE'
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KB = 64 * 1024
+STATEMENT_CACHE = 64
+
+# 热点查询; 使用方必须使用这里的 SQL 文本, 才能命中每个连接中预先编译好的语句
+LOOKUP_ENTRY_SQL = 'SELECT b, b_index FROM look_table WHERE id = ?'
+BUCKET_VALUES_SQL = 'SELECT b_index, value FROM look_table WHERE b = ?'
+BUCKET_BITS_SQL = 'SELECT bits FROM bucket_bits WHERE b = ?'
+HOT_STATEMENTS = (LOOKUP_ENTRY_SQL, BUCKET_VALUES_SQL, BUCKET_BITS_SQL)
+
+
+def default_immutable():
+    return os.environ.get(IMMUTABLE_ENV, '1') != '0'
+
+
+def readonly_uri(path, immutable=True):
+    """ 只读 (可选 immutable) 的 SQLite URI """
+    uri = f'file:{pathname2url(os.path.abspath(path))}?mode=ro'
+    return uri + '&immutable=1' if immutable else uri
+
+
+def open_readonly(path, immutable=None):
+    """ 以只读方式打开数据库, 设置 mmap / 缓存 pragma, 并预先编译热点查询 """
+    if immutable is None:
+        immutable = default_immutable()
+    if not os.path.exists(path):
+        # mode=ro 时 SQLite 的报错不说明是哪个文件
+        raise sqlite3.OperationalError(f"unable to open database file: {path}")
+    conn = sqlite3.connect(readonly_uri(path, immutable), uri=True, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE)
+    conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute('PRAGMA query_only = ON')
+    for sql in HOT_STATEMENTS:
+        try:
+            conn.execute(sql, (-1,)).fetchall()  # 执行一次即进入连接的语句缓存
+        except sqlite3.OperationalError:
+            pass  # 旧数据库没有 bucket_bits 表
+    metrics.count('sqlite_connect')
+    return conn
+
+
+class ReadOnlyPool:
+    """ 只读连接池: 每个线程第一次使用时打开自己的连接, 之后一直复用 """
+
+    def __init__(self, path, immutable=None):
+        self.path = path
+        self.immutable = default_immutable() if immutable is None else immutable
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def connection(self):
+        """ 返回当前线程的连接 """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = open_readonly(self.path, self.immutable)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """ 关闭所有线程的连接 """
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+_pools = {}
+_pool_refs = {}  # 共享连接池的引用数; 同一进程中的多个角色 (如进程内运行的 DO 和 server) 共用一个池
+_pools_lock = threading.Lock()
+
+
+def get_pool(path):
+    """ 返回本进程中 path 对应的共享连接池并增加一次引用, 用完后调用一次 close_pool """
+    key = os.path.abspath(path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ReadOnlyPool(path)
+            _pools[key] = pool
+        _pool_refs[key] = _pool_refs.get(key, 0) + 1
+        return pool
+
+
+def close_pool(path):
+    """ 释放一次引用; 最后一个使用者释放时关闭并移除 path 对应的共享连接池 """
+    key = os.path.abspath(path)
+    with _pools_lock:
+        refs = _pool_refs.get(key, 0) - 1
+        if refs > 0:
+            _pool_refs[key] = refs
+            return
+        _pool_refs.pop(key, None)
+        pool = _pools.pop(key, None)
+    if pool is not None:
+        pool.close()
+
+
+def readonly_connection(path):
+    """ 当前线程对 path 的只读连接; 与 get_pool 一样增加一次引用, 用完后调用一次 close_pool """
+    return get_pool(path).connection()
\ No newline at end of file
@@ -0,0 +1,112 @@
+import metrics
+import scheduler
+from bitmap import count_set_bits, iter_bit_groups
+from ec_math import batch_add_points, batch_sum_points
+from point_array import PointArray, split_ranges
+
+# Four-Russians 方法: 把同一组点按每 group_bits 个分组, 预先算出每组全部 2^group_bits 个子集和;
+# 之后任何 0/1 向量 (桶的位图) 的 Σ bit_i·P_i 都是每组一次查表加一次点加
+MAX_GROUP_BITS = 12
+MAX_TABLE_POINTS = 1 << 20  # 子集和表的点数上限 (64 MiB 共享内存)
+# 批量点加 (共用一次批量求逆) 相对于单独一次点加 (含一次模逆) 的耗时
+BATCHED_ADD_COST = 0.1
+
+
+def subset_sum_adds(num_points, num_buckets, group_bits):
+    """ 点加次数: 建表每组 2^g - 1 - g 次 (单点的子集和不需要计算), 每个桶每组至多一次 """
+    num_groups = -(-num_points // group_bits)
+    return num_groups * ((1 << group_bits) - 1 - group_bits) + num_buckets * num_groups
+
+
+def subset_sum_cost(num_points, num_buckets, group_bits):
+    """ 建表和查表的估计耗时 (秒); 两者的点加都是批量求逆 """
+    return scheduler.estimate_cost(num_adds=subset_sum_adds(num_points, num_buckets, group_bits)) * BATCHED_ADD_COST
+
+
+def choose_group_bits(num_points, bitmaps):
+    """ 返回估计耗时最少的组大小; 逐桶累加 (每个为 1 的位一次点加) 更便宜时返回 0 """
+    best = 0
+    best_cost = scheduler.estimate_cost(num_adds=sum(count_set_bits(bits) for bits in bitmaps))
+    for group_bits in range(1, MAX_GROUP_BITS + 1):
+        if -(-num_points // group_bits) << group_bits > MAX_TABLE_POINTS:
+            break
+        cost = subset_sum_cost(num_points, len(bitmaps), group_bits)
+        if cost < best_cost:
+            best, best_cost = group_bits, cost
+    return best
+
+
+def build_group_tables(points_handle, tables_handle, group_bits, start_group, stop_group):
+    """ 工作进程: 计算 [start_group, stop_group) 各组的全部子集和, 第 g 组的表占 [g·2^bits, (g+1)·2^bits);
+    逐位扩展: 表[mask | 2^k] = 表[mask] + P_k, 同一位上所有组的点加共用一次批量求逆 """
+    points = PointArray.attach(points_handle)
+    tables = PointArray.attach(tables_handle)
+    groups = [[None] for _ in range(start_group, stop_group)]
+    for k in range(group_bits):
+        pairs = []
+        for g, table in enumerate(groups, start_group):
+            i = g * group_bits + k
+            point = points[i] if i < points.count else None
+            pairs.extend((subset, point) for subset in table)
+        sums = batch_add_points(pairs)
+        pos = 0
+        for table in groups:
+            size = len(table)
+            table.extend(sums[pos:pos + size])
+            pos += size
+    for g, table in enumerate(groups, start_group):
+        base = g << group_bits
+        for mask, point in enumerate(table):
+            if point is not None:
+                tables[base + mask] = point
+    return stop_group - start_group
+
+
+def lookup_subset_sums(tables_handle, group_bits, num_points, bitmaps):
+    """ 工作进程: 每个桶每组查一次表, 所有桶的查表结果一起树形相加, 返回各桶的和 """
+    tables = PointArray.attach(tables_handle)
+    terms = []
+    for bits in bitmaps:
+        bucket_terms = []
+        # 超出点数的位没有对应的点
+        for group, mask in iter_bit_groups(bits, group_bits, num_points):
+            point = tables[(group << group_bits) + mask]
+            if point is not None:
+                bucket_terms.append(point)
+        terms.append(bucket_terms)
+    return batch_sum_points(terms)
+
+
+class SubsetSumTables:
+    """ 同一组点 (共享内存中的 PointArray) 的分组子集和表, 放在共享内存中, 多批桶之间复用 """
+
+    def __init__(self, points, group_bits, max_workers=None):
+        self.group_bits = group_bits
+        self.num_points = points.count
+        self.num_groups = -(-points.count // group_bits)
+        self.tables = PointArray.create(self.num_groups << group_bits)
+        cost = subset_sum_cost(points.count, 0, group_bits)
+        ranges = split_ranges(self.num_groups, scheduler.plan_parts(cost, max_workers))
+        with metrics.span('subset_tables'):
+            scheduler.run_tasks(build_group_tables, [(points.handle(), self.tables.handle(), group_bits, start, stop)
+                                                     for start, stop in ranges], cost)
+
+    def sums(self, bitmaps, max_workers=None):
+        """ 返回每个位图对应的 Σ bit_i·P_i, 顺序与 bitmaps 相同 """
+        cost = scheduler.estimate_cost(num_adds=len(bitmaps) * self.num_groups) * BATCHED_ADD_COST
+        ranges = split_ranges(len(bitmaps), scheduler.plan_parts(cost, max_workers))
+        parts = scheduler.run_tasks(lookup_subset_sums, [(self.tables.handle(), self.group_bits, self.num_points,
+                                                          bitmaps[start:stop]) for start, stop in ranges], cost)
+        return [total for part in parts for total in part]
+
+    def close(self):
+        self.tables.close()
+
+
+def subset_sum_tables(points, bitmaps, max_workers=None):
+    """ 为这一批位图建立 points 的子集和表; 逐桶累加更便宜时返回 None """
+    group_bits = choose_group_bits(points.count, bitmaps)
+    if not group_bits:
+        return None
+    metrics.count('subset_sum_tables')
+    return SubsetSumTables(points, group_bits, max_workers)
\ No newline at end of file
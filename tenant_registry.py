@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+import metrics
+from flat_table import close_flat_table
+from index_token import load_cipher
+from sqlite_pool import CACHE_SIZE_KB, ReadOnlyPool
+
+# 所有已加载 look table 的内存预算 (mmap 的平面文件 + SQLite 页缓存), 超出时卸载最久未使用的表
+BUDGET_ENV = 'EAPIR_TENANT_MEMORY_MB'
+DEFAULT_BUDGET_MB = 512
+DEFAULT_TABLE = 'default'  # 查询没有带 look table 名称时使用
+
+# 一个 look table 的文件: SQLite 数据库, 平面文件, 解密桶号的密钥
+TableSpec = namedtuple('TableSpec', ['name', 'db', 'flat', 'key'])
+
+
+def table_spec(name, db, flat=None, key=None):
+    """ 平面文件和密钥默认与数据库放在同一目录下 (look_table.flat, key_bucket) """
+    directory = os.path.dirname(db)
+    if flat is None:
+        flat = os.path.join(directory, 'look_table.flat')
+    if key is None:
+        key = os.path.join(directory, 'key_bucket')
+    return TableSpec(name, db, flat, key)
+
+
+def load_registry_file(path):
+    """ 读取 {"名称": {"db": ..., "flat": ..., "key": ...}} 格式的配置, 相对路径相对于配置文件所在目录 """
+    with open(path, 'r', encoding='utf-8') as registry_file:
+        tables = json.load(registry_file)
+    base = os.path.dirname(os.path.abspath(path))
+    specs = []
+    for name, entry in tables.items():
+        if isinstance(entry, str):
+            entry = {'db': entry}
+        files = {field: os.path.join(base, entry[field]) for field in ('db', 'flat', 'key') if entry.get(field)}
+        specs.append(table_spec(name, **files))
+    return specs
+
+
+def estimate_footprint(spec):
+    """ 估计一个已加载 look table 的常驻内存: 有平面文件时为文件大小, 否则为 SQLite 页缓存上限 """
+    if os.path.exists(spec.flat):
+        return os.path.getsize(spec.flat)
+    return min(os.path.getsize(spec.db), CACHE_SIZE_KB * 1024)
+
+
+class Tenant:
+    """ 已加载的 look table: 只读连接池, 桶号密钥和常驻内存估计 """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.name = spec.name
+        self.flat_path = spec.flat
+        self.cipher_suite = load_cipher(spec.key)
+        self.pool = ReadOnlyPool(spec.db)
+        self.nbytes = estimate_footprint(spec)
+        self.users = 0  # 正在处理的查询数, 大于 0 时不会被卸载
+
+    def close(self):
+        self.pool.close()
+        close_flat_table(self.flat_path)
+
+
+class TenantRegistry:
+    """ 按名称登记多个 look table, 第一次查询时加载, 超出内存预算时卸载最久未使用且空闲的表 """
+
+    def __init__(self, specs=(), budget_bytes=None, cache=None):
+        if budget_bytes is None:
+            budget_bytes = int(float(os.environ.get(BUDGET_ENV, DEFAULT_BUDGET_MB)) * 1024 * 1024)
+        self.budget_bytes = budget_bytes
+        self.cache = cache  # 共享的桶缓存, 卸载时一并删除该表的桶
+        self.nbytes = 0
+        self.loads = 0
+        self.evictions = 0
+        self._specs = {}
+        self._loaded = OrderedDict()  # 名称 -> Tenant, 按最近使用排序
+        self._lock = threading.Lock()
+        for spec in specs:
+            self.register(spec)
+
+    def register(self, spec):
+        """ 登记 (或替换) 一个 look table; 替换时卸载旧的 """
+        with self._lock:
+            self._specs[spec.name] = spec
+            old = self._loaded.get(spec.name)
+            if old is not None and old.users == 0:
+                self._unload(old)
+
+    def names(self):
+        return list(self._specs)
+
+    def acquire(self, name):
+        """ 返回已加载的 look table 并标记为使用中, 用完后调用 release """
+        with self._lock:
+            tenant = self._loaded.get(name)
+            if tenant is None:
+                spec = self._specs.get(name)
+                if spec is None:
+                    raise KeyError(f"Unknown look table: {name}")
+                with metrics.span('tenant_load'):
+                    tenant = Tenant(spec)
+                self._loaded[name] = tenant
+                self.nbytes += tenant.nbytes
+                self.loads += 1
+                metrics.count('tenant_load')
+            else:
+                self._loaded.move_to_end(name)
+            tenant.users += 1
+            self._evict_over_budget()
+            return tenant
+
+    def release(self, tenant):
+        with self._lock:
+            tenant.users -= 1
+            self._evict_over_budget()
+
+    @contextmanager
+    def use(self, name):
+        tenant = self.acquire(name)
+        try:
+            yield tenant
+        finally:
+            self.release(tenant)
+
+    def _evict_over_budget(self):
+        # 从最久未使用的表开始卸载空闲的表; 使用中的表即使超出预算也保留
+        for name in list(self._loaded):
+            if self.nbytes <= self.budget_bytes:
+                break
+            tenant = self._loaded[name]
+            if tenant.users == 0:
+                self._unload(tenant)
+                self.evictions += 1
+                metrics.count('tenant_eviction')
+
+    def _unload(self, tenant):
+        del self._loaded[tenant.name]
+        self.nbytes -= tenant.nbytes
+        tenant.close()
+        if self.cache is not None:
+            self.cache.discard(lambda key: key[0] == tenant.flat_path)
+
+    def close(self):
+        with self._lock:
+            for tenant in list(self._loaded.values()):
+                self._unload(tenant)
+
+    def stats(self):
+        return {
+            'tables': len(self._specs),
+            'loaded': list(self._loaded),
+            'budget_bytes': self.budget_bytes,
+            'bytes': self.nbytes,
+            'loads': self.loads,
+            'evictions': self.evictions,
+        }
\ No newline at end of file
@@ -0,0 +1,66 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# 各角色都是仓库顶层的模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+
+import client_me
+import compact_buckets
+import database_test
+import DO
+import server_me
+from flat_table import close_flat_table
+
+FIXED_HASH_KEY = b'eapir-test-key!!'
+
+
+def write_keys(directory):
+    """ 写入 client-DO 和 DO-server 两个密钥文件 (与 RSA.py 生成的格式相同) """
+    for name in ('key', 'key_bucket'):
+        with open(os.path.join(directory, name), 'wb') as key_file:
+            key_file.write(Fernet.generate_key())
+
+
+def write_data(directory, values):
+    """ 写入 data.db, 第 i 个值的 id 为 i + 1 """
+    conn = sqlite3.connect(os.path.join(directory, 'data.db'))
+    conn.execute('CREATE TABLE data (id INTEGER PRIMARY KEY AUTOINCREMENT, value INTEGER)')
+    conn.executemany('INSERT INTO data (id, value) VALUES (?, ?)', enumerate(values, 1))
+    conn.commit()
+    conn.close()
+
+
+def build_look_table(directory, values):
+    """ 在 directory 中运行 setup; r 使用 DO 的常数 r, 分桶使用固定的哈希密钥, 结果可复现 """
+    write_keys(directory)
+    write_data(directory, values)
+    old_cwd = os.getcwd()
+    mp = pytest.MonkeyPatch()
+    try:
+        os.chdir(directory)
+        mp.setattr(database_test, 'generate_random_value', lambda: DO.R_VALUE)
+        mp.setattr(database_test, 'partition_entries',
+                   lambda ids, entry_values, num_buckets: compact_buckets.partition_entries(
+                       ids, entry_values, num_buckets, key=FIXED_HASH_KEY))
+        database_test.main()
+    finally:
+        mp.undo()
+        os.chdir(old_cwd)
+
+
+@pytest.fixture
+def role_env(monkeypatch):
+    """ 各角色在测试中不使用进程级的桶缓存, 也不在后台补充令牌池 / t 值池 (测试固定了 m);
+    结束后关闭按相对路径缓存的平面文件 """
+    monkeypatch.setattr(client_me, 'refill_in_background', lambda target, pool_name=None: None)
+    monkeypatch.setattr(DO, 'refill_in_background', lambda target, pool_name=None: None)
+    monkeypatch.setattr(server_me, '_bucket_cache', None)
+    monkeypatch.setattr(server_me, '_bucket_cache_loaded', True)
+    monkeypatch.delenv('EAPIR_METRICS', raising=False)
+    yield
+    close_flat_table('look_table.flat')
\ No newline at end of file
@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from conftest import build_look_table
+from curve_params import G
+from ec_math import add_points, scalar_multiply
+from point_array import PointArray
+from sqlite_pool import open_readonly
+import server_me
+
+NUM_BUCKETS = 13
+VALUES = [random.Random(7).getrandbits(1) for _ in range(100)]
+
+
+@pytest.fixture(scope='module')
+def look_table_dir(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('aggregation')
+    build_look_table(str(directory), VALUES)
+    return directory
+
+
+def random_vector(rng, count):
+    return [scalar_multiply(rng.randrange(1, 2 ** 32), G) for _ in range(count)]
+
+
+def naive_totals(conn, nums, vectors):
+    """ Σ value·Q_{b_index}, 直接由 look_table 的行计算 """
+    totals = []
+    for num, vector in zip(nums, vectors):
+        total = None
+        for b_index, value in conn.execute('SELECT b_index, value FROM look_table WHERE b = ?', (num,)):
+            if value:
+                total = add_points(total, scalar_multiply(value, vector[b_index - 1]))
+        totals.append(total)
+    return totals
+
+
+@pytest.mark.parametrize('storage', ['flat', 'sqlite'])
+def test_aggregate_query_bucket_matches_naive_sum(look_table_dir, monkeypatch, role_env, storage):
+    monkeypatch.chdir(look_table_dir)
+    flat_table_name = 'look_table.flat' if storage == 'flat' else 'missing.flat'
+    conn = open_readonly('look_table.db')
+    count = conn.execute('SELECT COUNT(*) FROM h_value').fetchone()[0]
+    rng = random.Random(11)
+    # 每个桶使用自己的 query 点, 与批量查询中各桶单独重随机化的 query 块相同
+    nums = list(range(NUM_BUCKETS))
+    vectors = [random_vector(rng, count) for _ in nums]
+    totals = []
+    try:
+        for num, vector in zip(nums, vectors):
+            query_points = PointArray.from_points(vector)
+            try:
+                totals.append(server_me.aggregate_query_bucket(num, query_points, conn, flat_table_name, 2))
+            finally:
+                query_points.close()
+        assert totals == naive_totals(conn, nums, vectors)
+    finally:
+        conn.close()
\ No newline at end of file
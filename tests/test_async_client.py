@@ -0,0 +1,42 @@
+import asyncio
+import threading
+
+import pytest
+
+from conftest import build_look_table
+import async_client
+import DO
+import server_me
+import transport
+
+# 64 个值, 只有 id 2 和 33 为 0
+VALUES = [0 if i in (2, 33) else 1 for i in range(1, 65)]
+INDICES = [1, 2, 33, 64, 5]
+
+
+@pytest.fixture(scope='module')
+def look_table_dir(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('async_client')
+    build_look_table(str(directory), VALUES)
+    return directory
+
+
+def test_queries_in_flight_verify_against_data(look_table_dir, monkeypatch, role_env):
+    # DO 和 server 在线程中监听默认的本地 socket 地址 (当前目录下的 socket 文件)
+    monkeypatch.chdir(look_table_dir)
+    mailboxes = [transport.listen('do'), transport.listen('server')]
+    routers = [transport.Router(), transport.Router()]
+    threads = [threading.Thread(target=module.serve, args=(mailbox, router, 'look_table.db'), daemon=True)
+               for module, mailbox, router in zip((DO, server_me), mailboxes, routers)]
+    for thread in threads:
+        thread.start()
+    try:
+        results = asyncio.run(async_client.run_queries(INDICES, max_in_flight=2, timeout=60))
+    finally:
+        for mailbox in mailboxes:
+            mailbox.close()
+        for thread in threads:
+            thread.join()
+        for router in routers:
+            router.close()
+    assert results == [VALUES[i - 1] for i in INDICES]
\ No newline at end of file
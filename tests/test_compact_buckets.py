@@ -0,0 +1,58 @@
+import hashlib
+import random
+from array import array
+
+import pytest
+
+import scheduler
+from compact_buckets import partition_entries
+
+KEY = b'0123456789abcdef'
+
+
+def home_bucket(index, num_buckets):
+    digest = hashlib.blake2b(index.to_bytes(8, 'little', signed=True), digest_size=8, key=KEY).digest()
+    return int.from_bytes(digest, 'little') % num_buckets
+
+
+def naive_partition(ids, values, num_buckets):
+    """ 逐个条目线性探测 (原来的 distribute_entries) """
+    capacity = len(ids) // num_buckets + 1
+    buckets = [[] for _ in range(num_buckets)]
+    for index, value in zip(ids, values):
+        b = home_bucket(index, num_buckets)
+        while len(buckets[b]) >= capacity:
+            b = (b + 1) % num_buckets
+        buckets[b].append((index, value))
+    return buckets
+
+
+@pytest.mark.parametrize('count, num_buckets, parts', [(1000, 13, 1), (1000, 13, 4), (97, 7, 3), (5, 13, 2)])
+def test_partition_matches_linear_probing(monkeypatch, count, num_buckets, parts):
+    monkeypatch.setattr(scheduler, 'plan_parts', lambda cost, limit=None: parts)
+    rng = random.Random(count)
+    ids = array('q', rng.sample(range(1, 10 * count), count))
+    values = array('q', [rng.randrange(0, 4) for _ in range(count)])
+    buckets = partition_entries(ids, values, num_buckets, key=KEY)
+    expected = naive_partition(ids, values, num_buckets)
+
+    # 每个桶的条目数与逐个探测的结果相同, 每个条目恰好出现一次
+    assert list(buckets.fill) == [len(bucket) for bucket in expected]
+    placed = {}
+    for b in range(num_buckets):
+        bucket_ids, bucket_values = buckets.bucket(b)
+        for index, value in zip(bucket_ids, bucket_values):
+            placed[index] = (b, value)
+    assert sorted(placed) == sorted(ids)
+    assert all(placed[index][1] == value for index, value in zip(ids, values))
+    # 每个条目都在从初始桶开始探测能到达的位置: 中间经过的桶都已满
+    for index, (b, _) in placed.items():
+        probe = home_bucket(index, num_buckets)
+        while probe != b:
+            assert buckets.fill[probe] == buckets.capacity
+            probe = (probe + 1) % num_buckets
+    # rows() 按桶产生连续的 b_index
+    rows = list(buckets.rows())
+    assert len(rows) == count
+    assert [(b, b_index) for b, b_index, _, _ in rows] == [(b, i) for b in range(num_buckets)
+                                                           for i in range(1, buckets.fill[b] + 1)]
\ No newline at end of file
@@ -0,0 +1,32 @@
+import random
+
+from curve_params import G
+from ec_math import add_points, scalar_multiply
+from digest_engine import bucket_digest, update_digest
+
+
+def test_bucket_digest_matches_definition():
+    rng = random.Random(9)
+    h_points = [scalar_multiply(rng.randrange(1, 2 ** 32), G) for _ in range(5)]
+    r = rng.randrange(1, 2 ** 256)
+    # 条目数多于 h 值时第 j 个条目使用第 j % len(h) 个 h 值
+    values = [0, 1, 3, 0, 1, 2, 1]
+    expected = None
+    for j, value in enumerate(values):
+        if value:
+            expected = add_points(expected, scalar_multiply(value, scalar_multiply(r, h_points[j % len(h_points)])))
+    assert bucket_digest(values, h_points, r) == expected
+    assert bucket_digest([0, 0], h_points, r) is None
+
+
+def test_update_digest_matches_extended_bucket():
+    rng = random.Random(11)
+    h_points = [scalar_multiply(rng.randrange(1, 2 ** 32), G) for _ in range(3)]
+    r = rng.randrange(1, 2 ** 256)
+    values = []
+    digest = bucket_digest(values, h_points, r)
+    # 从空桶开始逐个追加条目, 每一步都与整个桶重新计算的摘要相同
+    for value in [0, 2, 1, 0, 5]:
+        digest = update_digest(digest, r, value, h_points[len(values) % len(h_points)])
+        values.append(value)
+        assert digest == bucket_digest(values, h_points, r)
\ No newline at end of file
@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from curve_params import G, N, P
+from ec_math import (add_points, batch_mod_inverse, multi_scalar_multiply, multiply_pair, scalar_multiply,
+                     wnaf_digits, wnaf_multiply)
+
+SCALARS = [1, 2, 3, 15, 16, 17, 2 ** 64 + 1, N - 1, 0xdeadbeef12345678]
+
+
+@pytest.mark.parametrize('w', [2, 4, 5])
+def test_wnaf_digits_represent_scalar(w):
+    for k in SCALARS:
+        digits = wnaf_digits(k, w)
+        assert sum(d << i for i, d in enumerate(digits)) == k
+        assert all(d == 0 or (d % 2 == 1 and abs(d) < 1 << (w - 1)) for d in digits)
+        assert wnaf_multiply(digits, G, w) == scalar_multiply(k, G)
+
+
+def test_multiply_pair_matches_scalar_multiply():
+    point = scalar_multiply(7, G)
+    for k1, k2 in zip(SCALARS, reversed(SCALARS)):
+        assert multiply_pair(wnaf_digits(k1, 2), wnaf_digits(k2, 2), point) == (
+            scalar_multiply(k1, point), scalar_multiply(k2, point))
+
+
+@pytest.mark.parametrize('c', [None, 2, 7])
+def test_multi_scalar_multiply_matches_naive_sum(c):
+    rng = random.Random(5)
+    points = [scalar_multiply(rng.randrange(1, 1 << 16), G) for _ in range(8)] + [None]
+    # 64 位标量已经跨越多个窗口, 朴素计算也不至于太慢
+    scalars = [rng.randrange(1 << 64) for _ in range(6)] + [0, 1, 5]
+    expected = None
+    for k, point in zip(scalars, points):
+        if point is not None:
+            expected = add_points(expected, scalar_multiply(k, point))
+    assert multi_scalar_multiply(scalars, points, c) == expected
+
+
+def test_multi_scalar_multiply_binary_and_empty():
+    points = [G, scalar_multiply(2, G), scalar_multiply(3, G)]
+    assert multi_scalar_multiply([1, 0, 1], points) == scalar_multiply(4, G)
+    assert multi_scalar_multiply([0, 0, 0], points) is None
+
+
+def test_batch_mod_inverse():
+    values = [1, 2, 3, P - 1, 0x123456789abcdef]
+    assert batch_mod_inverse(values) == [pow(v, P - 2, P) for v in values]
+    assert batch_mod_inverse([]) == []
\ No newline at end of file
@@ -0,0 +1,67 @@
+import os
+import sys
+
+import pytest
+
+from conftest import build_look_table
+import client_me
+import con_me
+import DO
+import server_me
+import sqlite_pool
+
+# 64 个值, 只有 id 2 和 33 为 0; 固定的分桶密钥下每个桶都含有值为 1 的条目, 摘要都不为空
+VALUES = [0 if i in (2, 33) else 1 for i in range(1, 65)]
+M = 91602926915902652544035644827613154392180534334876014906674056
+
+
+@pytest.fixture(scope='module')
+def look_table_dir(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('file_mode')
+    build_look_table(str(directory), VALUES)
+    return directory
+
+
+def run_role(monkeypatch, module, *args):
+    monkeypatch.setattr(sys, 'argv', [module.__name__ + '.py', *map(str, args)])
+    module.main()
+
+
+def run_file_mode(monkeypatch, indices):
+    """ 依次运行 client / DO / server 的文件模式, 返回 con_me 对每个查询的验证结果 """
+    monkeypatch.setattr(client_me, 'generate_random_value', lambda: M)
+    run_role(monkeypatch, client_me, *indices)
+    run_role(monkeypatch, DO)
+    run_role(monkeypatch, server_me)
+    # 两个角色退出时都关闭了 look_table 的连接池
+    assert os.path.abspath('look_table.db') not in sqlite_pool._pools
+    total_results = con_me.load_total_results()
+    results = con_me.load_results()
+    assert len(total_results) == len(results) == len(indices)
+    _, digests = client_me.load_startup_state('look_table.db')
+    return [con_me.verify_result(M, total, result_t, digests) for total, result_t in zip(total_results, results)]
+
+
+@pytest.mark.parametrize('storage', ['flat', 'sqlite'])
+@pytest.mark.parametrize('indices', [[1, 33], [33, 1], [2, 5, 33, 64]])
+def test_batched_indices_verify_against_data(look_table_dir, monkeypatch, role_env, storage, indices):
+    monkeypatch.chdir(look_table_dir)
+    if storage == 'sqlite':
+        os.rename('look_table.flat', 'look_table.flat.off')
+    try:
+        assert run_file_mode(monkeypatch, indices) == [VALUES[i - 1] for i in indices]
+    finally:
+        if storage == 'sqlite':
+            os.rename('look_table.flat.off', 'look_table.flat')
+
+
+def test_rerun_replaces_previous_batch(look_table_dir, monkeypatch, role_env):
+    monkeypatch.chdir(look_table_dir)
+    run_file_mode(monkeypatch, [1, 2, 3])
+    # DO 再次运行时重建 query 表并替换 do_pk 中的令牌, server 不会读到上一批的数据
+    run_role(monkeypatch, DO)
+    run_role(monkeypatch, server_me)
+    _, digests = client_me.load_startup_state('look_table.db')
+    results = [con_me.verify_result(M, total, result_t, digests)
+               for total, result_t in zip(con_me.load_total_results(), con_me.load_results())]
+    assert results == [1, 0, 1]
\ No newline at end of file
@@ -0,0 +1,50 @@
+import pytest
+from cryptography.fernet import Fernet
+
+from index_token import TOKEN_OVERHEAD, IndexCipher, get_cipher
+
+
+@pytest.fixture
+def cipher():
+    return IndexCipher(Fernet.generate_key())
+
+
+def test_round_trip_batch(cipher):
+    values = [0, 1, 33, 2 ** 64 - 1]
+    token = cipher.encrypt(values)
+    assert len(token) == TOKEN_OVERHEAD + 8 * len(values)
+    assert cipher.decrypt(token) == values
+
+
+def test_nonce_differs_per_token(cipher):
+    assert cipher.encrypt([7]) != cipher.encrypt([7])
+
+
+def test_decrypt_one(cipher):
+    assert cipher.decrypt_one(cipher.encrypt([5])) == 5
+    with pytest.raises(ValueError):
+        cipher.decrypt_one(cipher.encrypt([5, 6]))
+
+
+@pytest.mark.parametrize('position', [0, 1, 13, -1])
+def test_tampered_token_is_rejected(cipher, position):
+    token = bytearray(cipher.encrypt([1, 2]))
+    token[position] ^= 1
+    with pytest.raises(ValueError):
+        cipher.decrypt(token)
+
+
+def test_wrong_key_and_bad_length_are_rejected(cipher):
+    token = cipher.encrypt([3])
+    with pytest.raises(ValueError):
+        IndexCipher(Fernet.generate_key()).decrypt(token)
+    with pytest.raises(ValueError):
+        cipher.decrypt(token[:-1])
+
+
+def test_get_cipher_is_cached_per_key_file(tmp_path):
+    key_path = tmp_path / 'key'
+    key_path.write_bytes(Fernet.generate_key())
+    cipher = get_cipher(str(key_path))
+    assert get_cipher(str(key_path)) is cipher
+    assert cipher.decrypt(cipher.encrypt([9])) == [9]
\ No newline at end of file
@@ -0,0 +1,48 @@
+import os
+import time
+
+import pytest
+
+from conftest import build_look_table
+import loadgen
+
+
+class SlowDriver:
+    """ 每个查询固定处理 delay 秒 """
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def run(self, query_id, index):
+        time.sleep(self.delay)
+        return index, {'total': self.delay}
+
+
+def test_latency_includes_queueing_behind_busy_workers():
+    # 四个查询同时到达, 只有一个并发: 最后一个排队约 3 个处理时间
+    delay = 0.05
+    latencies, completed, errors, _, _ = loadgen.run_load(SlowDriver(delay), [(0.0, i) for i in range(4)], 1)
+    assert (completed, errors) == (4, 0)
+    queue = sorted(latencies['queue'])
+    end_to_end = sorted(latencies['end_to_end'])
+    assert queue[0] < delay / 2 and queue[-1] >= 2.5 * delay
+    assert end_to_end[-1] >= 3.5 * delay
+    assert max(latencies['total']) == delay
+
+
+def test_in_process_driver_uses_its_own_pools(tmp_path, monkeypatch, role_env):
+    # 与文件模式测试相同的数据: 每个桶都有值为 1 的条目, 摘要都不为空
+    build_look_table(str(tmp_path), [0 if i in (2, 33) else 1 for i in range(1, 65)])
+    monkeypatch.chdir(tmp_path)
+    driver = loadgen.InProcessDriver(max_workers=1)
+    pools = driver.pools
+    try:
+        driver.prefill(2)
+        latencies, completed, errors, _, results = loadgen.run_load(driver, [(0.0, 1), (0.0, 2), (0.0, 3)])
+    finally:
+        driver.close()
+    assert (completed, errors) == (3, 0)
+    assert sorted((result['index'], result['x']) for result in results) == [(1, 1), (2, 0), (3, 1)]
+    # 正式的令牌池和 t 值池都没有被使用, 临时池在关闭时删除
+    assert not os.path.exists('query_tokens.bin') and not os.path.exists('t_pool.bin')
+    assert not os.path.exists(pools.token_pool) and not os.path.exists(pools.t_pool)
\ No newline at end of file
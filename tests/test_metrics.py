@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def enabled_metrics(tmp_path):
+    path = tmp_path / 'metrics.out'
+    metrics.reset()
+    metrics.enable('json', str(path))
+    yield path
+    metrics.disable()
+    metrics.reset()
+
+
+def test_disabled_metrics_record_nothing():
+    metrics.disable()
+    metrics.reset()
+    metrics.count('point_add')
+    with metrics.span('lookup'):
+        pass
+    assert metrics.snapshot() == ({}, {})
+
+
+def test_counters_and_spans_accumulate(enabled_metrics):
+    metrics.count('point_add')
+    metrics.count('point_add', 2)
+    for _ in range(3):
+        with metrics.span('lookup'):
+            pass
+    counters, spans = metrics.snapshot()
+    assert counters == {'point_add': 3}
+    n, total, longest = spans['lookup']
+    assert n == 3 and 0 <= longest <= total
+
+
+def test_merge_adds_results_from_other_processes(enabled_metrics):
+    metrics.count('field_inversion', 2)
+    with metrics.span('decode'):
+        pass
+    metrics.merge({'field_inversion': 3, 'point_double': 1}, {'decode': [2, 1.0, 0.75]})
+    counters, spans = metrics.snapshot()
+    assert counters == {'field_inversion': 5, 'point_double': 1}
+    assert spans['decode'][0] == 3
+    assert spans['decode'][2] == 0.75
+
+
+def test_emit_writes_json_lines(enabled_metrics):
+    metrics.count('sql_rows_read', 4)
+    with metrics.span('lookup'):
+        pass
+    metrics.emit('server')
+    records = [json.loads(line) for line in enabled_metrics.read_text().splitlines()]
+    assert {(r['role'], r['type'], r['name']) for r in records} == {('server', 'span', 'lookup'),
+                                                                   ('server', 'counter', 'sql_rows_read')}
+
+
+def test_prometheus_format(enabled_metrics):
+    metrics.count('point_add', 7)
+    text = metrics.format_prometheus('client')
+    assert 'eapir_ops_total{role="client",op="point_add"} 7' in text
+    with pytest.raises(ValueError):
+        metrics.enable('csv')
\ No newline at end of file
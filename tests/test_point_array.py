@@ -0,0 +1,45 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from curve_params import G
+from ec_math import scalar_multiply
+from point_array import PointArray, split_ranges
+POINTS = [G, None, scalar_multiply(2, G), scalar_multiply(12345, G)]
+
+
+def read_range(handle, start, stop):
+    """ 工作进程: 按 handle 打开共享内存中的点数组并解码一段 """
+    return PointArray.attach(handle).points(start, stop)
+
+
+@pytest.mark.parametrize('shared', [True, False])
+def test_round_trip(shared):
+    array = PointArray.from_points(POINTS, shared)
+    try:
+        assert len(array) == len(POINTS)
+        assert list(array) == POINTS
+        assert array[-1] == POINTS[-1]
+        assert array.points(1, 3) == POINTS[1:3]
+        assert PointArray.from_buffer(array.tobytes()).points() == POINTS
+        with pytest.raises(IndexError):
+            array[len(POINTS)]
+    finally:
+        array.close()
+
+
+def test_workers_read_shared_points():
+    array = PointArray.from_points(POINTS)
+    try:
+        ranges = split_ranges(len(array), 3)
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            parts = executor.map(read_range, *zip(*[(array.handle(), start, stop) for start, stop in ranges]))
+            assert [point for part in parts for point in part] == POINTS
+    finally:
+        array.close()
+
+
+def test_split_ranges_covers_every_index():
+    assert split_ranges(10, 3) == [(0, 4), (4, 7), (7, 10)]
+    assert split_ranges(2, 5) == [(0, 1), (1, 2)]
+    assert split_ranges(0, 4) == []
\ No newline at end of file
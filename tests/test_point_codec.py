@@ -0,0 +1,43 @@
+import pytest
+
+from curve_params import G, N, P
+from ec_math import negate_point, scalar_multiply
+import point_codec
+
+# 覆盖 y 为奇数和偶数的点 (G 与 -G 的 y 奇偶性相反)
+POINTS = [G, negate_point(G), scalar_multiply(2, G), scalar_multiply(N - 1, G), scalar_multiply(123456789, G)]
+
+
+def test_scalar_round_trip():
+    for k in (0, 1, N - 1, P - 1):
+        data = point_codec.encode_scalar(k)
+        assert len(data) == point_codec.SCALAR_SIZE
+        assert point_codec.decode_scalar(b'xx' + data, 2) == k
+
+
+@pytest.mark.parametrize('point', POINTS + [None])
+def test_point_round_trip(point):
+    data = point_codec.encode_point(point)
+    assert len(data) == point_codec.POINT_SIZE
+    assert point_codec.decode_point(b'x' + data, 1) == point
+
+    compressed = point_codec.compress_point(point)
+    assert len(compressed) == point_codec.COMPRESSED_POINT_SIZE
+    assert point_codec.decompress_point(b'x' + compressed, 1) == point
+
+
+def test_points_round_trip():
+    points = POINTS + [None, G]
+    data = point_codec.encode_points(points)
+    assert len(data) == len(points) * point_codec.POINT_SIZE
+    assert point_codec.decode_points(data) == points
+    assert point_codec.decode_points(data, 2) == points[:2]
+
+
+def test_decompress_rejects_invalid_input():
+    compressed = point_codec.compress_point(G)
+    with pytest.raises(ValueError):
+        point_codec.decompress_point(b'\x04' + compressed[1:])
+    # x = 5 时 x^3 + 7 不是模 p 的二次剩余, 不在曲线上
+    with pytest.raises(ValueError):
+        point_codec.decompress_point(b'\x02' + (5).to_bytes(32, 'big'))
\ No newline at end of file
@@ -0,0 +1,104 @@
+import random
+
+from curve_params import A, G, P
+from ec_math import scalar_multiply, wnaf_digits
+from record_pool import RecordPool
+import record_pool
+import client_me
+import DO
+
+
+def test_pop_is_last_in_first_out(tmp_path):
+    pool = RecordPool(str(tmp_path / 'pool.bin'), b'HDR1', 4)
+    assert pool.pop() == (None, None)
+    for i in range(3):
+        pool.append(i.to_bytes(4, 'big'))
+    assert pool.count() == 3
+    assert pool.pop() == ((2).to_bytes(4, 'big'), 2)
+    assert pool.count() == 2
+
+
+def test_header_change_discards_records(tmp_path):
+    path = str(tmp_path / 'pool.bin')
+    RecordPool(path, b'HDR1', 4).refill(5, lambda: b'abcd')
+    assert RecordPool(path, b'HDR1', 4).count() == 5
+    assert RecordPool(path, b'HDR2', 4).count() == 0
+    assert RecordPool(path, b'HDR2', 4).pop() == (None, 0)
+
+
+def test_t_value_pool_round_trip(tmp_path):
+    path = str(tmp_path / 't_pool.bin')
+    assert DO.refill_t_pool(path, 4) == 4
+    assert DO.refill_t_pool(path, 4) == 0
+    (t, digits), remaining = DO.pop_t_value(path)
+    assert remaining == 3 and DO.count_t_values(path) == 3
+    naf = wnaf_digits(t, 2)
+    assert list(digits) == list(naf) + [0] * (DO.T_NAF_LENGTH - len(naf))
+
+
+def test_query_token_pool_round_trip(tmp_path):
+    path = str(tmp_path / 'query_tokens.bin')
+    rng = random.Random(4)
+    h_points = [scalar_multiply(rng.randrange(1, 2 ** 32), G) for _ in range(3)]
+    assert client_me.refill_query_token_pool(path, h_points, 2, A, P) == 2
+    (m, h_m_points), remaining = client_me.pop_query_token(path, h_points)
+    assert remaining == 1
+    assert h_m_points == [scalar_multiply(m, h) for h in h_points]
+    # look_table 重建 (h 值不同) 后旧令牌作废
+    assert client_me.count_query_tokens(path, h_points[:2]) == 0
+
+
+class FakeProcess:
+    def __init__(self, argv, **kwargs):
+        self.argv = argv
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+
+def test_one_background_refill_per_pool(tmp_path, monkeypatch):
+    started = []
+    monkeypatch.setattr(record_pool.subprocess, 'Popen',
+                        lambda argv, **kwargs: started.append(argv) or FakeProcess(argv))
+    monkeypatch.setattr(record_pool, '_refills', {})
+    path = str(tmp_path / 't_pool.bin')
+    first = DO.refill_in_background(8, path)
+    assert DO.refill_in_background(8, path) is first
+    assert len(started) == 1 and started[0][2:] == ['refill', '8', path]
+    # 另一个池有自己的补充进程; 补充进程结束后可以再次启动
+    DO.refill_in_background(8, str(tmp_path / 'other.bin'))
+    first.returncode = 0
+    assert DO.refill_in_background(8, path) is not first
+    assert len(started) == 3
+
+
+def test_take_t_value_refills_missing_pool(tmp_path, monkeypatch):
+    requested = []
+    monkeypatch.setattr(DO, 'refill_in_background', lambda target, pool_name: requested.append(pool_name))
+    path = str(tmp_path / 't_pool.bin')
+    t, digits = DO.take_t_value(path)
+    assert list(digits) == list(wnaf_digits(t, 2))
+    assert requested == [path]
+    # 池中 t 值足够时不再补充
+    DO.refill_t_pool(path, DO.T_POOL_LOW_WATERMARK + 2)
+    DO.take_t_value(path)
+    assert requested == [path]
+
+
+def test_background_refill_creates_pool(tmp_path):
+    path = str(tmp_path / 't_pool.bin')
+    assert DO.refill_in_background(3, path).wait(60) == 0
+    assert DO.count_t_values(path) == 3
+
+def test_take_query_token_refills_missing_pool(tmp_path, monkeypatch):
+    requested = []
+    monkeypatch.setattr(client_me, 'refill_in_background', lambda target, pool_name: requested.append(pool_name))
+    path = str(tmp_path / 'query_tokens.bin')
+    h_points = [G, scalar_multiply(2, G)]
+    assert client_me.take_query_token(path, h_points) is None
+    assert requested == [path]
+    client_me.refill_query_token_pool(path, h_points, client_me.POOL_LOW_WATERMARK + 2, A, P)
+    m, h_m_points = client_me.take_query_token(path, h_points)
+    assert h_m_points == [scalar_multiply(m, h) for h in h_points]
+    assert requested == [path]
\ No newline at end of file
@@ -0,0 +1,27 @@
+import metrics
+import scheduler
+
+
+def test_calibrate_measures_point_op_without_counting(monkeypatch):
+    monkeypatch.setattr(scheduler, 'POINT_OP_SECONDS', 1.0)
+    before = metrics.snapshot()
+    seconds = scheduler.calibrate(8)
+    assert 0 < seconds < 0.1
+    assert scheduler.POINT_OP_SECONDS == seconds
+    assert metrics.snapshot() == before
+
+
+def test_modes_follow_estimated_cost(monkeypatch):
+    monkeypatch.setattr(scheduler, 'MAX_WORKERS', 4)
+    assert scheduler.choose_mode(scheduler.INLINE_MAX_SECONDS / 2) == 'inline'
+    assert scheduler.choose_mode(scheduler.INLINE_MAX_SECONDS) == 'thread'
+    assert scheduler.choose_mode(scheduler.PROCESS_MIN_SECONDS) == 'process'
+    assert scheduler.plan_parts(scheduler.INLINE_MAX_SECONDS) == 1
+    assert scheduler.plan_parts(100.0) == 4
+    assert scheduler.plan_parts(100.0, limit=2) == 2
+
+
+def test_run_tasks_keeps_order():
+    args = [(i, i + 1) for i in range(5)]
+    for cost in (0.0, scheduler.INLINE_MAX_SECONDS):
+        assert scheduler.run_tasks(pow, args, cost) == [pow(a, b) for a, b in args]
\ No newline at end of file
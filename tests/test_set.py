@@ -0,0 +1,63 @@
+import argparse
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import set as dataset
+
+
+def generate(path, num_entries, workers, **kwargs):
+    conn = sqlite3.connect(str(path))
+    dataset.create_tables(conn)
+    dataset.generate_dataset(conn, num_entries, workers=workers, **kwargs)
+    rows = conn.execute('SELECT id, value FROM data ORDER BY id').fetchall()
+    bits = conn.execute('SELECT chunk, count, bits FROM data_bits ORDER BY chunk').fetchall()
+    packed = dataset.fetch_packed_data(conn)
+    conn.close()
+    return rows, bits, packed
+
+
+def test_output_depends_only_on_seed(tmp_path):
+    # 块数多于在途窗口, 不同的进程数得到相同的数据
+    num_entries = 5 * dataset.DATA_CHUNK_BITS + 17
+    rows, _, _ = generate(tmp_path / 'one.db', num_entries, 1, seed=3)
+    assert rows == generate(tmp_path / 'two.db', num_entries, 2, seed=3)[0]
+    assert [row[0] for row in rows] == list(range(1, num_entries + 1))
+    assert {value for _, value in rows} == {0, 1}
+    # 位图存储与行存储的值相同
+    _, _, packed = generate(tmp_path / 'packed.db', num_entries, 2, seed=3, packed=True)
+    assert packed == rows
+
+
+def test_large_domain_values_fit_in_64_bits(tmp_path):
+    rows, _, _ = generate(tmp_path / 'wide.db', 1000, 1, seed=1, domain=2 ** 63)
+    assert max(value for _, value in rows) > 2 ** 62
+    with pytest.raises(ValueError):
+        generate(tmp_path / 'too_wide.db', 10, 1, domain=2 ** 63 + 1)
+    assert dataset.parse_domain(str(2 ** 63)) == 2 ** 63
+    for text in ('0', str(2 ** 63 + 1)):
+        with pytest.raises(argparse.ArgumentTypeError):
+            dataset.parse_domain(text)
+
+
+def test_bounded_map_limits_tasks_in_flight():
+    lock = threading.Lock()
+    state = {'submitted': 0, 'returned': 0, 'most': 0}
+
+    def tasks():
+        for i in range(50):
+            with lock:
+                state['submitted'] += 1
+                state['most'] = max(state['most'], state['submitted'] - state['returned'])
+            yield (i,)
+
+    results = []
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for result in dataset.bounded_map(executor, lambda i: i * i, tasks(), 4):
+            with lock:
+                state['returned'] += 1
+            results.append(result)
+    assert sorted(results) == [i * i for i in range(50)]
+    assert state['most'] <= 5  # 窗口为 4, 生成器先产生下一个任务再等待
\ No newline at end of file
@@ -0,0 +1,115 @@
+import os
+import random
+import sqlite3
+
+import pytest
+
+from conftest import build_look_table
+from ec_math import add_points, scalar_multiply
+import database_test
+import DO
+
+
+def naive_digests(directory):
+    """ 桶摘要的定义: Σ value·(r·h_{b_index}) """
+    conn = sqlite3.connect(os.path.join(directory, 'look_table.db'))
+    h_points = [(int(x), int(y)) for x, y in conn.execute('SELECT x, y FROM h_value ORDER BY id')]
+    r_h = [scalar_multiply(DO.R_VALUE, h) for h in h_points]
+    digests = {}
+    for b, b_index, value in conn.execute('SELECT b, b_index, value FROM look_table'):
+        if value:
+            digests[b] = add_points(digests.get(b), scalar_multiply(value, r_h[b_index - 1]))
+    stored = {b: None if x is None else (int(x), int(y)) for b, x, y in conn.execute('SELECT b, x, y FROM buck_digest')}
+    conn.close()
+    return stored, digests
+
+
+@pytest.mark.parametrize('binary', [True, False])
+def test_digests_match_definition(tmp_path, monkeypatch, binary):
+    rng = random.Random(5)
+    values = [rng.getrandbits(1) if binary else rng.randrange(0, 6) for _ in range(80)]
+    built = []
+    original = database_test.subset_sum_tables
+    monkeypatch.setattr(database_test, 'subset_sum_tables',
+                        lambda points, bitmaps: built.append(len(bitmaps)) or original(points, bitmaps))
+    build_look_table(str(tmp_path), values)
+    stored, expected = naive_digests(str(tmp_path))
+    assert len(stored) == 13
+    assert stored == {b: expected.get(b) for b in range(13)}
+    # 0/1 数据为所有桶建一次共享的子集和表, 其它数据逐桶计算
+    assert built == ([13] if binary else [])
+
+
+def test_resume_after_digests_skips_digests_and_keeps_no_r(tmp_path, monkeypatch):
+    build_look_table(str(tmp_path), [1, 0, 1, 1, 0, 1])
+    stored, _ = naive_digests(str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    r_file_name = 'look_table.db' + database_test.R_FILE_SUFFIX
+    # 模拟在导出平面文件时中断: 摘要已全部提交, 只差 flat / done 两个阶段
+    conn = sqlite3.connect('look_table.db')
+    conn.execute("DELETE FROM setup_progress WHERE stage IN ('flat', 'done')")
+    conn.commit()
+    conn.close()
+
+    def no_digests(*args):
+        raise AssertionError('digests are already complete')
+
+    monkeypatch.setattr(database_test, 'compute_digests', no_digests)
+    monkeypatch.setattr(database_test, 'fetch_lookup_table_values', no_digests)
+    monkeypatch.setattr(database_test, 'export_flat_table', lambda conn, path: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        database_test.main()
+    # r 在进入之后的阶段之前就已删除
+    assert not os.path.exists(r_file_name)
+
+    monkeypatch.undo()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database_test, 'compute_digests', no_digests)
+    database_test.main()
+    conn = sqlite3.connect('look_table.db')
+    assert database_test.load_progress(conn).get('done') == '1'
+    conn.close()
+    assert naive_digests(str(tmp_path))[0] == stored
+
+    # 已完成的数据库上遗留的 r 文件在下次运行时删除
+    with open(r_file_name, 'w') as r_file:
+        r_file.write('12345')
+    database_test.main()
+    assert not os.path.exists(r_file_name)
+
+
+def test_resume_after_interrupted_digests(tmp_path, monkeypatch):
+    rng = random.Random(7)
+    values = [rng.randrange(0, 6) for _ in range(40)]
+    monkeypatch.setattr(database_test, 'DIGEST_BATCH', 4)
+    original = database_test.digest_batch
+    batches = []
+
+    def interrupted(h_array, batch, batch_values, r):
+        if batches:
+            raise KeyboardInterrupt
+        batches.append(batch.start)
+        return original(h_array, batch, batch_values, r)
+
+    monkeypatch.setattr(database_test, 'digest_batch', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        build_look_table(str(tmp_path), values)
+    monkeypatch.chdir(tmp_path)
+    conn = sqlite3.connect('look_table.db')
+    assert database_test.load_progress(conn).get('digests') == '4'
+    h_points = conn.execute('SELECT x, y FROM h_value ORDER BY id').fetchall()
+    conn.close()
+
+    # 继续时沿用已保存的 r 和 h 值, 只计算剩下的批次
+    monkeypatch.setattr(database_test, 'generate_random_value', lambda: 1 / 0)
+    monkeypatch.setattr(database_test, 'digest_batch',
+                        lambda h_array, batch, batch_values, r: batches.append(batch.start) or original(
+                            h_array, batch, batch_values, r))
+    database_test.main()
+    assert batches == [0, 4, 8, 12]
+    conn = sqlite3.connect('look_table.db')
+    assert conn.execute('SELECT x, y FROM h_value ORDER BY id').fetchall() == h_points
+    conn.close()
+    stored, expected = naive_digests(str(tmp_path))
+    assert stored == {b: expected.get(b) for b in range(13)}
+    assert not os.path.exists('look_table.db' + database_test.R_FILE_SUFFIX)
\ No newline at end of file
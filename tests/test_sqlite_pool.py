@@ -0,0 +1,108 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from conftest import build_look_table
+from index_token import get_cipher
+import client_me
+import DO
+import server_me
+import sqlite_pool
+
+
+class ClosedMailbox:
+    """ 第一次 recv 就返回 None, 相当于信箱已关闭 """
+
+    def recv(self):
+        return None
+
+
+@pytest.fixture
+def look_table_dir(tmp_path, monkeypatch):
+    build_look_table(str(tmp_path), [1, 0, 1, 1])
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_close_pool_closes_every_thread_connection(look_table_dir):
+    pool = sqlite_pool.get_pool('look_table.db')
+    connections = [pool.connection()]
+    worker = threading.Thread(target=lambda: connections.append(pool.connection()))
+    worker.start()
+    worker.join()
+    assert connections[0] is not connections[1]
+
+    sqlite_pool.close_pool('look_table.db')
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute('SELECT 1')
+    assert sqlite_pool.get_pool('look_table.db') is not pool
+    sqlite_pool.close_pool('look_table.db')
+    sqlite_pool.close_pool('look_table.db')  # 没有连接池时什么也不做
+
+
+@pytest.mark.parametrize('module', [DO, server_me])
+def test_serve_closes_pool_on_shutdown(look_table_dir, role_env, module):
+    module.serve(ClosedMailbox(), router=None)
+    assert os.path.abspath('look_table.db') not in sqlite_pool._pools
+
+
+def test_shared_pool_stays_open_until_last_user_closes(look_table_dir):
+    # 进程内运行的 DO 和 server 各取一次同一个池, 先退出的角色不能关闭另一个角色的连接
+    do_pool = sqlite_pool.get_pool('look_table.db')
+    server_pool = sqlite_pool.get_pool('look_table.db')
+    assert do_pool is server_pool
+    conn = server_pool.connection()
+    sqlite_pool.close_pool('look_table.db')
+    assert conn.execute('SELECT COUNT(*) FROM look_table').fetchone()[0] == 4
+    sqlite_pool.close_pool('look_table.db')
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
+    assert os.path.abspath('look_table.db') not in sqlite_pool._pools
+
+
+def test_in_process_roles_answer_and_release_pool(look_table_dir, role_env):
+    router, mailbox, shutdown = client_me.start_in_process_roles('look_table.db')
+    h_points, digests = client_me.load_startup_state('look_table.db')
+    cipher_suite = get_cipher('key')
+    try:
+        assert client_me.run_query(1, h_points, digests, cipher_suite, router, mailbox, timeout=60) == 1
+    finally:
+        shutdown()
+    assert os.path.abspath('look_table.db') not in sqlite_pool._pools
+
+
+@pytest.fixture
+def readonly_db(tmp_path):
+    path = str(tmp_path / 'look_table.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE look_table (id INTEGER PRIMARY KEY, b INTEGER, b_index INTEGER, value INTEGER)')
+    conn.executemany('INSERT INTO look_table VALUES (?, ?, ?, ?)', [(1, 0, 1, 5), (2, 1, 1, 7)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_each_thread_gets_its_own_read_only_connection(readonly_db):
+    pool = sqlite_pool.ReadOnlyPool(readonly_db)
+    conn = pool.connection()
+    assert pool.connection() is conn
+    others = []
+    worker = threading.Thread(target=lambda: others.append(pool.connection()))
+    worker.start()
+    worker.join()
+    assert others[0] is not conn
+    assert conn.execute(sqlite_pool.LOOKUP_ENTRY_SQL, (2,)).fetchone() == (1, 1)
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute('DELETE FROM look_table')
+    pool.close()
+    for closed in [conn] + others:
+        with pytest.raises(sqlite3.ProgrammingError):
+            closed.execute('SELECT 1')
+
+
+def test_open_readonly_names_missing_file(tmp_path):
+    with pytest.raises(sqlite3.OperationalError, match='missing.db'):
+        sqlite_pool.open_readonly(str(tmp_path / 'missing.db'))
\ No newline at end of file
@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from bitmap import iter_bit_groups, iter_set_bits, pack_bits
+from curve_params import G
+from ec_math import add_points, batch_add_points, batch_sum_points, negate_point, scalar_multiply, sum_points
+from point_array import PointArray
+from subset_sums import SubsetSumTables, choose_group_bits, subset_sum_tables
+
+
+def random_points(rng, count):
+    return [scalar_multiply(rng.randrange(1, 2 ** 32), G) for _ in range(count)]
+
+
+def naive_subset_sum(points, bits):
+    """ 逐位累加 Σ bit_i·P_i """
+    total = None
+    for i in iter_set_bits(bits):
+        if i < len(points):
+            total = add_points(total, points[i])
+    return total
+
+
+def test_batch_add_points_matches_add_points():
+    rng = random.Random(1)
+    p, q = random_points(rng, 2)
+    pairs = [(p, q), (p, p), (p, negate_point(p)), (None, q), (p, None), (None, None), (q, p)]
+    assert batch_add_points(pairs) == [add_points(h1, h2) for h1, h2 in pairs]
+
+
+def test_batch_sum_points_matches_sum_points():
+    rng = random.Random(2)
+    points = random_points(rng, 9)
+    lists = [points, points[:1], [], points[:4] + [negate_point(points[0])], [points[3], points[3]]]
+    assert batch_sum_points(lists) == [sum_points(points) for points in lists]
+
+
+@pytest.mark.parametrize('group_bits', [1, 3, 5, 8])
+def test_tables_match_naive_subset_sums(group_bits):
+    rng = random.Random(group_bits)
+    points = random_points(rng, 37)  # 不是组大小的整数倍
+    points[5] = None  # 未引用的 query 点为无穷远点
+    bitmaps = [pack_bits([rng.getrandbits(1) for _ in range(37)]) for _ in range(20)]
+    bitmaps += [pack_bits([0] * 37), pack_bits([1] * 37), pack_bits([1] * 40)]  # 超出点数的位被忽略
+    array = PointArray.from_points(points)
+    tables = SubsetSumTables(array, group_bits)
+    try:
+        assert tables.sums(bitmaps) == [naive_subset_sum(points, bits) for bits in bitmaps]
+        # 同一张表可以用于之后的各批位图
+        assert tables.sums(bitmaps[:3]) == [naive_subset_sum(points, bits) for bits in bitmaps[:3]]
+    finally:
+        tables.close()
+        array.close()
+
+
+def test_subset_sum_tables_chooses_a_group_size():
+    rng = random.Random(3)
+    points = random_points(rng, 64)
+    bitmaps = [pack_bits([rng.getrandbits(1) for _ in range(64)]) for _ in range(32)]
+    assert choose_group_bits(64, bitmaps) > 1
+    assert choose_group_bits(64, [pack_bits([0] * 64)]) == 0  # 没有为 1 的位时不需要建表
+    array = PointArray.from_points(points)
+    tables = subset_sum_tables(array, bitmaps)
+    try:
+        assert tables is not None
+        assert tables.sums(bitmaps) == [naive_subset_sum(points, bits) for bits in bitmaps]
+    finally:
+        tables.close()
+        array.close()
+
+
+@pytest.mark.parametrize('group_bits', [1, 3, 7, 12])
+def test_iter_bit_groups_matches_shifting_the_whole_bitmap(group_bits):
+    rng = random.Random(group_bits)
+    values = [rng.getrandbits(1) for _ in range(300)]
+    values[64:192] = [0] * 128  # 跨越全 0 的字
+    bits = pack_bits(values)
+    for num_bits in (300, 299, 64, 130, 1000):
+        word = int.from_bytes(bits, 'little') & ((1 << num_bits) - 1)
+        expected = []
+        group = 0
+        while word:
+            if word & ((1 << group_bits) - 1):
+                expected.append((group, word & ((1 << group_bits) - 1)))
+            word >>= group_bits
+            group += 1
+        assert list(iter_bit_groups(bits, group_bits, num_bits)) == expected
\ No newline at end of file
@@ -0,0 +1,60 @@
+import json
+import os
+import sqlite3
+
+import pytest
+from cryptography.fernet import Fernet
+
+from tenant_registry import TenantRegistry, load_registry_file, table_spec
+
+NAMES = ('a', 'b')
+
+
+@pytest.fixture
+def specs(tmp_path):
+    specs = []
+    for name in NAMES:
+        os.mkdir(tmp_path / name)
+        conn = sqlite3.connect(tmp_path / name / 'look_table.db')
+        conn.execute('CREATE TABLE look_table (b INTEGER, b_index INTEGER, value INTEGER)')
+        conn.commit()
+        conn.close()
+        with open(tmp_path / name / 'key_bucket', 'wb') as key_file:
+            key_file.write(Fernet.generate_key())
+        specs.append(table_spec(name, str(tmp_path / name / 'look_table.db')))
+    return specs
+
+
+def test_load_registry_file_resolves_relative_paths(tmp_path):
+    with open(tmp_path / 'tables.json', 'w') as registry_file:
+        json.dump({'a': 'a/look_table.db', 'b': {'db': 'b/look_table.db', 'key': 'keys/b'}}, registry_file)
+    a, b = load_registry_file(str(tmp_path / 'tables.json'))
+    assert a == table_spec('a', str(tmp_path / 'a' / 'look_table.db'))
+    assert b.flat == str(tmp_path / 'b' / 'look_table.flat')
+    assert b.key == str(tmp_path / 'keys' / 'b')
+
+
+def test_evicts_least_recently_used_idle_table(specs):
+    # 预算只够一张表常驻
+    registry = TenantRegistry(specs, budget_bytes=os.path.getsize(specs[0].db))
+    try:
+        with registry.use('a'):
+            pass
+        with registry.use('b') as tenant:
+            assert tenant.name == 'b'
+        assert registry.stats()['loaded'] == ['b']
+        assert (registry.loads, registry.evictions) == (2, 1)
+
+        # 使用中的表即使超出预算也不卸载
+        b = registry.acquire('b')
+        a = registry.acquire('a')
+        assert registry.stats()['loaded'] == ['b', 'a']
+        registry.release(a)
+        assert registry.stats()['loaded'] == ['b']
+        registry.release(b)
+
+        with pytest.raises(KeyError):
+            registry.acquire('c')
+    finally:
+        registry.close()
+    assert registry.stats()['loaded'] == [] and registry.nbytes == 0
\ No newline at end of file
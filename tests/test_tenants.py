@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from conftest import build_look_table
+from curve_params import A, P
+from ec_math import wnaf_digits
+from index_token import get_cipher
+from tenant_registry import TenantRegistry, table_spec
+import client_me
+import con_me
+import DO
+import server_me
+
+# 两张表的条目数不同, 同一个下标落在不同的桶和桶内位置, 值也相反
+TABLES = {
+    'a': [0 if i in (3, 7) else 1 for i in range(1, 41)],
+    'b': [0 if i in (4, 9, 33) else 1 for i in range(1, 65)],
+}
+INDICES = [3, 4, 7, 9, 33]
+
+
+@pytest.fixture(scope='module')
+def tables_dir(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('tenants')
+    for name, values in TABLES.items():
+        os.mkdir(directory / name)
+        build_look_table(str(directory / name), values)
+    return directory
+
+
+def registry_for(directory):
+    return TenantRegistry([table_spec(name, str(directory / name / 'look_table.db')) for name in TABLES])
+
+
+def test_do_and_server_route_each_table(tables_dir, monkeypatch, role_env):
+    # client 和 DO 之间的下标密钥由 DO 统一持有, 桶号密钥按表区分
+    monkeypatch.chdir(tables_dir / 'a')
+    cipher_suite = get_cipher('key')
+    r_wnaf = wnaf_digits(DO.R_VALUE, DO.R_WINDOW)
+    r_naf = wnaf_digits(DO.R_VALUE, 2)
+    do_registry = registry_for(tables_dir)
+    server_registry = registry_for(tables_dir)
+    try:
+        for name, values in TABLES.items():
+            h_points, digests = client_me.load_startup_state(str(tables_dir / name / 'look_table.db'))
+            results = []
+            for query_id, index in enumerate(INDICES):
+                token = client_me.generate_query_token(h_points, A, P)
+                m, message = client_me.build_query(h_points, cipher_suite, index, query_id, token, table=name)
+                server_message, do_message = DO.answer_tenant_query(message, do_registry, cipher_suite, r_wnaf, r_naf)
+                assert server_message.tokens[1] == name.encode()
+                reply = server_me.answer_tenant_query(server_message, server_registry, max_workers=1)
+                results.append(con_me.verify_result(m, reply.points[0], do_message.points[0], digests))
+            assert results == [values[index - 1] for index in INDICES]
+    finally:
+        do_registry.close()
+        server_registry.close()
+
+
+def test_single_table_do_rejects_other_tables(tables_dir, monkeypatch, role_env):
+    monkeypatch.chdir(tables_dir / 'a')
+    cipher_suite = get_cipher('key')
+    h_points, _ = client_me.load_startup_state('look_table.db')
+    _, message = client_me.build_query(h_points, cipher_suite, 3, 1, client_me.generate_query_token(h_points, A, P),
+                                       table='b')
+    conn = DO.readonly_connection('look_table.db')
+    with pytest.raises(ValueError):
+        DO.answer_query(message, conn, cipher_suite, get_cipher('key_bucket'), wnaf_digits(DO.R_VALUE, DO.R_WINDOW),
+                        wnaf_digits(DO.R_VALUE, 2), table='a')
+    DO.close_pool('look_table.db')
\ No newline at end of file
@@ -0,0 +1,68 @@
+import asyncio
+import socket
+import struct
+
+import pytest
+
+from curve_params import G
+from ec_math import scalar_multiply
+import transport
+
+MESSAGES = [
+    transport.make_message(transport.MSG_QUERY, 7, [b'token', b'table-a'], [G, scalar_multiply(3, G)]),
+    transport.make_message(transport.MSG_SERVER_QUERY, 2 ** 32 - 1, [b''], [None, G]),
+    transport.make_message(transport.MSG_SERVER_RESULT, 0),
+]
+
+
+@pytest.mark.parametrize('message', MESSAGES)
+def test_frame_round_trip(message):
+    assert transport.decode_frame(transport.encode_frame(message)) == message
+
+
+def test_decode_rejects_truncated_frame():
+    frame = transport.encode_frame(MESSAGES[0])
+    with pytest.raises(ValueError):
+        transport.decode_frame(frame[:-1])
+
+
+def test_message_table():
+    assert transport.message_table(MESSAGES[0]) == 'table-a'
+    assert transport.message_table(MESSAGES[1], 'default') == 'default'
+
+
+def test_read_frame_from_socket():
+    frames = [transport.encode_frame(message) for message in MESSAGES]
+    left, right = socket.socketpair()
+    with left, right:
+        left.sendall(b''.join(frames))
+        # 半个帧头之后对端关闭, 视为连接结束
+        left.sendall(frames[0][:3])
+        left.shutdown(socket.SHUT_WR)
+        assert [transport.read_frame(right) for _ in frames] == frames
+        assert transport.read_frame(right) is None
+
+
+def test_read_frame_rejects_oversized_frame():
+    left, right = socket.socketpair()
+    with left, right:
+        left.sendall(struct.pack('>IBI', transport.MAX_FRAME_SIZE + 1, transport.MSG_QUERY, 1))
+        with pytest.raises(ValueError):
+            transport.read_frame(right)
+
+
+def test_read_frame_async():
+    frames = [transport.encode_frame(message) for message in MESSAGES]
+
+    async def read_all():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b''.join(frames) + frames[0][:-1])
+        reader.feed_eof()
+        read = []
+        while True:
+            frame = await transport.read_frame_async(reader)
+            if frame is None:
+                return read
+            read.append(frame)
+
+    assert asyncio.run(read_all()) == frames
\ No newline at end of file
@@ -0,0 +1,57 @@
+import os
+import sqlite3
+
+import pytest
+
+from conftest import build_look_table
+from warm_snapshot import open_snapshot, snapshot_path
+
+
+@pytest.fixture
+def look_table_dir(tmp_path, monkeypatch):
+    build_look_table(str(tmp_path), [1, 0, 1, 1, 0, 2, 3, 1, 1, 0])
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def database_state():
+    conn = sqlite3.connect('look_table.db')
+    h_points = [(int(x), int(y)) for x, y in conn.execute('SELECT x, y FROM h_value ORDER BY id')]
+    digests = [None if x is None else (int(x), int(y)) for x, y in conn.execute('SELECT x, y FROM buck_digest ORDER BY b')]
+    conn.close()
+    return h_points, digests
+
+
+def test_snapshot_matches_database(look_table_dir):
+    # setup 完成时已经写好快照
+    assert os.path.exists(snapshot_path('look_table.db'))
+    snapshot = open_snapshot('look_table.db')
+    try:
+        h_points, digests = database_state()
+        assert snapshot.h_points() == h_points
+        assert snapshot.digests() == digests
+        assert [snapshot.digest(b) for b in range(len(digests))] == digests
+    finally:
+        snapshot.close()
+
+
+def test_corrupt_or_stale_snapshot_is_rebuilt(look_table_dir):
+    path = snapshot_path('look_table.db')
+    with open(path, 'r+b') as snapshot_file:
+        snapshot_file.seek(-1, os.SEEK_END)
+        last = snapshot_file.read(1)
+        snapshot_file.seek(-1, os.SEEK_END)
+        snapshot_file.write(bytes([last[0] ^ 1]))
+    snapshot = open_snapshot('look_table.db')
+    assert snapshot.digests() == database_state()[1]
+    snapshot.close()
+
+    # 数据库改动后快照的指纹不再一致
+    conn = sqlite3.connect('look_table.db')
+    conn.execute('UPDATE buck_digest SET x = NULL, y = NULL WHERE b = 0')
+    conn.commit()
+    conn.close()
+    snapshot = open_snapshot('look_table.db')
+    assert snapshot.digest(0) is None
+    assert snapshot.digests() == database_state()[1]
+    snapshot.close()
\ No newline at end of file
@@ -0,0 +1,295 @@
+import asyncio
+import os
+import queue
+import socket
+import struct
+import threading
+from collections import namedtuple
+import metrics
+from point_codec import COMPRESSED_POINT_SIZE, compress_point, decompress_point
+
+# 消息类型
+MSG_QUERY = 1          # client -> DO: tokens = [加密的查询下标, (look table 名称)], points = {m·h_i}
+MSG_SERVER_QUERY = 2   # DO -> server: tokens = [加密的桶号, (look table 名称)], points = 重随机化后的 query
+MSG_DO_RESULT = 3      # DO -> client: points = [t·h_m_b]
+MSG_SERVER_RESULT = 4  # server -> client: points = [total_result]
+
+MESSAGE_NAMES = {
+    MSG_QUERY: 'query',
+    MSG_SERVER_QUERY: 'server_query',
+    MSG_DO_RESULT: 'do_result',
+    MSG_SERVER_RESULT: 'server_result',
+}
+
+# 帧头: 帧体长度, 消息类型, 查询 id; 帧体: 令牌个数 + (长度, 令牌)*, 点个数 + 33 字节压缩点*
+_FRAME_HEADER = struct.Struct('>IBI')
+_COUNT16 = struct.Struct('>H')
+_COUNT32 = struct.Struct('>I')
+MAX_FRAME_SIZE = 1 << 30
+
+# 各角色默认的本地 socket 地址, 可用环境变量 EAPIR_<ROLE>_ADDR 覆盖 (路径或 host:port)
+DEFAULT_ADDRESSES = {
+    'client': ('eapir-client.sock', ('127.0.0.1', 47001)),
+    'do': ('eapir-do.sock', ('127.0.0.1', 47002)),
+    'server': ('eapir-server.sock', ('127.0.0.1', 47003)),
+}
+
+# 查询所针对的 look table 名称, 同一个 server 服务多个 look table 时按名称路由
+TABLE_ENV = 'EAPIR_TABLE'
+
+Message = namedtuple('Message', ['kind', 'query_id', 'tokens', 'points'])
+
+
+def make_message(kind, query_id, tokens=(), points=()):
+    return Message(kind, query_id, list(tokens), list(points))
+
+
+def message_table(message, default=None):
+    """ 查询消息中的 look table 名称 (tokens[1]), 没有时返回 default """
+    if len(message.tokens) > 1:
+        return message.tokens[1].decode()
+    return default
+
+
+def encode_frame(message):
+    """ 将消息编码为长度前缀的二进制帧 """
+    parts = [_COUNT16.pack(len(message.tokens))]
+    for token in message.tokens:
+        parts.append(_COUNT32.pack(len(token)))
+        parts.append(bytes(token))
+    parts.append(_COUNT32.pack(len(message.points)))
+    parts.extend(compress_point(point) for point in message.points)
+    body = b''.join(parts)
+    frame = _FRAME_HEADER.pack(len(body), message.kind, message.query_id) + body
+    metrics.count('bytes_serialized', len(frame))
+    return frame
+
+
+def decode_frame(frame):
+    """ 从完整的帧中解码消息 """
+    length, kind, query_id = _FRAME_HEADER.unpack_from(frame, 0)
+    if len(frame) != _FRAME_HEADER.size + length:
+        raise ValueError("Frame length does not match its header")
+    view = memoryview(frame)
+    offset = _FRAME_HEADER.size
+    (num_tokens,) = _COUNT16.unpack_from(view, offset)
+    offset += _COUNT16.size
+    tokens = []
+    for _ in range(num_tokens):
+        (size,) = _COUNT32.unpack_from(view, offset)
+        offset += _COUNT32.size
+        tokens.append(bytes(view[offset:offset + size]))
+        offset += size
+    (num_points,) = _COUNT32.unpack_from(view, offset)
+    offset += _COUNT32.size
+    points = [decompress_point(view, offset + i * COMPRESSED_POINT_SIZE) for i in range(num_points)]
+    return Message(kind, query_id, tokens, points)
+
+
+def role_address(role):
+    """ 返回角色的 socket 地址: 支持 AF_UNIX 时为文件路径, 否则为 (host, port) """
+    value = os.environ.get(f'EAPIR_{role.upper()}_ADDR')
+    if value:
+        host, sep, port = value.rpartition(':')
+        if sep and port.isdigit():
+            return (host or '127.0.0.1', int(port))
+        return value
+    path, tcp_address = DEFAULT_ADDRESSES[role]
+    return path if hasattr(socket, 'AF_UNIX') else tcp_address
+
+
+def _recv_exact(sock, size):
+    """ 从 socket 中读取 size 字节, 对端关闭时返回 None """
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def read_frame(sock):
+    """ 从 socket 中读取一个完整的帧, 连接关闭时返回 None """
+    header = _recv_exact(sock, _FRAME_HEADER.size)
+    if header is None:
+        return None
+    length = _FRAME_HEADER.unpack(header)[0]
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame too large: {length} bytes")
+    body = _recv_exact(sock, length)
+    if body is None:
+        return None
+    return header + body
+
+
+async def read_frame_async(reader):
+    """ 从 asyncio 流中读取一个完整的帧, 连接关闭时返回 None """
+    try:
+        header = await reader.readexactly(_FRAME_HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    length = _FRAME_HEADER.unpack(header)[0]
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame too large: {length} bytes")
+    try:
+        body = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        return None
+    return header + body
+
+
+async def open_connection_async(address):
+    """ asyncio 版的 SocketTransport 连接, 返回 (reader, writer) """
+    if isinstance(address, tuple):
+        return await asyncio.open_connection(*address)
+    return await asyncio.open_unix_connection(address)
+
+
+async def start_listener_async(address, on_message):
+    """ asyncio 版的 SocketListener: 每收到一条消息调用 on_message(message), 返回 asyncio 服务器 """
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                frame = await read_frame_async(reader)
+                if frame is None:
+                    break
+                on_message(decode_frame(frame))
+        finally:
+            writer.close()
+
+    if isinstance(address, tuple):
+        return await asyncio.start_server(handle, *address, reuse_address=True)
+    if os.path.exists(address):
+        os.remove(address)  # 上次运行遗留的 socket 文件
+    return await asyncio.start_unix_server(handle, address)
+
+
+class InProcessTransport:
+    """ 进程内的消息信箱, 用于测试和单进程运行; 消息同样经过帧编码 """
+
+    def __init__(self):
+        self._frames = queue.Queue()
+
+    def send(self, message):
+        self._frames.put(encode_frame(message))
+
+    def recv(self, timeout=None):
+        """ 取出一条消息, 超时抛出 queue.Empty; 信箱关闭后返回 None """
+        frame = self._frames.get(timeout=timeout)
+        return None if frame is None else decode_frame(frame)
+
+    def close(self):
+        self._frames.put(None)
+
+
+class SocketTransport:
+    """ 连接到另一个角色的本地 socket, 只负责发送帧 """
+
+    def __init__(self, address):
+        self.address = address
+        family = socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX
+        self._sock = socket.socket(family, socket.SOCK_STREAM)
+        self._sock.connect(address)
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        frame = encode_frame(message)
+        with self._lock:
+            self._sock.sendall(frame)
+
+    def close(self):
+        self._sock.close()
+
+
+class SocketListener:
+    """ 在本地 socket 上监听, 将收到的帧放入信箱, 接口与 InProcessTransport 的 recv 相同 """
+
+    def __init__(self, address):
+        self.address = address
+        if isinstance(address, tuple):
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        else:
+            if os.path.exists(address):
+                os.remove(address)  # 上次运行遗留的 socket 文件
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(address)
+        self._sock.listen()
+        self._frames = queue.Queue()
+        self._closed = False
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._read_loop, args=(conn,), daemon=True).start()
+
+    def _read_loop(self, conn):
+        with conn:
+            while True:
+                frame = read_frame(conn)
+                if frame is None:
+                    break
+                self._frames.put(frame)
+
+    def recv(self, timeout=None):
+        """ 取出一条消息, 超时抛出 queue.Empty; 监听关闭后返回 None """
+        frame = self._frames.get(timeout=timeout)
+        return None if frame is None else decode_frame(frame)
+
+    def close(self):
+        self._closed = True
+        self._sock.close()
+        if not isinstance(self.address, tuple) and os.path.exists(self.address):
+            os.remove(self.address)
+        self._frames.put(None)
+
+
+def listen(role):
+    """ 在角色的默认地址上监听 """
+    return SocketListener(role_address(role))
+
+
+def connect(role):
+    """ 连接到角色的默认地址 """
+    return SocketTransport(role_address(role))
+
+
+class Router:
+    """ 按角色名发送消息; 没有指定 transport 的角色在第一次发送时连接到其默认地址, 连接断开时重连一次 """
+
+    def __init__(self, transports=None):
+        self._transports = dict(transports or {})
+        self._opened = []
+
+    def send(self, role, message):
+        transport = self._transports.get(role)
+        if transport is None:
+            transport = self._connect(role)
+        try:
+            transport.send(message)
+        except OSError:
+            if transport not in self._opened:
+                raise
+            # 对端重启或已关闭, 重新连接后再发送一次
+            self._opened.remove(transport)
+            transport.close()
+            self._connect(role).send(message)
+
+    def _connect(self, role):
+        transport = connect(role)
+        self._transports[role] = transport
+        self._opened.append(transport)
+        return transport
+
+    def close(self):
+        """ 关闭由 Router 自己建立的连接 """
+        for transport in self._opened:
+            transport.close()
+        self._opened = []
\ No newline at end of file
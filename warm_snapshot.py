@@ -0,0 +1,148 @@
+import mmap
+import os
+import sqlite3
+import struct
+import zlib
+import metrics
+from point_codec import POINT_SIZE, decode_point, decode_points, encode_point
+from sqlite_pool import open_readonly
+
+# 角色启动时需要的 look_table.db 状态 (h 值, 桶摘要, 桶数, max_count) 的二进制快照, 放在数据库旁边;
+# 数据库变化后第一次使用时自动重建, 各角色直接 mmap, 不再从 SQLite 读取并解析十进制字符串
+SNAPSHOT_MAGIC = b'EWSN'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = '.snap'
+# 文件头: magic, 版本, 源数据库大小, 修改时间 (ns), SQLite 文件修改计数, h 值个数, 桶数, max_count, 数据区 CRC32
+_HEADER = struct.Struct('<4sHQqIIIII')
+HEADER_SIZE = 64
+_SQLITE_MAGIC = b'SQLite format 3\x00'
+_CHANGE_COUNTER = struct.Struct('>I')  # SQLite 文件头偏移 24 处, 每次写事务提交时加 1
+_CHANGE_COUNTER_OFFSET = 24
+
+
+def snapshot_path(db_path):
+    return db_path + SNAPSHOT_SUFFIX
+
+
+def source_fingerprint(db_path):
+    """ 源数据库的 (大小, 修改时间, 文件修改计数); 三者任一变化都说明快照已过期 """
+    stat = os.stat(db_path)
+    with open(db_path, 'rb') as db_file:
+        header = db_file.read(_CHANGE_COUNTER_OFFSET + _CHANGE_COUNTER.size)
+    if not header.startswith(_SQLITE_MAGIC):
+        raise ValueError(f"{db_path} is not an SQLite database")
+    (change_counter,) = _CHANGE_COUNTER.unpack_from(header, _CHANGE_COUNTER_OFFSET)
+    return stat.st_size, stat.st_mtime_ns, change_counter
+
+
+def _fetch_state(db_path):
+    """ 从数据库中读取 h 值、桶摘要和 max_count """
+    conn = open_readonly(db_path, immutable=False)
+    try:
+        h_points = [(int(x), int(y)) for x, y in conn.execute('SELECT x, y FROM h_value ORDER BY id')]
+        rows = conn.execute('SELECT b, x, y FROM buck_digest').fetchall()
+        digests = [None] * (max((b for b, _, _ in rows), default=-1) + 1)
+        for b, x, y in rows:
+            digests[b] = None if x is None else (int(x), int(y))
+        try:
+            max_count = conn.execute('SELECT MAX(fill) FROM bucket_fill').fetchone()[0]
+        except sqlite3.OperationalError:  # 没有 bucket_fill 表的旧数据库
+            max_count = conn.execute(
+                'SELECT MAX(n) FROM (SELECT COUNT(*) AS n FROM look_table GROUP BY b)').fetchone()[0]
+    finally:
+        conn.close()
+    metrics.count('sql_rows_read', len(h_points) + len(rows))
+    return h_points, digests, max_count or 0
+
+
+def build_snapshot(db_path, path=None):
+    """ 由数据库生成快照; 写入失败 (例如目录只读) 时只返回内存中的快照内容 """
+    if path is None:
+        path = snapshot_path(db_path)
+    # 先取指纹再读取: 读取期间数据库被修改时, 快照会在下次使用时被判为过期
+    fingerprint = source_fingerprint(db_path)
+    with metrics.span('snapshot_build'):
+        h_points, digests, max_count = _fetch_state(db_path)
+        body = b''.join(encode_point(point) for point in h_points + digests)
+        header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, *fingerprint, len(h_points), len(digests), max_count,
+                              zlib.crc32(body))
+        data = header.ljust(HEADER_SIZE, b'\0') + body
+    # 每个进程写自己的临时文件再原子替换, 多个角色同时重建时互不影响
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as snapshot_file:
+            snapshot_file.write(data)
+        os.replace(tmp_path, path)
+        metrics.count('bytes_serialized', len(data))
+    except OSError as e:
+        print(f"Could not write snapshot {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return data
+
+
+class Snapshot:
+    """ 只读快照: h 值和桶摘要按下标解码, 不经过 SQLite """
+
+    def __init__(self, data, path=None):
+        self.path = path
+        self._mmap = data if isinstance(data, mmap.mmap) else None
+        (magic, version, size, mtime_ns, change_counter, self.num_h, self.num_buckets, self.max_count,
+         crc) = _HEADER.unpack_from(data, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError(f"{path} is not a snapshot (version {SNAPSHOT_VERSION})")
+        self.fingerprint = (size, mtime_ns, change_counter)
+        end = HEADER_SIZE + (self.num_h + self.num_buckets) * POINT_SIZE
+        if len(data) < end:
+            raise ValueError(f"{path} is truncated")
+        with memoryview(data) as view:
+            if zlib.crc32(view[HEADER_SIZE:end]) != crc:
+                raise ValueError(f"{path} is corrupt")
+        self._view = memoryview(data)[HEADER_SIZE:end]
+
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as snapshot_file:
+            buf = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(buf, path)
+        except (ValueError, struct.error):
+            buf.close()
+            raise
+
+    def h_points(self):
+        """ 所有 h 值, 按 id 排列 """
+        return decode_points(self._view, self.num_h)
+
+    def digests(self):
+        """ 按桶号排列的桶摘要, 空桶为 None """
+        return decode_points(self._view[self.num_h * POINT_SIZE:], self.num_buckets)
+
+    def digest(self, b):
+        return decode_point(self._view, (self.num_h + b) * POINT_SIZE)
+
+    def close(self):
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+
+def open_snapshot(db_path, path=None):
+    """ 返回 db_path 的快照: 快照文件存在且与数据库的指纹一致时直接 mmap, 否则重建 """
+    if path is None:
+        path = snapshot_path(db_path)
+    if not os.path.exists(db_path):
+        raise sqlite3.OperationalError(f"unable to open database file: {db_path}")
+    fingerprint = source_fingerprint(db_path)
+    if os.path.exists(path):
+        try:
+            snapshot = Snapshot.open(path)
+        except (ValueError, struct.error, OSError) as e:
+            print(f"Rebuilding snapshot {path}: {e}")
+        else:
+            if snapshot.fingerprint == fingerprint:
+                metrics.count('snapshot_hit')
+                return snapshot
+            snapshot.close()
+    metrics.count('snapshot_rebuild')
+    return Snapshot(build_snapshot(db_path, path), path)
\ No newline at end of file